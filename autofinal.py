@@ -3,7 +3,19 @@ import subprocess
 import os
 import sys
 import hashlib
+import json
 import socket
+import argparse
+import functools
+import glob
+import re
+import shutil
+import tempfile
+import threading
+import time
+import wave
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 
@@ -120,31 +132,108 @@ def find_whisper_dir():
     return None
 
 
-def check_model_availability(model_name):
+# same layout as the manifest written by models/verify.py, which can pre-verify a models directory
+INTEGRITY_INDEX = ".integrity.json"
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def load_integrity_index(models_dir):
+    try:
+        with open(os.path.join(models_dir, INTEGRITY_INDEX), "r") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def save_integrity_index(models_dir, index):
+    path = os.path.join(models_dir, INTEGRITY_INDEX)
+    try:
+        with open(path + ".tmp", "w") as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.replace(path + ".tmp", path)
+    except Exception:
+        pass
+
+
+def file_fingerprint(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "inode": st.st_ino}
+
+
+def hash_file_sha1(path):
+    sha1 = hashlib.sha1()
+    buf = bytearray(HASH_BLOCK_SIZE)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            sha1.update(view[:n])
+    return sha1.hexdigest()
+
+
+def lookup_verified_sha1(index, model_file):
+    # the stored digest is only trusted while size, mtime and inode are unchanged
+    entry = index.get(os.path.basename(model_file))
+    if not entry:
+        return None
+    fingerprint = file_fingerprint(model_file)
+    if any(entry.get(k) != v for k, v in fingerprint.items()):
+        return None
+    return entry.get("sha1")
+
+
+def check_models_availability(model_names):
+    results = {}
     whisper_dir = find_whisper_dir()
     if not whisper_dir:
-        return False, "not downloaded"
-    model_file = os.path.join(whisper_dir, "models", f"ggml-{model_name}.bin")
-    if not os.path.exists(model_file):
-        return False, "not downloaded"
-    expected = EXPECTED_SHA.get(model_name)
-    
-    if not expected:
-        return True, "available"
-    sha1 = hashlib.sha1()
-    try:
-        with open(model_file, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                sha1.update(chunk)
-    except Exception as e:
-        return False, "not downloaded"
-    file_sha1 = sha1.hexdigest()
-    
-    
-    if file_sha1 == expected:
-        return True, "available"
-    else:
-        return False, "corrupted"
+        return {name: (False, "not downloaded") for name in model_names}
+    models_dir = os.path.join(whisper_dir, "models")
+    index = load_integrity_index(models_dir)
+
+    digests = {}
+    to_hash = []
+    for name in model_names:
+        model_file = os.path.join(models_dir, f"ggml-{name}.bin")
+        if not os.path.exists(model_file):
+            results[name] = (False, "not downloaded")
+        elif not EXPECTED_SHA.get(name):
+            results[name] = (True, "available")
+        else:
+            digests[name] = lookup_verified_sha1(index, model_file)
+            if digests[name] is None:
+                to_hash.append(name)
+
+    if to_hash:
+        def verify(name):
+            model_file = os.path.join(models_dir, f"ggml-{name}.bin")
+            fingerprint = file_fingerprint(model_file)
+            return name, fingerprint, hash_file_sha1(model_file)
+
+        with ThreadPoolExecutor(max_workers=min(len(to_hash), os.cpu_count() or 1)) as executor:
+            futures = [executor.submit(verify, name) for name in to_hash]
+            for future in as_completed(futures):
+                try:
+                    name, fingerprint, digest = future.result()
+                except Exception:
+                    continue
+                digests[name] = digest
+                index[f"ggml-{name}.bin"] = dict(fingerprint, sha1=digest)
+        save_integrity_index(models_dir, index)
+
+    for name, digest in digests.items():
+        if digest is None:
+            results[name] = (False, "not downloaded")
+        elif digest == EXPECTED_SHA[name]:
+            results[name] = (True, "available")
+        else:
+            results[name] = (False, "corrupted")
+    return results
+
+
+def check_model_availability(model_name):
+    return check_models_availability([model_name])[model_name]
 
 
 def download_model(model_name):
@@ -171,11 +260,11 @@ def download_model(model_name):
         return False
 
 
-def scan_media_files():
+def scan_media_files(directory='.'):
     media_files = []
     extensions = ('.mp3', '.mp4', '.wav')
-    color_print("\nScanning for media files in the current directory...", Color.CYAN)
-    for file in Path('.').iterdir():
+    color_print(f"\nScanning for media files in {'the current directory' if directory == '.' else directory}...", Color.CYAN)
+    for file in Path(directory).iterdir():
         if file.suffix.lower() in extensions:
             media_files.append(file.name)
     if not media_files:
@@ -197,11 +286,12 @@ def select_from_menu(title, options):
 
 
 def show_model_menu():
+    statuses = check_models_availability([model["name"] for model in MODELS.values()])
     color_print("\n=== Select Model ===", Color.MAGENTA, bold=True)
     color_print("\n=== General Models ===", Color.CYAN, bold=True)
     for key in GENERAL_KEYS:
         model = MODELS[key]
-        available, status = check_model_availability(model["name"])
+        available, status = statuses[model["name"]]
         if status == "available":
             status_disp = f"{Color.CYAN}({model['size']}, available){Color.END}"
         elif status == "not downloaded":
@@ -214,7 +304,7 @@ def show_model_menu():
     color_print("\n=== English Specific Models ===", Color.BLUE, bold=True)
     for key in ENGLISH_KEYS:
         model = MODELS[key]
-        available, status = check_model_availability(model["name"])
+        available, status = statuses[model["name"]]
         if status == "available":
             status_disp = f"{Color.CYAN}({model['size']}, available){Color.END}"
         elif status == "not downloaded":
@@ -254,7 +344,7 @@ def show_model_menu():
 
 
 def select_language(selected_model):
-    if selected_model.endswith(('.en', '.en-q5_0', '.en-q8_0')):
+    if is_english_model(selected_model):
         color_print("\nEnglish model (.en) detected, automatically selecting English", Color.GREEN)
         return "en"
     color_print("\n=== Select Language ===", Color.MAGENTA, bold=True)
@@ -268,73 +358,999 @@ def select_language(selected_model):
         color_print("Invalid number!", Color.RED)
 
 
-def convert_to_wav(input_file):
-    output_file = os.path.splitext(input_file)[0] + ".wav"
-    if Path(output_file).exists():
-        color_print(f"WAV file already exists: {output_file}", Color.YELLOW)
-        return output_file
+def convert_to_wav(input_file, quiet=False, output_file=None):
+    # with output_file the caller owns the target, it is overwritten instead of reused
+    if output_file is None:
+        output_file = os.path.splitext(input_file)[0] + ".wav"
+        if Path(output_file).exists():
+            color_print(f"WAV file already exists: {output_file}", Color.YELLOW)
+            return output_file
     cmd = [
-        "ffmpeg",
+        "ffmpeg", "-y",
         "-i", input_file,
         "-ar", "16000",
         "-ac", "1",
         "-c:a", "pcm_s16le",
         output_file
     ]
-    color_print(f"\nConverting {input_file} to WAV...", Color.CYAN)
+    if not quiet:
+        color_print(f"\nConverting {input_file} to WAV...", Color.CYAN)
     try:
         process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
         for line in process.stdout:
-            print(line.strip())
+            if not quiet:
+                print(line.strip())
         process.wait()
-        color_print("✓ Conversion successful!", Color.GREEN)
+        if process.returncode != 0:
+            color_print(f"✗ Conversion failed: {input_file}", Color.RED)
+            return None
+        if not quiet:
+            color_print("✓ Conversion successful!", Color.GREEN)
         return output_file
     except Exception as e:
         color_print(f"✗ Conversion error: {str(e)}", Color.RED)
         return None
 
 
+STDIN_MARKER = b"bytes from stdin"
+# whisper-cli reads all of stdin into memory before decoding, about 350 MB per hour of audio
+# for the WAV bytes and their float copy, so longer inputs still go through a temp WAV
+STREAM_MAX_SECONDS = 30 * 60
+
+
+def whisper_supports_stdin(whisper_bin):
+    # builds that can read "-f -" carry the stdin reader message in the binary
+    try:
+        st = os.stat(whisper_bin)
+    except OSError:
+        return False
+    return scan_binary_for_stdin(whisper_bin, st.st_mtime_ns, st.st_size)
+
+
+def can_stream(whisper_bin, duration):
+    return duration is not None and duration <= STREAM_MAX_SECONDS and whisper_supports_stdin(whisper_bin)
+
+
+def read_stdin(lines):
+    # a build that does read "-f -" reports it, a failed run without that line never got the audio
+    return any(STDIN_MARKER.decode() in line for line in lines)
+
+
+@functools.lru_cache(maxsize=None)
+def scan_binary_for_stdin(whisper_bin, mtime_ns, size):
+    # keyed on mtime and size so a rebuilt binary is scanned again, read in blocks
+    # that overlap by the marker length so a match across a block boundary is found
+    keep = len(STDIN_MARKER) - 1
+    tail = b""
+    try:
+        with open(whisper_bin, "rb") as f:
+            while True:
+                block = f.read(HASH_BLOCK_SIZE)
+                if not block:
+                    return False
+                if STDIN_MARKER in tail + block:
+                    return True
+                tail = block[-keep:]
+    except OSError:
+        return False
+
+
+def spawn_whisper(cmd, stream_from=None, **kwargs):
+    # with stream_from, ffmpeg decodes into a pipe that whisper reads as "-f -", so no temp WAV
+    # is written; whisper buffers the whole stream before decoding, see STREAM_MAX_SECONDS
+    if not stream_from:
+        return subprocess.Popen(cmd, **kwargs), None
+    ffmpeg_cmd = [
+        "ffmpeg", "-nostdin",
+        "-loglevel", "error",
+        "-i", stream_from,
+        "-ar", "16000",
+        "-ac", "1",
+        "-c:a", "pcm_s16le",
+        "-f", "wav",
+        "pipe:1"
+    ]
+    ffmpeg = subprocess.Popen(ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        process = subprocess.Popen(cmd, stdin=ffmpeg.stdout, **kwargs)
+    except Exception:
+        ffmpeg.kill()
+        ffmpeg.wait()
+        raise
+    finally:
+        # only whisper keeps the read end, so ffmpeg gets SIGPIPE if whisper exits early
+        ffmpeg.stdout.close()
+    return process, ffmpeg
+
+
 def get_clean_base_name(file_path):
     base = os.path.basename(file_path)
     return os.path.splitext(base)[0]
 
 
-def run_whisper_with_progress(cmd, original_file):
+def get_cpu_threads():
+    try:
+        output = subprocess.check_output(["lscpu"], universal_newlines=True)
+        for line in output.split("\n"):
+            if "CPU(s):" in line and "NUMA" not in line:
+                return line.split(":")[1].strip()
+    except Exception as e:
+        pass
+    return str(os.cpu_count() or 4)
+
+
+# per-host profile written by "scripts/bench.py tune", same default location and override variable
+TUNE_PROFILE_ENV = "WHISPER_TUNE_PROFILE"
+
+
+def get_tune_profile_path():
+    return os.getenv(TUNE_PROFILE_ENV) or os.path.join(
+        os.path.expanduser("~/.whisper"), f"tune-{socket.gethostname()}.json")
+
+
+def get_tuned_settings(model):
+    try:
+        with open(get_tune_profile_path(), "r") as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # a profile measured with a different core count does not apply anymore
+    if profile.get("cpu_count") != os.cpu_count():
+        return None
+    entry = profile.get("models", {}).get(model)
+    if not entry or int(entry.get("threads", 0)) < 1:
+        return None
+    # the settings only hold for the executable that was measured, "bench.py tune" records which one
+    binary = entry.get("binary") or {}
+    whisper_bin = get_whisper_bin()
+    try:
+        st = os.stat(whisper_bin)
+    except OSError:
+        return None
+    measured = (binary.get("path"), binary.get("size"), binary.get("mtime_ns"))
+    if measured != (os.path.abspath(whisper_bin), st.st_size, st.st_mtime_ns):
+        return None
+    return {"threads": int(entry["threads"]), "processors": max(1, int(entry.get("processors", 1)))}
+
+
+def get_whisper_bin():
+    return os.path.join(os.getenv("PREFIX", "/usr"), "bin", "whisper")
+
+
+def is_english_model(model):
+    return model.endswith(('.en', '.en-q5_0', '.en-q8_0'))
+
+
+def get_media_duration(path):
+    if path.lower().endswith('.wav'):
+        try:
+            with wave.open(path, "rb") as f:
+                return f.getnframes() / float(f.getframerate())
+        except Exception:
+            pass
+    try:
+        output = subprocess.check_output(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+             "-of", "default=noprint_wrappers=1:nokey=1", path],
+            stderr=subprocess.DEVNULL, universal_newlines=True)
+        return float(output.strip())
+    except Exception:
+        return None
+
+
+def build_whisper_cmd(whisper_bin, model, model_path, working_file, threads, output_base, language, processors=1):
+    cmd = [
+        whisper_bin,
+        "-m", model_path,
+        "-f", working_file,
+        "-osrt",
+        "-t", str(threads),
+        "--output-file", output_base,
+        "--print-progress"
+    ]
+
+    if int(processors) > 1:
+        cmd.extend(["-p", str(processors)])
+
+    if not is_english_model(model):
+        cmd.extend(["-l", language])
+    return cmd
+
+
+# one JSON object per whisper run, with the stage timings from whisper_print_timings
+RUN_LOG_ENV = "WHISPER_RUN_LOG"
+TIMING_RE = re.compile(r"whisper_print_timings:\s+(\w+) time\s*=\s*([\d.]+) ms(?:\s*/\s*(\d+) runs)?")
+run_log_lock = threading.Lock()
+
+
+def get_run_log_path():
+    return os.getenv(RUN_LOG_ENV) or os.path.join(os.path.expanduser("~/.whisper"), "runs.jsonl")
+
+
+def parse_whisper_timings(lines):
+    stages = {}
+    for line in lines:
+        match = TIMING_RE.search(line)
+        if match:
+            stage = {"ms": float(match.group(2))}
+            if match.group(3) is not None:
+                stage["runs"] = int(match.group(3))
+            stages[match.group(1)] = stage
+    return stages
+
+
+def cmd_option(cmd, flag, default=None):
+    return cmd[cmd.index(flag) + 1] if flag in cmd else default
+
+
+def log_whisper_run(cmd, original_file, success, stages, elapsed, duration=None):
+    if duration is None:
+        duration = get_media_duration(original_file)
+    model = os.path.basename(cmd_option(cmd, "-m", ""))
+    if model.startswith("ggml-") and model.endswith(".bin"):
+        model = model[len("ggml-"):-len(".bin")]
+    record = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": socket.gethostname(),
+        "file": os.path.abspath(original_file),
+        "model": model,
+        "threads": int(cmd_option(cmd, "-t", 0)),
+        "processors": int(cmd_option(cmd, "-p", 1)),
+        "language": cmd_option(cmd, "-l", "en"),
+        "streamed": cmd_option(cmd, "-f") == "-",
+        "success": success,
+        "duration": duration,
+        "elapsed": round(elapsed, 3),
+        "rtf": round(elapsed / duration, 4) if duration else None,
+        "stages": stages,
+    }
+    path = get_run_log_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with run_log_lock, open(path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        color_print(f"Warning: could not write the run log {path}: {e}", Color.YELLOW)
+    return record
+
+
+def print_stage_timings(record):
+    stages = record["stages"]
+    if not stages:
+        return
+    parts = [f"{name} {stage['ms']:.0f} ms" for name, stage in stages.items() if name != "total"]
+    if parts:
+        color_print("Stage timings: " + ", ".join(parts), Color.CYAN)
+    if record["rtf"] is not None:
+        color_print(f"Audio {record['duration']:.1f}s in {record['elapsed']:.1f}s, RTF {record['rtf']:.3f}", Color.CYAN)
+
+
+# segments printed by whisper while it runs are appended here, so a crashed run can resume
+CHECKPOINT_SUFFIX = ".progress.jsonl"
+CHECKPOINT_SYNC_SECONDS = 30
+SEGMENT_RE = re.compile(r"^\[(\d+:\d+:\d+[.,]\d+) --> (\d+:\d+:\d+[.,]\d+)\]\s*(.*)$")
+
+
+def checkpoint_header(original_file, cmd):
+    st = os.stat(original_file)
+    return {
+        "source": os.path.abspath(original_file),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "model": os.path.abspath(cmd_option(cmd, "-m", "")),
+        "language": cmd_option(cmd, "-l", "en"),
+    }
+
+
+def load_checkpoint(path, header):
+    # returns the completed segments, or nothing if the checkpoint belongs to another file or model
+    segments = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.read().split("\n")
+    except OSError:
+        return segments
+    try:
+        if json.loads(lines[0]) != header:
+            return segments
+    except ValueError:
+        return segments
+    for line in lines[1:]:
+        try:
+            entry = json.loads(line)
+            segments.append((entry["t0"], entry["t1"], entry["text"]))
+        except (ValueError, KeyError, TypeError):
+            # the last line can be cut short by a crash
+            break
+    return segments
+
+
+def open_checkpoint(path, header, segments):
+    # rewrite the valid part first so appends never follow a partial line
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(json.dumps(header) + "\n")
+        for t0, t1, text in segments:
+            f.write(json.dumps({"t0": t0, "t1": t1, "text": text}) + "\n")
+    os.replace(tmp, path)
+    return open(path, "a", encoding="utf-8")
+
+
+def run_whisper_with_progress(cmd, original_file, stream_from=None):
     color_print("\nStarting transcription process...", Color.MAGENTA, bold=True)
     color_print("="*50, Color.BLUE)
+    checkpoint = None
+    # returned with the result, so the caller can tell a build without stdin support from a failed run
+    stdin_read = False
     try:
-        process = subprocess.Popen(
-            cmd,
+        base_name = get_clean_base_name(original_file)
+        srt_file = f"{base_name}.srt"
+        checkpoint_path = f"{base_name}{CHECKPOINT_SUFFIX}"
+        header = checkpoint_header(original_file, cmd)
+        done_segments = load_checkpoint(checkpoint_path, header)
+        offset = done_segments[-1][1] if done_segments else 0
+        if offset:
+            color_print(f"Resuming from {ms_to_srt_time(offset)}, {len(done_segments)} segments already done", Color.GREEN)
+            cmd = cmd + ["--offset-t", str(offset)]
+        checkpoint = open_checkpoint(checkpoint_path, header, done_segments)
+
+        # whisper prints the segments with printf, line buffering keeps the checkpoint current
+        run_cmd = ["stdbuf", "-oL"] + cmd if shutil.which("stdbuf") else cmd
+        process, ffmpeg = spawn_whisper(
+            run_cmd,
+            stream_from,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
             universal_newlines=True,
             bufsize=1
         )
+        timing_lines = []
+        start = time.time()
+        last_sync = start
         while True:
             output = process.stdout.readline()
             if output == '' and process.poll() is not None:
                 break
             if output:
+                if "whisper_print_timings" in output:
+                    timing_lines.append(output)
+                if stream_from and read_stdin([output]):
+                    stdin_read = True
+                match = SEGMENT_RE.match(output.strip())
+                if match:
+                    checkpoint.write(json.dumps({
+                        "t0": srt_time_to_ms(match.group(1)),
+                        "t1": srt_time_to_ms(match.group(2)),
+                        "text": match.group(3).strip(),
+                    }) + "\n")
+                    checkpoint.flush()
+                    if time.time() - last_sync > CHECKPOINT_SYNC_SECONDS:
+                        os.fsync(checkpoint.fileno())
+                        last_sync = time.time()
                 if "%" in output:
                     sys.stdout.write(f"{Color.YELLOW}{output}{Color.END}")
                 else:
                     sys.stdout.write(output)
                 sys.stdout.flush()
         color_print("="*50, Color.BLUE)
-        base_name = get_clean_base_name(original_file)
-        srt_file = f"{base_name}.srt"
+        checkpoint.close()
         input_for_whisper = cmd[cmd.index('-f')+1]
         working_basename = os.path.basename(input_for_whisper)
         temp_srt = working_basename + ".srt"
         if os.path.exists(temp_srt) and temp_srt != srt_file:
             os.rename(temp_srt, srt_file)
-        return process.returncode == 0
+        success = process.returncode == 0 and not (ffmpeg and ffmpeg.wait() != 0)
+        record = log_whisper_run(cmd, original_file, success, parse_whisper_timings(timing_lines), time.time() - start)
+        print_stage_timings(record)
+        if not success:
+            color_print(f"Progress saved to {checkpoint_path}, run again to resume", Color.YELLOW)
+            return False, stdin_read
+        if offset:
+            # the resumed run only covers the audio after the offset, its timestamps are absolute
+            resumed = parse_srt(srt_file) if os.path.exists(srt_file) else []
+            write_srt(srt_file, [seg for seg in done_segments if seg[0] < offset] + resumed)
+        os.remove(checkpoint_path)
+        return True, stdin_read
     except Exception as e:
+        if checkpoint:
+            checkpoint.close()
         color_print(f"\n✗ Error: {str(e)}", Color.RED)
+        return False, stdin_read
+
+
+# transcription cache, entries are "<key>.srt" in the "srt" subdirectory of the cache root shared
+# with examples/python/whisper_processor.py, which keeps its own entries in "segments"; the least
+# recently used ones are evicted once the subdirectory grows past CACHE_MAX_BYTES; its size is kept
+# in meta/size.json so a store only scans the directory when the limit is exceeded
+CACHE_DIR_ENV = "WHISPER_CACHE_DIR"
+CACHE_SUBDIR = "srt"
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+# media paths whose content hash is remembered in meta/files.json
+HASH_MEMO_MAX_ENTRIES = 10000
+cache_lock = threading.Lock()
+
+
+def get_cache_dir():
+    root = os.getenv(CACHE_DIR_ENV) or os.path.join(os.path.expanduser("~/.whisper"), "cache")
+    return os.path.join(root, CACHE_SUBDIR)
+
+
+def load_cache_meta(name):
+    try:
+        with open(os.path.join(get_cache_dir(), "meta", name), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache_meta(name, data):
+    meta_dir = os.path.join(get_cache_dir(), "meta")
+    os.makedirs(meta_dir, exist_ok=True)
+    tmp = os.path.join(meta_dir, f"{name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, os.path.join(meta_dir, name))
+
+
+def hash_media_file(path):
+    # the content hash is reused while size, mtime and inode are unchanged
+    path = os.path.abspath(path)
+    fingerprint = file_fingerprint(path)
+    with cache_lock:
+        entry = load_cache_meta("files.json").get(path)
+    if entry and all(entry.get(k) == v for k, v in fingerprint.items()):
+        return entry["sha256"]
+    digest = hashlib.sha256()
+    buf = bytearray(HASH_BLOCK_SIZE)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            digest.update(view[:n])
+    with cache_lock:
+        files = load_cache_meta("files.json")
+        # reinserted at the end, so the dict stays ordered from least to most recently hashed
+        files.pop(path, None)
+        files[path] = dict(fingerprint, sha256=digest.hexdigest())
+        if len(files) > HASH_MEMO_MAX_ENTRIES:
+            files = {p: e for p, e in files.items() if os.path.exists(p)}
+            files = dict(list(files.items())[-HASH_MEMO_MAX_ENTRIES:])
+        save_cache_meta("files.json", files)
+    return digest.hexdigest()
+
+
+def transcription_cache_key(media_file, model, model_path, language, processors=1):
+    model_id = EXPECTED_SHA.get(model) or lookup_verified_sha1(load_integrity_index(os.path.dirname(model_path)), model_path)
+    if not model_id:
+        st = os.stat(model_path)
+        model_id = f"{st.st_size}-{st.st_mtime_ns}"
+    key = json.dumps([hash_media_file(media_file), model_id, language, int(processors)])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def update_cache_stats(hit, nbytes=0):
+    with cache_lock:
+        stats = load_cache_meta("stats.json")
+        stats["hits"] = stats.get("hits", 0) + (1 if hit else 0)
+        stats["misses"] = stats.get("misses", 0) + (0 if hit else 1)
+        stats["bytes_saved"] = stats.get("bytes_saved", 0) + (nbytes if hit else 0)
+        save_cache_meta("stats.json", stats)
+
+
+def cache_lookup(key, srt_file, nbytes=0):
+    entry = os.path.join(get_cache_dir(), f"{key}.srt")
+    try:
+        shutil.copyfile(entry, srt_file)
+        os.utime(entry)
+    except OSError:
+        update_cache_stats(False)
+        return False
+    update_cache_stats(True, nbytes)
+    return True
+
+
+def cache_store(key, srt_file):
+    cache_dir = get_cache_dir()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        entry = os.path.join(cache_dir, f"{key}.srt")
+        tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(srt_file, tmp)
+        size = os.path.getsize(tmp)
+        try:
+            replaced = os.path.getsize(entry)
+        except OSError:
+            replaced = 0
+        os.replace(tmp, entry)
+        with cache_lock:
+            total = load_cache_meta("size.json").get("bytes")
+            if total is not None:
+                total += size - replaced
+            if total is None or total > CACHE_MAX_BYTES:
+                # also corrects the recorded size after other processes stored or evicted entries
+                total = evict_cache(cache_dir)
+            save_cache_meta("size.json", {"bytes": total})
+    except OSError as e:
+        color_print(f"Warning: could not store the transcription in the cache: {e}", Color.YELLOW)
+
+
+def evict_cache(cache_dir, max_bytes=CACHE_MAX_BYTES):
+    entries = []
+    total = 0
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and not entry.name.endswith(".tmp"):
+            st = entry.stat()
+            entries.append((st.st_mtime_ns, st.st_size, entry.path))
+            total += st.st_size
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+    return total
+
+
+def show_cache_stats():
+    cache_dir = get_cache_dir()
+    stats = load_cache_meta("stats.json")
+    hits, misses = stats.get("hits", 0), stats.get("misses", 0)
+    entries = [e for e in os.scandir(cache_dir) if e.is_file() and not e.name.endswith(".tmp")] if os.path.isdir(cache_dir) else []
+    color_print("\n=== Transcription Cache ===", Color.MAGENTA, bold=True)
+    color_print(f"Directory: {cache_dir}", Color.CYAN)
+    color_print(f"Entries: {len(entries)}  Size: {sum(e.stat().st_size for e in entries) / (1024 * 1024):.1f} MiB", Color.CYAN)
+    color_print(f"Hits: {hits}  Misses: {misses}  Hit rate: {hits / (hits + misses) * 100 if hits + misses else 0:.1f}%", Color.CYAN)
+    color_print(f"Media bytes not re-transcribed: {stats.get('bytes_saved', 0) / (1024 * 1024):.1f} MiB", Color.CYAN)
+
+
+def plan_batch_workers(cores, threads=None, jobs=None):
+    # split the cores across concurrent whisper processes so that jobs * threads <= cores
+    if threads and jobs and threads * jobs > cores:
+        jobs = max(1, cores // threads)
+    if threads and not jobs:
+        jobs = max(1, cores // threads)
+    elif jobs and not threads:
+        threads = max(1, cores // jobs)
+    elif not threads and not jobs:
+        threads = min(4, cores)
+        jobs = max(1, cores // threads)
+    return threads, jobs
+
+
+def batch_output_bases(paths):
+    # foo.mp4 and foo.wav in one directory would both write foo.srt, colliding names keep their extension
+    bases = {}
+    for path in paths:
+        original_file = os.path.abspath(path)
+        bases.setdefault(os.path.join(os.path.dirname(original_file), get_clean_base_name(original_file)), []).append(path)
+    outputs = {}
+    for base, group in bases.items():
+        for path in group:
+            outputs[path] = base if len(group) == 1 else os.path.abspath(path)
+    return outputs
+
+
+def transcribe_batch_job(input_file, whisper_bin, model, model_path, language, threads, use_cache=True, output_base=None):
+    original_file = os.path.abspath(input_file)
+    if output_base is None:
+        output_base = os.path.join(os.path.dirname(original_file), get_clean_base_name(original_file))
+    duration = get_media_duration(original_file)
+    temp_wav = None
+    start = time.time()
+    cache_key = None
+    if use_cache:
+        cache_key = transcription_cache_key(original_file, model, model_path, language)
+        if cache_lookup(cache_key, output_base + ".srt", os.path.getsize(original_file)):
+            return True, duration, time.time() - start
+    try:
+        if original_file.lower().endswith('.mp4') and can_stream(whisper_bin, duration):
+            cmd = build_whisper_cmd(whisper_bin, model, model_path, "-", threads, output_base, language)
+            process, ffmpeg = spawn_whisper(cmd, original_file, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                            universal_newlines=True)
+            output, _ = process.communicate()
+            ffmpeg.wait()
+            success = process.returncode == 0 and ffmpeg.returncode == 0
+            log_whisper_run(cmd, original_file, success, parse_whisper_timings(output.splitlines()),
+                            time.time() - start, duration)
+            if success:
+                if cache_key:
+                    cache_store(cache_key, output_base + ".srt")
+                return True, duration, time.time() - start
+            if read_stdin(output.splitlines()):
+                # whisper got the audio, a temp WAV would only fail the same way
+                return False, duration, time.time() - start
+        working_file = original_file
+        if original_file.lower().endswith('.mp4'):
+            # a private name, the user's own foo.wav may be another job's input
+            fd, temp_wav = tempfile.mkstemp(prefix=get_clean_base_name(original_file) + ".", suffix=".wav",
+                                            dir=os.path.dirname(original_file))
+            os.close(fd)
+            if not convert_to_wav(original_file, quiet=True, output_file=temp_wav):
+                return False, duration, time.time() - start
+            working_file = temp_wav
+        cmd = build_whisper_cmd(whisper_bin, model, model_path, working_file, threads, output_base, language)
+        run_start = time.time()
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        log_whisper_run(cmd, original_file, result.returncode == 0, parse_whisper_timings(result.stdout.splitlines()),
+                        time.time() - run_start, duration)
+        if result.returncode == 0 and cache_key:
+            cache_store(cache_key, output_base + ".srt")
+        return result.returncode == 0, duration, time.time() - start
+    finally:
+        if temp_wav and os.path.exists(temp_wav):
+            os.remove(temp_wav)
+
+
+def run_batch(directory, model, language=None, threads=None, jobs=None, use_cache=True):
+    color_print("\n=== Batch Transcription ===", Color.MAGENTA, bold=True)
+    whisper_dir = find_whisper_dir()
+    if not whisper_dir:
+        color_print("✗ Error: Could not find whisper.cpp installation!", Color.RED)
+        return False
+    whisper_bin = get_whisper_bin()
+    if not Path(whisper_bin).exists():
+        color_print(f"✗ Error: {whisper_bin} not found!", Color.RED)
+        color_print("Make sure whisper.cpp is built", Color.YELLOW)
+        return False
+    available, status = check_model_availability(model)
+    if not available:
+        color_print(f"✗ Model {model} is {status}!", Color.RED)
+        return False
+    if is_english_model(model):
+        language = "en"
+    language = language or "en"
+    model_path = os.path.join(whisper_dir, "models", f"ggml-{model}.bin")
+
+    files = scan_media_files(directory)
+    if not files:
+        return False
+    # longest jobs first keeps the tail of the schedule short
+    paths = sorted((os.path.join(directory, f) for f in files), key=os.path.getsize, reverse=True)
+    outputs = batch_output_bases(paths)
+    for path in sorted(paths):
+        if outputs[path] == os.path.abspath(path):
+            color_print(f"Same name as another file, writing {os.path.basename(path)}.srt", Color.YELLOW)
+
+    cores = int(get_cpu_threads() or 4)
+    tuned = get_tuned_settings(model)
+    if tuned and not threads and not jobs:
+        # the batch runs files in parallel instead of splitting each one, so only the tuned threads apply
+        threads = tuned["threads"]
+    threads, jobs = plan_batch_workers(cores, threads, jobs)
+    color_print(f"Files: {len(paths)}  Model: {model}  Language: {language}", Color.CYAN)
+    color_print(f"Scheduler: {jobs} concurrent jobs x {threads} threads on {cores} cores", Color.CYAN)
+
+    failed = []
+    total_audio = 0.0
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(transcribe_batch_job, path, whisper_bin, model, model_path, language, threads, use_cache,
+                            outputs[path]): path
+            for path in paths
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                success, duration, elapsed = future.result()
+            except Exception as e:
+                success, duration, elapsed = False, None, 0.0
+                color_print(f"✗ Error: {str(e)}", Color.RED)
+            rtf = f"{elapsed / duration:.2f}" if duration else "n/a"
+            if success:
+                total_audio += duration or 0.0
+                color_print(f"[{done}/{len(paths)}] ✓ {os.path.basename(path)} ({elapsed:.1f}s, RTF {rtf})", Color.GREEN)
+            else:
+                failed.append(path)
+                color_print(f"[{done}/{len(paths)}] ✗ {os.path.basename(path)}", Color.RED)
+    wall = time.time() - start
+
+    color_print("\n=== Batch Summary ===", Color.MAGENTA, bold=True)
+    color_print(f"Transcribed: {len(paths) - len(failed)}/{len(paths)} files in {wall:.1f}s", Color.CYAN)
+    if total_audio > 0:
+        color_print(f"Audio: {total_audio:.1f}s  Aggregate RTF: {wall / total_audio:.3f} ({total_audio / wall:.1f}x realtime)", Color.CYAN)
+    for path in failed:
+        color_print(f"✗ Failed: {path}", Color.RED)
+    return not failed
+
+
+CHUNK_MANIFEST = "chunks.json"
+ENERGY_FRAME_SECONDS = 0.02
+SPLIT_SEARCH_SECONDS = 10.0
+
+
+def frame_energies(pcm, frame_size):
+    return [sum(s * s for s in pcm[i:i + frame_size]) for i in range(0, len(pcm) - frame_size + 1, frame_size)]
+
+
+def find_split_points(wav_path, chunk_length, search=SPLIT_SEARCH_SECONDS):
+    # only a window around every target split is read, the quietest 20 ms frame in it becomes the split
+    with wave.open(wav_path, "rb") as f:
+        rate = f.getframerate()
+        n_channels = f.getnchannels()
+        n_frames = f.getnframes()
+        width = f.getsampwidth()
+        splits = [0]
+        target = int(chunk_length * rate)
+        while target < n_frames - int(chunk_length * rate / 4):
+            if width != 2:
+                splits.append(target)
+                target += int(chunk_length * rate)
+                continue
+            start = max(splits[-1] + 1, target - int(search * rate / 2))
+            end = min(n_frames, target + int(search * rate / 2))
+            f.setpos(start)
+            pcm = array("h")
+            pcm.frombytes(f.readframes(end - start))
+            if sys.byteorder == "big":
+                pcm.byteswap()
+            frame_size = max(1, int(ENERGY_FRAME_SECONDS * rate)) * n_channels
+            energies = frame_energies(pcm, frame_size)
+            if energies:
+                quietest = min(range(len(energies)), key=energies.__getitem__)
+                split = start + (quietest * frame_size + frame_size // 2) // n_channels
+            else:
+                split = target
+            splits.append(split)
+            target = split + int(chunk_length * rate)
+        splits.append(n_frames)
+    return splits, rate
+
+
+def write_chunk(wav_path, chunk_path, start, end):
+    with wave.open(wav_path, "rb") as src:
+        params = src.getparams()
+        src.setpos(start)
+        tmp = chunk_path + ".tmp"
+        with wave.open(tmp, "wb") as dst:
+            dst.setparams(params)
+            remaining = end - start
+            while remaining > 0:
+                data = src.readframes(min(remaining, 1 << 20))
+                if not data:
+                    break
+                dst.writeframes(data)
+                remaining -= min(remaining, 1 << 20)
+    os.replace(tmp, chunk_path)
+
+
+def srt_time_to_ms(value):
+    hours, minutes, rest = value.strip().split(":")
+    seconds, millis = rest.replace(".", ",").split(",")
+    return ((int(hours) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(millis)
+
+
+def ms_to_srt_time(ms):
+    ms = max(0, int(round(ms)))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+
+def parse_srt(path):
+    segments = []
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        blocks = f.read().replace("\r\n", "\n").strip().split("\n\n")
+    for block in blocks:
+        lines = block.strip().split("\n")
+        for i, line in enumerate(lines):
+            if "-->" in line:
+                start, end = line.split("-->")
+                text = "\n".join(lines[i + 1:]).strip()
+                if text:
+                    segments.append((srt_time_to_ms(start), srt_time_to_ms(end.split()[0]), text))
+                break
+    return segments
+
+
+def write_srt(path, segments):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for i, (start, end, text) in enumerate(segments, 1):
+            f.write(f"{i}\n{ms_to_srt_time(start)} --> {ms_to_srt_time(end)}\n{text}\n\n")
+    os.replace(tmp, path)
+
+
+def normalize_text(text):
+    return " ".join(re.sub(r"[^\w\s]", "", text.lower()).split())
+
+
+def stitch_chunks(chunks, rate):
+    # every chunk owns the audio between its split points, a segment from the overlap is kept
+    # by the chunk that owns its midpoint, and repeated text across the seam is dropped
+    stitched = []
+    for chunk in chunks:
+        offset = chunk["start"] * 1000.0 / rate
+        own_start = chunk["own_start"] * 1000.0 / rate
+        own_end = chunk["own_end"] * 1000.0 / rate
+        for start, end, text in parse_srt(chunk["srt"]):
+            start += offset
+            end += offset
+            if not own_start <= (start + end) / 2 < own_end:
+                continue
+            if stitched and normalize_text(stitched[-1][2]) == normalize_text(text) and start - stitched[-1][1] < 1000:
+                stitched[-1] = (stitched[-1][0], max(stitched[-1][1], end), stitched[-1][2])
+                continue
+            if stitched and start < stitched[-1][1]:
+                start = stitched[-1][1]
+            stitched.append((start, max(start, end), text))
+    return stitched
+
+
+def plan_chunks(wav_path, chunk_length, overlap):
+    splits, rate = find_split_points(wav_path, chunk_length)
+    pad = int(overlap * rate)
+    chunks = []
+    for i in range(len(splits) - 1):
+        chunks.append({
+            "index": i,
+            "start": max(0, splits[i] - pad),
+            "end": min(splits[-1], splits[i + 1] + pad),
+            "own_start": splits[i],
+            "own_end": splits[i + 1],
+        })
+    return chunks, rate
+
+
+def read_chunk_manifest(work_dir):
+    try:
+        with open(os.path.join(work_dir, CHUNK_MANIFEST), "r") as f:
+            manifest = json.load(f)
+        return manifest if isinstance(manifest, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def load_chunk_manifest(work_dir, source, chunk_length, overlap, model, language, converted=False):
+    st = os.stat(source)
+    key = {"source": os.path.abspath(source), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+           "chunk_length": chunk_length, "overlap": overlap, "model": model, "language": language}
+    manifest = read_chunk_manifest(work_dir)
+    if manifest.get("key") == key and manifest.get("converted", False) == converted:
+        return manifest
+    # chunk files of an earlier plan cover other boundaries, audio or model, none of them can be reused
+    for stale in glob.glob(os.path.join(glob.escape(work_dir), "chunk-*")):
+        os.remove(stale)
+    chunks, rate = plan_chunks(source, chunk_length, overlap)
+    # converted records that source is a WAV this tool created, so a resumed run still removes it
+    manifest = {"key": key, "rate": rate, "chunks": chunks, "converted": converted}
+    tmp = os.path.join(work_dir, CHUNK_MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, os.path.join(work_dir, CHUNK_MANIFEST))
+    return manifest
+
+
+def transcribe_chunk(chunk, source, work_dir, whisper_bin, model, model_path, language, threads):
+    name = f"chunk-{chunk['index']:04d}"
+    srt = os.path.join(work_dir, name + ".srt")
+    # a finished chunk keeps its SRT, so a rerun only transcribes what is missing
+    if os.path.exists(srt):
+        return True, True
+    wav = os.path.join(work_dir, name + ".wav")
+    if not os.path.exists(wav):
+        write_chunk(source, wav, chunk["start"], chunk["end"])
+    part = os.path.join(work_dir, name + ".part")
+    cmd = build_whisper_cmd(whisper_bin, model, model_path, wav, threads, part, language)
+    start = time.time()
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    success = result.returncode == 0 and os.path.exists(part + ".srt")
+    log_whisper_run(cmd, wav, success, parse_whisper_timings(result.stdout.splitlines()), time.time() - start)
+    if success:
+        os.replace(part + ".srt", srt)
+        os.remove(wav)
+    return success, False
+
+
+def run_chunked(input_file, model, language=None, threads=None, jobs=None, chunk_length=600.0, overlap=2.0):
+    color_print("\n=== Chunked Transcription ===", Color.MAGENTA, bold=True)
+    whisper_dir = find_whisper_dir()
+    if not whisper_dir:
+        color_print("✗ Error: Could not find whisper.cpp installation!", Color.RED)
+        return False
+    whisper_bin = get_whisper_bin()
+    if not Path(whisper_bin).exists():
+        color_print(f"✗ Error: {whisper_bin} not found!", Color.RED)
+        color_print("Make sure whisper.cpp is built", Color.YELLOW)
+        return False
+    available, status = check_model_availability(model)
+    if not available:
+        color_print(f"✗ Model {model} is {status}!", Color.RED)
+        return False
+    if is_english_model(model):
+        language = "en"
+    language = language or "en"
+    model_path = os.path.join(whisper_dir, "models", f"ggml-{model}.bin")
+
+    original_file = os.path.abspath(input_file)
+    base_name = get_clean_base_name(original_file)
+    output_base = os.path.join(os.path.dirname(original_file), base_name)
+    work_dir = output_base + ".chunks"
+    os.makedirs(work_dir, exist_ok=True)
+
+    source = original_file
+    converted = False
+    if not original_file.lower().endswith(".wav"):
+        previous = read_chunk_manifest(work_dir)
+        user_wav = os.path.splitext(original_file)[0] + ".wav"
+        if previous.get("converted") and os.path.exists(previous["key"]["source"]):
+            # converted by an interrupted earlier run
+            source, converted = previous["key"]["source"], True
+        elif os.path.exists(user_wav):
+            color_print(f"WAV file already exists: {user_wav}", Color.YELLOW)
+            source = user_wav
+        else:
+            # converted under a temporary name, so an interrupted conversion is never mistaken for a finished one
+            source = os.path.join(work_dir, "source.wav")
+            partial = os.path.join(work_dir, "source.part.wav")
+            if not convert_to_wav(original_file, output_file=partial):
+                return False
+            os.replace(partial, source)
+            converted = True
+
+    manifest = load_chunk_manifest(work_dir, source, chunk_length, overlap, model, language, converted)
+    chunks = manifest["chunks"]
+    rate = manifest["rate"]
+
+    cores = int(get_cpu_threads() or 4)
+    tuned = get_tuned_settings(model)
+    if tuned and not threads and not jobs:
+        threads = tuned["threads"]
+    threads, jobs = plan_batch_workers(cores, threads, jobs)
+    duration = chunks[-1]["own_end"] / float(rate) if chunks else 0.0
+    color_print(f"File: {original_file}  Duration: {duration:.1f}s", Color.CYAN)
+    color_print(f"Chunks: {len(chunks)} x ~{chunk_length:.0f}s with {overlap:.1f}s overlap", Color.CYAN)
+    color_print(f"Scheduler: {jobs} concurrent jobs x {threads} threads on {cores} cores", Color.CYAN)
+
+    failed = []
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(transcribe_chunk, chunk, source, work_dir, whisper_bin, model, model_path, language, threads): chunk
+            for chunk in chunks
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            chunk = futures[future]
+            try:
+                success, resumed = future.result()
+            except Exception as e:
+                success, resumed = False, False
+                color_print(f"✗ Error: {str(e)}", Color.RED)
+            label = f"chunk {chunk['index'] + 1} ({chunk['own_start'] / rate:.0f}s-{chunk['own_end'] / rate:.0f}s)"
+            if success:
+                color_print(f"[{done}/{len(chunks)}] ✓ {label}{' already done' if resumed else ''}", Color.GREEN)
+            else:
+                failed.append(chunk)
+                color_print(f"[{done}/{len(chunks)}] ✗ {label}", Color.RED)
+    wall = time.time() - start
+
+    if failed:
+        color_print(f"\n✗ {len(failed)} chunk(s) failed, rerun the same command to resume", Color.RED, bold=True)
         return False
 
+    for chunk in chunks:
+        chunk["srt"] = os.path.join(work_dir, f"chunk-{chunk['index']:04d}.srt")
+    segments = stitch_chunks(chunks, rate)
+    srt_file = output_base + ".srt"
+    write_srt(srt_file, segments)
+
+    for chunk in chunks:
+        os.remove(chunk["srt"])
+    if converted:
+        os.remove(source)
+    os.remove(os.path.join(work_dir, CHUNK_MANIFEST))
+    os.rmdir(work_dir)
+
+    color_print(f"\n✓ SRT file created: {srt_file} ({len(segments)} segments)", Color.GREEN, bold=True)
+    if duration > 0:
+        color_print(f"Audio: {duration:.1f}s in {wall:.1f}s, RTF {wall / duration:.3f}", Color.CYAN)
+    return True
 
-def main():
+
+def main(use_cache=True):
     
     if not check_internet():
         color_print("sorry\nInternet is needed to run this script\nInternet is required to download models", Color.YELLOW)
@@ -360,19 +1376,6 @@ def main():
     input_file = select_from_menu("Media files list", file_options)
     model = show_model_menu()
     language = select_language(model)
-    import subprocess
-
-    
-    def get_cpu_threads():
-        try:
-            output = subprocess.check_output(["lscpu"], universal_newlines=True)
-            for line in output.split("\n"):
-                if "CPU(s):" in line and "NUMA" not in line:
-                    return line.split(":")[1].strip()
-        except Exception as e:
-            return "4"
-
-    
     detected_threads = get_cpu_threads()
 
     
@@ -380,9 +1383,17 @@ def main():
     print(f"\nIt is highly recommended to use half of your processor's capacity..")
 
 
-    color_print("\nEnter number of CPU threads (default 4): ", Color.BLUE, bold=True, underline=True)
-    threads = input().strip() or "4"
-    whisper_bin = os.path.join(os.getenv("PREFIX"), "bin", "whisper")
+    tuned = get_tuned_settings(model)
+    default_threads = "4"
+    processors = 1
+    if tuned:
+        default_threads = str(tuned["threads"])
+        processors = tuned["processors"]
+        color_print(f"Tuned for this host: {tuned['threads']} threads, {processors} processors", Color.CYAN)
+
+    color_print(f"\nEnter number of CPU threads (default {default_threads}): ", Color.BLUE, bold=True, underline=True)
+    threads = input().strip() or default_threads
+    whisper_bin = get_whisper_bin()
     model_path = os.path.join(whisper_dir, "models", f"ggml-{model}.bin")
     original_file = os.path.abspath(input_file)
     base_name = get_clean_base_name(original_file)
@@ -391,37 +1402,48 @@ def main():
         color_print(f"✗ Error: {whisper_bin} not found!", Color.RED)
         color_print("Make sure whisper.cpp is built", Color.YELLOW)
         return
+    cache_key = None
+    if use_cache:
+        cache_key = transcription_cache_key(original_file, model, model_path, language, processors)
+        if cache_lookup(cache_key, f"{base_name}.srt", os.path.getsize(original_file)):
+            color_print(f"\n✓ Same media, model and language found in the cache, SRT file created: {base_name}.srt", Color.GREEN, bold=True)
+            return
+
     working_file = original_file
-    
+    stream_from = None
+
     if original_file.lower().endswith('.mp4'):
-        temp_wav = convert_to_wav(original_file)
-        if not temp_wav:
-            return
-        working_file = temp_wav
+        if can_stream(whisper_bin, get_media_duration(original_file)):
+            stream_from = original_file
+            working_file = "-"
+        else:
+            temp_wav = convert_to_wav(original_file)
+            if not temp_wav:
+                return
+            working_file = temp_wav
 
-    cmd = [
-        whisper_bin,
-        "-m", model_path,
-        "-f", working_file,
-        "-osrt",
-        "-t", threads,
-        "--output-file", base_name,
-        "--print-progress"
-    ]
-    
-    if not model.endswith(('.en', '.en-q5_0', '.en-q8_0')):
-        cmd.extend(["-l", language])
+    cmd = build_whisper_cmd(whisper_bin, model, model_path, working_file, threads, base_name, language, processors)
 
     color_print("\n=== Configuration ===", Color.MAGENTA, bold=True)
     color_print(f"File: {original_file}", Color.CYAN)
     color_print(f"Model: {model_path}", Color.CYAN)
     color_print(f"Language: {language}", Color.CYAN)
     color_print(f"Threads: {threads}", Color.CYAN)
+    if processors > 1:
+        color_print(f"Processors: {processors}", Color.CYAN)
     color_print("\nCommand:", Color.BLUE)
     color_print(" ".join(cmd), Color.YELLOW)
     color_print("\nStarting process...\n", Color.GREEN, bold=True)
 
-    success = run_whisper_with_progress(cmd, original_file)
+    success, stdin_read = run_whisper_with_progress(cmd, original_file, stream_from)
+
+    # only a binary that turned out not to read "-f -" is retried, a real failure would just repeat
+    if not success and stream_from and not stdin_read:
+        color_print("\nThis whisper build does not read stdin, retrying with a temporary WAV file", Color.YELLOW)
+        temp_wav = convert_to_wav(original_file)
+        if temp_wav:
+            cmd = build_whisper_cmd(whisper_bin, model, model_path, temp_wav, threads, base_name, language, processors)
+            success, _ = run_whisper_with_progress(cmd, original_file)
 
     if temp_wav and os.path.exists(temp_wav):
         os.remove(temp_wav)
@@ -429,11 +1451,46 @@ def main():
     if success:
         base_name = get_clean_base_name(original_file)
         srt_file = f"{base_name}.srt"
+        if cache_key and os.path.exists(srt_file):
+            cache_store(cache_key, srt_file)
         color_print(f"\n✓ SRT file created: {srt_file}", Color.GREEN, bold=True)
     else:
         color_print("\n✗ Transcription process encountered an error", Color.RED, bold=True)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Transcribe media files with whisper.cpp")
+    parser.add_argument("--batch", metavar="DIR", help="transcribe every media file in DIR without prompting")
+    parser.add_argument("--model", default="small", help="model name for --batch and --chunked (default: small)")
+    parser.add_argument("--language", default=None, help="language code for --batch and --chunked (default: en)")
+    parser.add_argument("--threads", type=int, default=None, help="threads per whisper process for --batch and --chunked")
+    parser.add_argument("--jobs", type=int, default=None, help="concurrent whisper processes for --batch and --chunked")
+    parser.add_argument("--chunked", metavar="FILE", help="split a long FILE at quiet points and transcribe the chunks in parallel, rerun to resume")
+    parser.add_argument("--chunk-length", type=float, default=600.0, help="target chunk length in seconds for --chunked (default: 600)")
+    parser.add_argument("--overlap", type=float, default=2.0, help="audio shared by neighbouring chunks in seconds for --chunked (default: 2)")
+    parser.add_argument("--no-cache", action="store_true", help="always transcribe, do not read or write the transcription cache")
+    parser.add_argument("--cache-stats", action="store_true", help="show the transcription cache statistics and exit")
+    args = parser.parse_args()
+
+    if args.cache_stats:
+        show_cache_stats()
+        sys.exit(0)
+
+    if args.chunked:
+        ok = run_chunked(args.chunked, args.model, args.language, args.threads, args.jobs, args.chunk_length, args.overlap)
+        color_print("\nProgram finished", Color.MAGENTA, bold=True)
+        sys.exit(0 if ok else 1)
+
+    if args.batch:
+        if not os.path.isdir(args.batch):
+            color_print(f"✗ Error: {args.batch} is not a directory!", Color.RED)
+            sys.exit(1)
+        if not os.access(args.batch, os.R_OK | os.X_OK):
+            color_print(f"✗ Error: {args.batch} cannot be read!", Color.RED)
+            sys.exit(1)
+        ok = run_batch(args.batch, args.model, args.language, args.threads, args.jobs, not args.no_cache)
+        color_print("\nProgram finished", Color.MAGENTA, bold=True)
+        sys.exit(0 if ok else 1)
+
+    main(not args.no_cache)
     color_print("\nProgram finished", Color.MAGENTA, bold=True)
@@ -0,0 +1,58 @@
+import numpy as np
+
+from whisper_processor import WHISPER_SAMPLE_RATE, _map_to_original, detect_speech, pack_speech
+
+RATE = WHISPER_SAMPLE_RATE
+FRAME = RATE * 30 // 1000
+PAD = RATE * 150 // 1000
+
+
+def signal(*parts):
+    # parts are (seconds, amplitude) of a 440 Hz tone over a faint noise floor
+    rng = np.random.RandomState(0)
+    chunks = []
+    for seconds, amplitude in parts:
+        t = np.arange(int(seconds * RATE)) / RATE
+        chunks.append(amplitude * np.sin(2 * np.pi * 440 * t) + rng.normal(0, 1e-4, t.size))
+    return np.concatenate(chunks).astype(np.float32)
+
+
+def test_detect_speech_finds_the_tone_with_padding():
+    x = signal((1.0, 0), (1.0, 0.5), (1.0, 0))
+    # widened to the 30 ms frames the tone starts and ends in, then padded by 150 ms
+    assert detect_speech(x) == [(RATE // FRAME * FRAME - PAD, (2 * RATE // FRAME + 1) * FRAME + PAD)]
+
+
+def test_detect_speech_bridges_short_pauses_and_drops_short_bursts():
+    x = signal((1.0, 0), (0.6, 0.5), (0.2, 0), (0.6, 0.5), (1.0, 0), (0.09, 0.5), (1.0, 0))
+    regions = detect_speech(x)
+    assert len(regions) == 1
+    start, end = regions[0]
+    assert start == RATE // FRAME * FRAME - PAD
+    assert end == int(2.4 * RATE) + PAD
+
+
+def test_detect_speech_short_input():
+    assert detect_speech(np.zeros(0, dtype=np.float32)) == []
+    assert detect_speech(np.zeros(100, dtype=np.float32)) == [(0, 100)]
+
+
+def test_pack_speech_fills_windows_up_to_the_limit():
+    regions = [(0, 10 * RATE), (12 * RATE, 25 * RATE), (30 * RATE, 70 * RATE), (71 * RATE, 72 * RATE)]
+    assert pack_speech(regions) == [
+        [(0, 10 * RATE), (12 * RATE, 25 * RATE)],
+        [(30 * RATE, 70 * RATE)],
+        [(71 * RATE, 72 * RATE)],
+    ]
+
+
+def test_map_to_original():
+    # 0.5 s of speech from 1 s, then 200 ms of separator and 1 s of speech from 3 s
+    pieces = [(0, RATE, RATE // 2), (RATE // 2 + RATE // 5, 3 * RATE, RATE)]
+    assert _map_to_original(0, pieces, RATE) == 1000
+    assert _map_to_original(250, pieces, RATE) == 1250
+    # times inside the separator are clamped to the end of the previous piece
+    assert _map_to_original(600, pieces, RATE) == 1500
+    assert _map_to_original(700, pieces, RATE) == 3000
+    assert _map_to_original(1200, pieces, RATE) == 3500
+    assert _map_to_original(5000, pieces, RATE) == 4000
@@ -0,0 +1,267 @@
+import asyncio
+import os
+import re
+import shutil
+import sys
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from whisper_processor import Segment, WhisperPool, get_tuned_threads
+
+# whisper-cli segment lines: [00:00:00.000 --> 00:00:07.600]  text
+_SEGMENT_RE = re.compile(r"^\[(\d+):(\d+):(\d+)\.(\d+) --> (\d+):(\d+):(\d+)\.(\d+)\]\s*(.*)$")
+
+_DONE = object()
+
+
+def _to_ms(hours, minutes, seconds, millis):
+    return ((int(hours) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(millis)
+
+
+def find_cli():
+    """
+    Looks for the whisper-cli binary used when the shared library is not available.
+
+    :return: Path to whisper-cli, or None
+    """
+    candidates = [os.getenv("WHISPER_CLI"), "./build/bin/whisper-cli", shutil.which("whisper-cli")]
+    for candidate in candidates:
+        if candidate and os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return candidate
+    return None
+
+
+class AsyncWhisper:
+    """
+    Asyncio front end for whisper transcriptions.
+
+    Requests run on a WhisperPool in a thread pool when the whisper shared library
+    can be loaded, otherwise on whisper-cli child processes started with
+    asyncio.create_subprocess_exec. Either way the event loop is never blocked,
+    at most max_concurrency transcriptions run at once and the others wait on a
+    semaphore, and a timed out or cancelled request stops its transcription:
+    the child process is killed, a pooled transcription is aborted after its
+    current encoder or decoder pass.
+    """
+
+    def __init__(self, model_name="base.en", max_concurrency=None, n_threads=None, model_path=None):
+        """
+        :param model_name: Name of the model to use
+        :param max_concurrency: Concurrent transcriptions, defaults to the cores divided by n_threads
+        :param n_threads: Threads per transcription, defaults to the tuned value for this host
+        :param model_path: Optional explicit path to the model file
+        :raises: FileNotFoundError if the model file does not exist
+        :raises: OSError if neither the shared library nor whisper-cli are available
+        """
+        self.model_name = model_name
+        self.model = model_path or f"./models/ggml-{model_name}.bin"
+        self.n_threads = n_threads or get_tuned_threads(model_name)
+        self.max_concurrency = max_concurrency or max(1, (os.cpu_count() or 1) // self.n_threads)
+
+        if not os.path.exists(self.model):
+            raise FileNotFoundError(f"Model file not found: {self.model} \n\nDownload a model with this command:\n\n> bash ./models/download-ggml-model.sh {model_name}\n\n")
+
+        # asyncio primitives belong to one event loop, each loop using the instance gets its own
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._executor = None
+        self._cli = None
+        try:
+            self._pool = WhisperPool(model_name, n_workers=self.max_concurrency, n_threads=self.n_threads, model_path=self.model)
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="whisper")
+        except OSError:
+            self._pool = None
+            self._cli = find_cli()
+            if not self._cli:
+                raise OSError("neither the whisper shared library nor whisper-cli were found, set WHISPER_LIB or WHISPER_CLI")
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Waits for running transcriptions and frees the model.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    async def transcribe(self, wav_file, language="en", translate=False, timeout=None):
+        """
+        Transcribes a WAV file without blocking the event loop.
+
+        :param wav_file: Path to a 16 kHz WAV file
+        :param language: Spoken language, "auto" for detection
+        :param translate: Translate to English
+        :param timeout: Seconds before the request is stopped, including the time waiting for a slot
+        :return: List of Segment(t0, t1, text) with times in milliseconds
+        :raises: asyncio.TimeoutError if the timeout expired
+        :raises: Exception if whisper fails to process the audio
+        """
+        return [segment async for segment in self.stream(wav_file, language, translate, timeout)]
+
+    async def stream(self, wav_file, language="en", translate=False, timeout=None):
+        """
+        Transcribes a WAV file and yields every Segment as soon as it is decoded.
+
+        Closing the iterator early, cancelling the consuming task or running into the
+        timeout stops the transcription.
+
+        :param wav_file: Path to a 16 kHz WAV file
+        :param language: Spoken language, "auto" for detection
+        :param translate: Translate to English
+        :param timeout: Seconds before the request is stopped, including the time waiting for a slot
+        :return: Async iterator of Segment(t0, t1, text) with times in milliseconds
+        :raises: asyncio.TimeoutError if the timeout expired
+        :raises: Exception if whisper fails to process the audio
+        """
+        if not os.path.exists(wav_file):
+            raise FileNotFoundError(f"WAV file not found: {wav_file}")
+
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+
+        def remaining():
+            return None if deadline is None else max(0.0, deadline - loop.time())
+
+        semaphore = self._semaphore()
+        await asyncio.wait_for(semaphore.acquire(), remaining())
+        try:
+            if self._pool is not None:
+                segments = self._stream_pool(wav_file, language, translate, remaining)
+            else:
+                segments = self._stream_cli(wav_file, language, translate, remaining)
+            try:
+                async for segment in segments:
+                    yield segment
+            finally:
+                await segments.aclose()
+        finally:
+            semaphore.release()
+
+    async def _stream_pool(self, wav_file, language, translate, remaining):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        abort = threading.Event()
+
+        def run():
+            # the segments and the end marker go through the loop in order
+            try:
+                return self._pool.transcribe(
+                    wav_file, language, translate,
+                    on_segment=lambda segment: loop.call_soon_threadsafe(queue.put_nowait, segment),
+                    abort=abort,
+                )
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+        future = loop.run_in_executor(self._executor, run)
+        try:
+            while True:
+                item = await asyncio.wait_for(queue.get(), remaining())
+                if item is _DONE:
+                    break
+                yield item
+            await future
+        finally:
+            if not future.done():
+                abort.set()
+                # the state goes back to the pool once whisper notices the abort
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    async def _stream_cli(self, wav_file, language, translate, remaining):
+        cmd = [self._cli, "-m", self.model, "-f", wav_file, "-t", str(self.n_threads), "-l", language]
+        if translate:
+            cmd.append("-tr")
+        # whisper-cli prints the segments with printf, line buffering makes them arrive as decoded
+        if shutil.which("stdbuf"):
+            cmd = ["stdbuf", "-oL"] + cmd
+
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            while True:
+                line = await asyncio.wait_for(process.stdout.readline(), remaining())
+                if not line:
+                    break
+                match = _SEGMENT_RE.match(line.decode("utf-8", errors="replace").strip())
+                if match:
+                    yield Segment(_to_ms(*match.group(1, 2, 3, 4)), _to_ms(*match.group(5, 6, 7, 8)), match.group(9))
+            returncode = await asyncio.wait_for(process.wait(), remaining())
+            if returncode != 0:
+                raise Exception(f"Error processing audio: whisper-cli exited with code {returncode}")
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+
+_services = {}
+
+
+def get_service(model_name="base.en"):
+    """
+    Returns a process-wide AsyncWhisper for the model, loading it on first use.
+
+    :param model_name: Name of the model to use
+    :return: AsyncWhisper instance
+    """
+    service = _services.get(model_name)
+    if service is None:
+        service = AsyncWhisper(model_name)
+        _services[model_name] = service
+    return service
+
+
+async def transcribe(wav_file, model_name="base.en", language="en", translate=False, timeout=None):
+    """
+    Transcribes a WAV file with the process-wide service of the model.
+
+    :param wav_file: Path to a 16 kHz WAV file
+    :param model_name: Name of the model to use
+    :param language: Spoken language, "auto" for detection
+    :param translate: Translate to English
+    :param timeout: Seconds before the request is stopped
+    :return: List of Segment(t0, t1, text) with times in milliseconds
+    :raises: asyncio.TimeoutError if the timeout expired
+    :raises: Exception if an error occurs during processing
+    """
+    return await get_service(model_name).transcribe(wav_file, language, translate, timeout)
+
+
+async def _main(model_name, wav_files):
+    async with AsyncWhisper(model_name) as service:
+        async def run(wav_file):
+            async for segment in service.stream(wav_file):
+                print(f"{wav_file} [{segment.t0 / 1000:.2f} --> {segment.t1 / 1000:.2f}] {segment.text.strip()}")
+
+        results = await asyncio.gather(*(run(wav_file) for wav_file in wav_files), return_exceptions=True)
+        for wav_file, result in zip(wav_files, results):
+            if isinstance(result, BaseException):
+                print(f"Error: {wav_file}: {result}")
+
+
+def main():
+    if len(sys.argv) >= 3:
+        asyncio.run(_main(sys.argv[1], sys.argv[2:]))
+    else:
+        print("Usage: python whisper_async.py <model_name> <wav_file> [<wav_file> ...]")
+
+
+if __name__ == "__main__":
+    main()
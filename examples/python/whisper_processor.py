@@ -1,13 +1,982 @@
+import bisect
+import functools
+import operator
 import subprocess
 import sys
 import os
+import json
+import hashlib
+import socket
+import ctypes
+import ctypes.util
+import threading
+import time
+import queue
+import wave
+from array import array
+from collections import namedtuple
 
-def process_audio(wav_file, model_name="base.en"):
+WHISPER_SAMPLE_RATE = 16000
+DEFAULT_THREADS = 4
+
+# per-host profile written by "scripts/bench.py tune"
+TUNE_PROFILE_ENV = "WHISPER_TUNE_PROFILE"
+
+# transcription cache root shared with autofinal.py, each keeps its entries in its own subdirectory
+# bounded to CACHE_MAX_BYTES with LRU eviction
+CACHE_DIR_ENV = "WHISPER_CACHE_DIR"
+CACHE_SUBDIR = "segments"
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# voice activity detection, see detect_speech()
+VAD_FRAME_MS = 30
+VAD_WINDOW_MS = 30000
+VAD_SEPARATOR_MS = 200
+
+# micro-batching of short clips, see MicroBatcher
+BATCH_WAIT_MS = 5
+BATCH_MAX_CLIP_MS = 10000
+BATCH_SEPARATOR_MS = 1000
+
+# WAV sample widths load_wav() converts
+_PCM_TYPECODES = {1: "B", 2: "h", 4: "i"}
+_PCM_DTYPES = {1: "u1", 2: "<i2", 4: "<i4"}
+
+# whisper_full_get_segment_t0/t1 report centiseconds, segments are returned in milliseconds
+Segment = namedtuple("Segment", ["t0", "t1", "text"])
+
+
+class _WhisperAheads(ctypes.Structure):
+    _fields_ = [
+        ("n_heads", ctypes.c_size_t),
+        ("heads",   ctypes.c_void_p),
+    ]
+
+
+# must match struct whisper_context_params in include/whisper.h
+class _WhisperContextParams(ctypes.Structure):
+    _fields_ = [
+        ("use_gpu",              ctypes.c_bool),
+        ("flash_attn",           ctypes.c_bool),
+        ("gpu_device",           ctypes.c_int),
+        ("dtw_token_timestamps", ctypes.c_bool),
+        ("dtw_aheads_preset",    ctypes.c_int),
+        ("dtw_n_top",            ctypes.c_int),
+        ("dtw_aheads",           _WhisperAheads),
+        ("dtw_mem_size",         ctypes.c_size_t),
+    ]
+
+
+class _WhisperGreedyParams(ctypes.Structure):
+    _fields_ = [
+        ("best_of", ctypes.c_int),
+    ]
+
+
+class _WhisperBeamSearchParams(ctypes.Structure):
+    _fields_ = [
+        ("beam_size", ctypes.c_int),
+        ("patience",  ctypes.c_float),
+    ]
+
+
+# must match struct whisper_full_params in include/whisper.h
+# callbacks are left as opaque pointers, they are never set from Python
+class _WhisperFullParams(ctypes.Structure):
+    _fields_ = [
+        ("strategy",         ctypes.c_int),
+        ("n_threads",        ctypes.c_int),
+        ("n_max_text_ctx",   ctypes.c_int),
+        ("offset_ms",        ctypes.c_int),
+        ("duration_ms",      ctypes.c_int),
+        ("translate",        ctypes.c_bool),
+        ("no_context",       ctypes.c_bool),
+        ("no_timestamps",    ctypes.c_bool),
+        ("single_segment",   ctypes.c_bool),
+        ("print_special",    ctypes.c_bool),
+        ("print_progress",   ctypes.c_bool),
+        ("print_realtime",   ctypes.c_bool),
+        ("print_timestamps", ctypes.c_bool),
+        ("token_timestamps", ctypes.c_bool),
+        ("thold_pt",         ctypes.c_float),
+        ("thold_ptsum",      ctypes.c_float),
+        ("max_len",          ctypes.c_int),
+        ("split_on_word",    ctypes.c_bool),
+        ("max_tokens",       ctypes.c_int),
+        ("debug_mode",       ctypes.c_bool),
+        ("audio_ctx",        ctypes.c_int),
+        ("tdrz_enable",      ctypes.c_bool),
+        ("suppress_regex",   ctypes.c_char_p),
+        ("initial_prompt",   ctypes.c_char_p),
+        ("prompt_tokens",    ctypes.c_void_p),
+        ("prompt_n_tokens",  ctypes.c_int),
+        ("language",         ctypes.c_char_p),
+        ("detect_language",  ctypes.c_bool),
+        ("suppress_blank",   ctypes.c_bool),
+        ("suppress_nst",     ctypes.c_bool),
+        ("temperature",      ctypes.c_float),
+        ("max_initial_ts",   ctypes.c_float),
+        ("length_penalty",   ctypes.c_float),
+        ("temperature_inc",  ctypes.c_float),
+        ("entropy_thold",    ctypes.c_float),
+        ("logprob_thold",    ctypes.c_float),
+        ("no_speech_thold",  ctypes.c_float),
+        ("greedy",           _WhisperGreedyParams),
+        ("beam_search",      _WhisperBeamSearchParams),
+        ("new_segment_callback",              ctypes.c_void_p),
+        ("new_segment_callback_user_data",    ctypes.c_void_p),
+        ("progress_callback",                 ctypes.c_void_p),
+        ("progress_callback_user_data",       ctypes.c_void_p),
+        ("encoder_begin_callback",            ctypes.c_void_p),
+        ("encoder_begin_callback_user_data",  ctypes.c_void_p),
+        ("abort_callback",                    ctypes.c_void_p),
+        ("abort_callback_user_data",          ctypes.c_void_p),
+        ("logits_filter_callback",            ctypes.c_void_p),
+        ("logits_filter_callback_user_data",  ctypes.c_void_p),
+        ("grammar_rules",    ctypes.c_void_p),
+        ("n_grammar_rules",  ctypes.c_size_t),
+        ("i_start_rule",     ctypes.c_size_t),
+        ("grammar_penalty",  ctypes.c_float),
+    ]
+
+
+_LOG_CALLBACK = ctypes.CFUNCTYPE(None, ctypes.c_int, ctypes.c_char_p, ctypes.c_void_p)
+_NEW_SEGMENT_CALLBACK = ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p)
+_ABORT_CALLBACK = ctypes.CFUNCTYPE(ctypes.c_bool, ctypes.c_void_p)
+
+# keep a reference so the callback is not garbage collected while the library uses it
+_quiet_log = _LOG_CALLBACK(lambda level, text, user_data: None)
+
+_lib = None
+_lib_lock = threading.Lock()
+
+
+def find_library():
+    """
+    Locates the whisper shared library.
+
+    The WHISPER_LIB environment variable takes precedence, followed by the
+    usual CMake build directories and the Termux install prefix.
+
+    :return: Path to the library or None if it could not be found
+    """
+    if os.getenv("WHISPER_LIB"):
+        return os.getenv("WHISPER_LIB")
+
+    names = ["libwhisper.so", "libwhisper.dylib", "whisper.dll"]
+    dirs = ["./build/src", "./build/lib", "./build/bin", "./build"]
+    if os.getenv("PREFIX"):
+        dirs += [os.path.join(os.getenv("PREFIX"), "lib", "whisper"), os.path.join(os.getenv("PREFIX"), "lib")]
+
+    for d in dirs:
+        for name in names:
+            path = os.path.join(d, name)
+            if os.path.exists(path):
+                return path
+
+    return ctypes.util.find_library("whisper")
+
+
+def load_library(lib_path=None):
+    """
+    Loads the whisper shared library once per process and declares the
+    signatures of the functions used by WhisperPool.
+
+    :param lib_path: Optional explicit path to the library
+    :return: The loaded ctypes library
+    :raises: OSError if the library cannot be found or loaded
+    """
+    global _lib
+
+    with _lib_lock:
+        if _lib is not None:
+            return _lib
+
+        path = lib_path or find_library()
+        if not path:
+            raise OSError("whisper shared library not found, build with -DBUILD_SHARED_LIBS=ON or set WHISPER_LIB")
+
+        lib = ctypes.CDLL(path)
+
+        lib.whisper_context_default_params_by_ref.restype = ctypes.POINTER(_WhisperContextParams)
+        lib.whisper_context_default_params_by_ref.argtypes = []
+        lib.whisper_free_context_params.argtypes = [ctypes.POINTER(_WhisperContextParams)]
+
+        lib.whisper_full_default_params_by_ref.restype = ctypes.POINTER(_WhisperFullParams)
+        lib.whisper_full_default_params_by_ref.argtypes = [ctypes.c_int]
+        lib.whisper_free_params.argtypes = [ctypes.POINTER(_WhisperFullParams)]
+
+        lib.whisper_init_from_file_with_params_no_state.restype = ctypes.c_void_p
+        lib.whisper_init_from_file_with_params_no_state.argtypes = [ctypes.c_char_p, _WhisperContextParams]
+        lib.whisper_init_state.restype = ctypes.c_void_p
+        lib.whisper_init_state.argtypes = [ctypes.c_void_p]
+        lib.whisper_free.argtypes = [ctypes.c_void_p]
+        lib.whisper_free_state.argtypes = [ctypes.c_void_p]
+
+        lib.whisper_full_with_state.restype = ctypes.c_int
+        lib.whisper_full_with_state.argtypes = [ctypes.c_void_p, ctypes.c_void_p, _WhisperFullParams, ctypes.POINTER(ctypes.c_float), ctypes.c_int]
+        lib.whisper_full_n_segments_from_state.restype = ctypes.c_int
+        lib.whisper_full_n_segments_from_state.argtypes = [ctypes.c_void_p]
+        lib.whisper_full_get_segment_t0_from_state.restype = ctypes.c_int64
+        lib.whisper_full_get_segment_t0_from_state.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.whisper_full_get_segment_t1_from_state.restype = ctypes.c_int64
+        lib.whisper_full_get_segment_t1_from_state.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.whisper_full_get_segment_text_from_state.restype = ctypes.c_char_p
+        lib.whisper_full_get_segment_text_from_state.argtypes = [ctypes.c_void_p, ctypes.c_int]
+
+        lib.whisper_log_set.argtypes = [_LOG_CALLBACK, ctypes.c_void_p]
+        lib.whisper_log_set(_quiet_log, None)
+
+        _lib = lib
+        return _lib
+
+
+def load_wav(wav_file):
+    """
+    Reads a PCM WAV file into mono float samples in [-1, 1] at WHISPER_SAMPLE_RATE.
+
+    8, 16 and 32-bit files are converted in bulk. Other sample rates are resampled
+    linearly, like the miniaudio decoder used by ./main does, which requires numpy.
+
+    :param wav_file: Path to a WAV file or a binary file object
+    :return: array('f') with the samples
+    :raises: wave.Error or EOFError if the file is not a PCM WAV file
+    :raises: ValueError if the sample format cannot be converted here
+    """
+    with wave.open(wav_file, "rb") as f:
+        width = f.getsampwidth()
+        rate = f.getframerate()
+        n_channels = f.getnchannels()
+        data = f.readframes(f.getnframes())
+
+    if width not in _PCM_TYPECODES:
+        raise ValueError(f"WAV file must be 8, 16 or 32-bit PCM: {wav_file}")
+
+    try:
+        import numpy as np
+    except ImportError:
+        if rate != WHISPER_SAMPLE_RATE:
+            raise ValueError(f"resampling {rate} Hz WAV files requires numpy: {wav_file}")
+        return _pcm_to_float(data, width, n_channels)
+
+    x = np.frombuffer(data, dtype=_PCM_DTYPES[width]).astype(np.float32)
+    if width == 1:
+        x -= 128.0
+    x = x[:len(x) - len(x) % n_channels].reshape(-1, n_channels).mean(axis=1) / float(1 << (8 * width - 1))
+    if rate != WHISPER_SAMPLE_RATE and len(x):
+        n_out = len(x) * WHISPER_SAMPLE_RATE // rate
+        x = np.interp(np.arange(n_out) * (rate / WHISPER_SAMPLE_RATE), np.arange(len(x)), x)
+
+    samples = array("f")
+    samples.frombytes(x.astype(np.float32).tobytes())
+    return samples
+
+
+def _pcm_to_float(data, width, n_channels):
+    # without numpy, map() over C-level callables keeps the conversion out of the interpreter loop
+    pcm = array(_PCM_TYPECODES[width])
+    pcm.frombytes(data)
+    if sys.byteorder == "big" and width > 1:
+        pcm.byteswap()
+    if width == 1:
+        pcm = array("h", map((-128).__add__, pcm))
+
+    mixed = pcm
+    if n_channels > 1:
+        mixed = functools.reduce(lambda a, b: array("d", map(operator.add, a, b)),
+                                 (pcm[c::n_channels] for c in range(n_channels)))
+    scale = 1.0 / ((1 << (8 * width - 1)) * n_channels)
+    return array("f", map(scale.__mul__, mixed))
+
+
+def get_tuned_threads(model_name):
+    """
+    Looks up the thread count measured for the model by "scripts/bench.py tune" on this host.
+
+    :param model_name: Name of the model, e.g. "base.en"
+    :return: Tuned thread count, or DEFAULT_THREADS if the host has no usable profile entry
+    """
+    path = os.getenv(TUNE_PROFILE_ENV) or os.path.join(os.path.expanduser("~/.whisper"), f"tune-{socket.gethostname()}.json")
+    try:
+        with open(path, "r") as f:
+            profile = json.load(f)
+        # a profile measured with a different core count does not apply anymore
+        if profile.get("cpu_count") == os.cpu_count():
+            threads = int(profile["models"][model_name]["threads"])
+            if threads > 0:
+                return threads
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return DEFAULT_THREADS
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError("voice activity detection requires numpy: pip install numpy") from e
+    return numpy
+
+
+def detect_speech(samples, sample_rate=WHISPER_SAMPLE_RATE, frame_ms=VAD_FRAME_MS, threshold_db=None,
+                  min_speech_ms=250, min_silence_ms=400, pad_ms=150):
+    """
+    Finds the speech regions of a recording with a frame energy and zero-crossing rate detector.
+
+    Frames louder than the threshold are speech, and so are slightly quieter frames with a
+    high zero-crossing rate, which keeps unvoiced consonants. Pauses shorter than
+    min_silence_ms are bridged, regions shorter than min_speech_ms are dropped and the
+    remaining ones are padded by pad_ms on both sides.
+
+    :param samples: Mono float samples
+    :param sample_rate: Sample rate of the samples
+    :param frame_ms: Analysis frame length
+    :param threshold_db: Energy threshold in dBFS, by default derived from the noise floor of the recording
+    :param min_speech_ms: Shortest region kept
+    :param min_silence_ms: Shortest pause that separates two regions
+    :param pad_ms: Padding added around every region
+    :return: List of (start, end) sample indices
+    :raises: ImportError if numpy is not installed
+    """
+    np = _import_numpy()
+    x = np.frombuffer(samples, dtype=np.float32) if isinstance(samples, array) else np.asarray(samples, dtype=np.float32)
+    frame = max(1, sample_rate * frame_ms // 1000)
+    n_frames = len(x) // frame
+    if n_frames == 0:
+        return [(0, len(x))] if len(x) else []
+
+    frames = x[:n_frames * frame].reshape(n_frames, frame)
+    db = 10 * np.log10(np.mean(np.square(frames, dtype=np.float64), axis=1) + 1e-12)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame
+
+    if threshold_db is None:
+        # well above the noise floor, but not so high that a recording without pauses loses speech
+        floor, level = np.percentile(db, [10, 90])
+        threshold_db = max(-55.0, min(floor + 12.0, level - 20.0))
+    speech = (db > threshold_db) | ((db > threshold_db - 10.0) & (zcr > 0.25))
+
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], speech.astype(np.int8), [0]))))
+    runs = list(zip(edges[0::2].tolist(), edges[1::2].tolist()))
+
+    min_silence = max(1, min_silence_ms // frame_ms)
+    merged = []
+    for start, end in runs:
+        if merged and start - merged[-1][1] < min_silence:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+
+    min_speech = max(1, min_speech_ms // frame_ms)
+    pad = sample_rate * pad_ms // 1000
+    regions = []
+    for start, end in merged:
+        if end - start < min_speech:
+            continue
+        start, end = max(0, start * frame - pad), min(len(x), end * frame + pad)
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return regions
+
+
+def pack_speech(regions, sample_rate=WHISPER_SAMPLE_RATE, window_ms=VAD_WINDOW_MS, separator_ms=VAD_SEPARATOR_MS):
+    """
+    Groups speech regions into windows of up to window_ms, so short utterances share one
+    encoder window. A region longer than a window gets a window of its own.
+
+    :param regions: List of (start, end) sample indices from detect_speech()
+    :param sample_rate: Sample rate of the samples
+    :param window_ms: Target window length
+    :param separator_ms: Silence inserted between regions in a window
+    :return: List of windows, each a list of (start, end) sample indices
+    """
+    max_len = sample_rate * window_ms // 1000
+    sep = sample_rate * separator_ms // 1000
+    windows = []
+    length = 0
+    for start, end in regions:
+        size = end - start
+        if windows and windows[-1] and length + sep + size <= max_len:
+            windows[-1].append((start, end))
+            length += sep + size
+        else:
+            windows.append([(start, end)])
+            length = size
+    return windows
+
+
+def _map_to_original(t_ms, pieces, sample_rate):
+    # pieces are (window_start, original_start, length) in samples
+    t = t_ms * sample_rate // 1000
+    for window_start, original_start, length in reversed(pieces):
+        if t >= window_start:
+            return (original_start + min(t - window_start, length)) * 1000 // sample_rate
+    return pieces[0][1] * 1000 // sample_rate
+
+
+class TranscriptionAborted(Exception):
+    """
+    Raised when a transcription is stopped through its abort event.
+    """
+
+
+class WhisperPool:
+    """
+    Keeps a model loaded in-process and hands out one whisper_state per worker.
+
+    The model weights are loaded once with whisper_init_from_file_with_params_no_state
+    and shared by n_workers states created with whisper_init_state, so up to
+    n_workers threads can call transcribe() concurrently without paying the
+    model load per request.
+    """
+
+    def __init__(self, model_name="base.en", n_workers=1, n_threads=None, lib_path=None, model_path=None):
+        """
+        :param model_name: Name of the model to use
+        :param n_workers: Number of whisper states, i.e. concurrent transcriptions
+        :param n_threads: Number of threads used by each transcription, defaults to the tuned value for this host
+        :param lib_path: Optional explicit path to the whisper shared library
+        :param model_path: Optional explicit path to the model file
+        :raises: FileNotFoundError if the model file does not exist
+        :raises: OSError if the library or the model cannot be loaded
+        """
+        self.model_name = model_name
+        self.model = model_path or f"./models/ggml-{model_name}.bin"
+        self.n_workers = n_workers
+        self.n_threads = n_threads or get_tuned_threads(model_name)
+
+        if not os.path.exists(self.model):
+            raise FileNotFoundError(f"Model file not found: {self.model} \n\nDownload a model with this command:\n\n> bash ./models/download-ggml-model.sh {model_name}\n\n")
+
+        self._lib = load_library(lib_path)
+
+        cparams_ptr = self._lib.whisper_context_default_params_by_ref()
+        cparams = _WhisperContextParams.from_buffer_copy(cparams_ptr.contents)
+        self._lib.whisper_free_context_params(cparams_ptr)
+
+        self._ctx = self._lib.whisper_init_from_file_with_params_no_state(self.model.encode("utf-8"), cparams)
+        if not self._ctx:
+            raise OSError(f"Failed to load model: {self.model}")
+
+        self._states = queue.Queue()
+        self._all_states = []
+        for _ in range(n_workers):
+            state = self._lib.whisper_init_state(self._ctx)
+            if not state:
+                self.close()
+                raise OSError(f"Failed to allocate whisper state for model: {self.model}")
+            self._all_states.append(state)
+            self._states.put(state)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Frees all states and the model. The pool cannot be used afterwards.
+        """
+        for state in self._all_states:
+            self._lib.whisper_free_state(state)
+        self._all_states = []
+        if self._ctx:
+            self._lib.whisper_free(self._ctx)
+            self._ctx = None
+
+    def _full_params(self, language, translate):
+        params_ptr = self._lib.whisper_full_default_params_by_ref(0)  # WHISPER_SAMPLING_GREEDY
+        params = _WhisperFullParams.from_buffer_copy(params_ptr.contents)
+        self._lib.whisper_free_params(params_ptr)
+
+        params.n_threads = self.n_threads
+        params.translate = translate
+        params.print_progress = False
+        params.print_realtime = False
+        params.print_timestamps = False
+        params.language = language.encode("utf-8")
+        return params
+
+    def transcribe(self, audio, language="en", translate=False, vad=False, on_segment=None, abort=None):
+        """
+        Transcribes audio with one of the pooled states, blocking until a state is free.
+
+        :param audio: Path to a PCM WAV file, see load_wav(), or a sequence of 16 kHz float samples
+        :param language: Spoken language, "auto" for detection
+        :param translate: Translate to English
+        :param vad: Only run inference on the speech found by detect_speech(), requires numpy
+        :param on_segment: Optional callable receiving every Segment as soon as it is decoded,
+                           called from the transcribing thread
+        :param abort: Optional threading.Event, setting it stops the transcription after the
+                      current encoder or decoder pass
+        :return: List of Segment(t0, t1, text) with times in milliseconds
+        :raises: TranscriptionAborted if the abort event was set
+        :raises: wave.Error, EOFError or ValueError if the file cannot be decoded by load_wav()
+        :raises: Exception if whisper fails to process the audio
+        """
+        if self._ctx is None:
+            raise Exception("WhisperPool is closed")
+
+        samples = load_wav(audio) if isinstance(audio, (str, os.PathLike)) else audio
+        if not isinstance(samples, array) or samples.typecode != "f":
+            samples = array("f", samples)
+
+        if vad:
+            return self._transcribe_speech(samples, language, translate, on_segment, abort)
+        return self._transcribe_samples(samples, language, translate, on_segment, abort)
+
+    def _transcribe_speech(self, samples, language, translate, on_segment=None, abort=None):
+        # silence is cut before inference, the speech is packed into ~30 s windows with short
+        # separators and the segment times are mapped back to the original timeline
+        np = _import_numpy()
+        x = np.frombuffer(samples, dtype=np.float32)
+        sep = np.zeros(WHISPER_SAMPLE_RATE * VAD_SEPARATOR_MS // 1000, dtype=np.float32)
+
+        segments = []
+        for window in pack_speech(detect_speech(samples)):
+            parts = []
+            pieces = []
+            offset = 0
+            for start, end in window:
+                if parts:
+                    parts.append(sep)
+                    offset += len(sep)
+                pieces.append((offset, start, end - start))
+                parts.append(x[start:end])
+                offset += end - start
+
+            def to_original(segment, pieces=pieces):
+                t0 = _map_to_original(segment.t0, pieces, WHISPER_SAMPLE_RATE)
+                t1 = max(t0, _map_to_original(segment.t1, pieces, WHISPER_SAMPLE_RATE))
+                return Segment(t0, t1, segment.text)
+
+            window_samples = array("f")
+            window_samples.frombytes(np.concatenate(parts).astype(np.float32).tobytes())
+            window_callback = (lambda segment: on_segment(to_original(segment))) if on_segment else None
+            for segment in self._transcribe_samples(window_samples, language, translate, window_callback, abort):
+                segments.append(to_original(segment))
+        return segments
+
+    def _segment(self, state, i):
+        t0 = self._lib.whisper_full_get_segment_t0_from_state(state, i) * 10
+        t1 = self._lib.whisper_full_get_segment_t1_from_state(state, i) * 10
+        text = self._lib.whisper_full_get_segment_text_from_state(state, i).decode("utf-8", errors="replace")
+        return Segment(t0, t1, text)
+
+    def _transcribe_samples(self, samples, language, translate, on_segment=None, abort=None):
+        params = self._full_params(language, translate)
+        buf = (ctypes.c_float * len(samples)).from_buffer(samples)
+
+        # the ctypes callbacks have to stay referenced until whisper_full_with_state returns
+        callbacks = []
+        if on_segment is not None:
+            def new_segment(ctx, state, n_new, user_data):
+                n_segments = self._lib.whisper_full_n_segments_from_state(state)
+                for i in range(n_segments - n_new, n_segments):
+                    on_segment(self._segment(state, i))
+            callbacks.append(_NEW_SEGMENT_CALLBACK(new_segment))
+            params.new_segment_callback = ctypes.cast(callbacks[-1], ctypes.c_void_p)
+        if abort is not None:
+            callbacks.append(_ABORT_CALLBACK(lambda user_data: abort.is_set()))
+            params.abort_callback = ctypes.cast(callbacks[-1], ctypes.c_void_p)
+
+        state = self._states.get()
+        try:
+            if abort is not None and abort.is_set():
+                raise TranscriptionAborted("Transcription aborted")
+            if self._lib.whisper_full_with_state(self._ctx, state, params, buf, len(samples)) != 0:
+                if abort is not None and abort.is_set():
+                    raise TranscriptionAborted("Transcription aborted")
+                raise Exception("Error processing audio: whisper_full_with_state failed")
+
+            return [self._segment(state, i) for i in range(self._lib.whisper_full_n_segments_from_state(state))]
+        finally:
+            self._states.put(state)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(model_name="base.en", n_workers=1, n_threads=None):
+    """
+    Returns a process-wide WhisperPool for the model, loading it on first use.
+
+    :param model_name: Name of the model to use
+    :param n_workers: Number of states if the pool has to be created
+    :param n_threads: Threads per transcription if the pool has to be created, defaults to the tuned value
+    :return: WhisperPool instance
+    """
+    with _pools_lock:
+        pool = _pools.get(model_name)
+        if pool is None:
+            pool = WhisperPool(model_name, n_workers=n_workers, n_threads=n_threads)
+            _pools[model_name] = pool
+        return pool
+
+
+class _Batch:
+    def __init__(self, language, translate):
+        self.language = language
+        self.translate = translate
+        self.items = []
+        self.n_samples = 0
+        self.closed = False
+        self.done = threading.Event()
+
+
+class _BatchItem:
+    def __init__(self, samples, on_start, stats):
+        self.samples = samples
+        self.on_start = on_start
+        self.stats = stats
+        self.segments = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Packs short clips that arrive within a few milliseconds of each other into one
+    encoder window.
+
+    whisper always encodes 30 s of audio, so a 3 s clip pays for 27 s of padding.
+    The first clip of a batch waits up to wait_ms for more clips with the same
+    language and task, the clips are concatenated with separator_ms of silence in
+    between, transcribed with a single call and the segments are handed back to
+    the clip their midpoint falls into, shifted to the clip's own timeline.
+    Clips longer than max_clip_ms are transcribed on their own.
+
+    A segment that whisper runs across a separator goes to a single clip, the
+    separator keeps this rare but does not rule it out.
+    """
+
+    def __init__(self, pool, wait_ms=BATCH_WAIT_MS, max_clip_ms=BATCH_MAX_CLIP_MS,
+                 separator_ms=BATCH_SEPARATOR_MS, window_ms=VAD_WINDOW_MS):
+        """
+        :param pool: WhisperPool running the batches
+        :param wait_ms: How long the first clip of a batch waits for others
+        :param max_clip_ms: Longest clip that is batched
+        :param separator_ms: Silence inserted between clips
+        :param window_ms: Longest packed batch, whisper's encoder window
+        """
+        self.pool = pool
+        self.wait = wait_ms / 1000
+        self.max_clip = WHISPER_SAMPLE_RATE * max_clip_ms // 1000
+        self.separator = WHISPER_SAMPLE_RATE * separator_ms // 1000
+        self.max_batch = WHISPER_SAMPLE_RATE * window_ms // 1000
+        self._open = {}
+        self._cond = threading.Condition()
+        self._slots = threading.Semaphore(pool.n_workers)
+
+    def transcribe(self, audio, language="en", translate=False, on_start=None, stats=None):
+        """
+        Transcribes a clip, batched with other short clips when possible. Blocks until done.
+
+        :param audio: Path to a 16 kHz WAV file or a sequence of float samples
+        :param language: Spoken language, "auto" for detection
+        :param translate: Translate to English
+        :param on_start: Optional callable invoked when the inference of the clip starts,
+                         possibly from another thread
+        :param stats: Optional dict receiving "batch_size" and "batch_seconds", the number
+                      of clips and the seconds of audio transcribed together with this one
+        :return: List of Segment(t0, t1, text) with times in milliseconds
+        :raises: Exception if whisper fails to process the audio
+        """
+        samples = load_wav(audio) if isinstance(audio, (str, os.PathLike)) else audio
+        if not isinstance(samples, array) or samples.typecode != "f":
+            samples = array("f", samples)
+
+        item = _BatchItem(samples, on_start, stats if stats is not None else {})
+        if len(samples) > self.max_clip:
+            batch = _Batch(language, translate)
+            self._add(batch, item)
+            self._run(batch)
+        else:
+            batch, leader = self._join(item, language, translate)
+            if leader:
+                self._close_after_wait(batch)
+                self._run(batch)
+            else:
+                batch.done.wait()
+
+        if item.error is not None:
+            raise item.error
+        return item.segments
+
+    def _add(self, batch, item):
+        if batch.items:
+            batch.n_samples += self.separator
+        batch.items.append(item)
+        batch.n_samples += len(item.samples)
+
+    def _join(self, item, language, translate):
+        key = (language, translate)
+        with self._cond:
+            batch = self._open.get(key)
+            if batch is not None and batch.n_samples + self.separator + len(item.samples) <= self.max_batch:
+                self._add(batch, item)
+                if batch.n_samples + self.separator >= self.max_batch:
+                    batch.closed = True
+                    del self._open[key]
+                    self._cond.notify_all()
+                return batch, False
+
+            if batch is not None:
+                # full for this clip, the waiting leader runs it right away
+                batch.closed = True
+                self._cond.notify_all()
+            batch = _Batch(language, translate)
+            self._add(batch, item)
+            self._open[key] = batch
+            return batch, True
+
+    def _close_after_wait(self, batch):
+        deadline = time.monotonic() + self.wait
+        with self._cond:
+            while not batch.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch.closed = True
+            key = (batch.language, batch.translate)
+            if self._open.get(key) is batch:
+                del self._open[key]
+
+    def _run(self, batch):
+        offsets = []
+        packed = array("f")
+        silence = array("f", bytes(4 * self.separator))
+        for item in batch.items:
+            if packed:
+                packed.extend(silence)
+            offsets.append(len(packed) * 1000 // WHISPER_SAMPLE_RATE)
+            packed.extend(item.samples)
+
+        with self._slots:
+            for item in batch.items:
+                item.stats["batch_size"] = len(batch.items)
+                item.stats["batch_seconds"] = sum(len(i.samples) for i in batch.items) / WHISPER_SAMPLE_RATE
+                if item.on_start is not None:
+                    item.on_start()
+            try:
+                segments = self.pool.transcribe(packed, batch.language, batch.translate)
+            except Exception as e:
+                for item in batch.items:
+                    item.error = e
+                batch.done.set()
+                return
+
+        for item in batch.items:
+            item.segments = []
+        for segment in segments:
+            i = max(0, bisect.bisect_right(offsets, (segment.t0 + segment.t1) // 2) - 1)
+            item = batch.items[i]
+            length = len(item.samples) * 1000 // WHISPER_SAMPLE_RATE
+            t0 = min(max(segment.t0 - offsets[i], 0), length)
+            t1 = min(max(segment.t1 - offsets[i], t0), length)
+            item.segments.append(Segment(t0, t1, segment.text))
+        batch.done.set()
+
+
+class TranscriptionCache:
+    """
+    On-disk cache of transcriptions keyed by the decoded PCM.
+
+    Entries are addressed by a SHA-256 of the samples together with the model
+    identity, language and flags, so the same audio submitted from different
+    files or formats is only transcribed once. The modification time of an
+    entry is bumped on every hit and the least recently used entries are
+    evicted once the directory grows past max_bytes. The size of the directory
+    is tracked across puts, so it is only scanned when the limit is exceeded.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=CACHE_MAX_BYTES):
+        """
+        :param cache_dir: Cache directory, defaults to the "segments" subdirectory of $WHISPER_CACHE_DIR
+                          or ~/.whisper/cache
+        :param max_bytes: Size limit of the cache directory in bytes
+        """
+        root = os.getenv(CACHE_DIR_ENV) or os.path.join(os.path.expanduser("~/.whisper"), "cache")
+        self.cache_dir = cache_dir or os.path.join(root, CACHE_SUBDIR)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+        self._size = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def model_id(model_path):
+        """
+        Identifies a model file by its SHA1 from the models/.integrity.json index when it is
+        current, or by its size and modification time otherwise.
+
+        :param model_path: Path to the ggml model file
+        :return: String identifying the model contents
+        """
+        st = os.stat(model_path)
+        try:
+            with open(os.path.join(os.path.dirname(model_path), ".integrity.json"), "r") as f:
+                entry = json.load(f)[os.path.basename(model_path)]
+            if entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                return entry["sha1"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return f"{st.st_size}-{st.st_mtime_ns}"
+
+    def key(self, samples, model_id, language="en", translate=False, vad=False):
+        """
+        :param samples: array('f') of 16 kHz mono samples
+        :param model_id: Model identity, see model_id()
+        :param language: Spoken language
+        :param translate: Translate to English
+        :param vad: Voice activity detection was used
+        :return: Hex digest addressing the entry
+        """
+        h = hashlib.sha256(samples.tobytes())
+        h.update(json.dumps([model_id, language, bool(translate), bool(vad)]).encode("utf-8"))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key, nbytes=0):
+        """
+        :param key: Entry key
+        :param nbytes: Size of the audio, counted in bytes_saved on a hit
+        :return: List of Segment, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                segments = [Segment(*segment) for segment in json.load(f)]
+            os.utime(path)
+        except (OSError, ValueError, TypeError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += nbytes
+        return segments
+
+    def put(self, key, segments):
+        """
+        Stores the segments and evicts the least recently used entries if the cache is full.
+
+        :param key: Entry key
+        :param segments: List of Segment
+        """
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump([list(segment) for segment in segments], f)
+            size = f.tell()
+        try:
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+        os.replace(tmp, path)
+        with self._lock:
+            if self._size is not None:
+                self._size += size - replaced
+            full = self._size is None or self._size > self.max_bytes
+        if full:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in max_bytes.
+
+        Also resynchronizes the tracked size with the directory, which other
+        processes may share.
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                st = entry.stat()
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._size = total
+
+    def stats(self):
+        """
+        :return: Dict with hits, misses, hit_rate, bytes_saved (audio bytes that skipped inference),
+                 entries and size of the cache directory
+        """
+        entries = [e for e in os.scandir(self.cache_dir) if e.is_file() and not e.name.endswith(".tmp")]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "entries": len(entries),
+                "size": sum(e.stat().st_size for e in entries),
+            }
+
+
+_cache = None
+
+
+def get_cache():
+    """
+    Returns the process-wide TranscriptionCache used by process_audio().
+
+    :return: TranscriptionCache instance
+    """
+    global _cache
+    with _pools_lock:
+        if _cache is None:
+            _cache = TranscriptionCache()
+        return _cache
+
+
+def _process_audio_cli(wav_file, model):
+    full_command = f"./main -m {model} -f {wav_file} -nt"
+
+    # Execute the command
+    process = subprocess.Popen(full_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # Get the output and error (if any)
+    output, error = process.communicate()
+
+    if error:
+        raise Exception(f"Error processing audio: {error.decode('utf-8')}")
+
+    return output.decode('utf-8')
+
+
+def process_audio(wav_file, model_name="base.en", use_cache=True, vad=False):
     """
     Processes an audio file using a specified model and returns the processed string.
 
+    The model is kept loaded between calls through get_pool(). When the whisper
+    shared library is not available, this falls back to running ./main.
+    Results are cached by the decoded audio, see TranscriptionCache.
+
     :param wav_file: Path to the WAV file
     :param model_name: Name of the model to use
+    :param use_cache: Return and store results in the process-wide transcription cache
+    :param vad: Skip silence before inference, requires numpy and the whisper shared library,
+                ignored when ./main is used
     :return: Processed string output from the audio processing
     :raises: Exception if an error occurs during processing
     """
@@ -21,19 +990,43 @@ def process_audio(wav_file, model_name="base.en"):
     if not os.path.exists(wav_file):
         raise FileNotFoundError(f"WAV file not found: {wav_file}")
 
-    full_command = f"./main -m {model} -f {wav_file} -nt"
+    cache_key = None
+    try:
+        samples = load_wav(wav_file)
+    except (wave.Error, EOFError, ValueError):
+        # mp3, flac, ogg and WAV formats load_wav() cannot convert are decoded by ./main, uncached
+        return _process_audio_cli(wav_file, model).strip().replace('[BLANK_AUDIO]', '').strip()
 
-    # Execute the command
-    process = subprocess.Popen(full_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if vad:
+        # ./main cannot skip silence, its output must not be cached as a VAD transcription
+        try:
+            load_library()
+        except OSError:
+            vad = False
 
-    # Get the output and error (if any)
-    output, error = process.communicate()
+    if use_cache:
+        cache = get_cache()
+        cache_key = cache.key(samples, TranscriptionCache.model_id(model), vad=vad)
+        segments = cache.get(cache_key, len(samples) * 2)
+        if segments is not None:
+            return "".join(segment.text for segment in segments).strip().replace('[BLANK_AUDIO]', '').strip()
 
-    if error:
-        raise Exception(f"Error processing audio: {error.decode('utf-8')}")
+    segments = None
+    try:
+        pool = get_pool(model_name)
+    except OSError:
+        decoded_str = _process_audio_cli(wav_file, model)
+        if vad:
+            cache_key = None
+    else:
+        segments = pool.transcribe(samples, vad=vad)
+        decoded_str = "".join(segment.text for segment in segments)
+
+    if cache_key is not None:
+        get_cache().put(cache_key, segments if segments is not None else [Segment(0, 0, decoded_str)])
 
     # Process and return the output string
-    decoded_str = output.decode('utf-8').strip()
+    decoded_str = decoded_str.strip()
     processed_str = decoded_str.replace('[BLANK_AUDIO]', '').strip()
 
     return processed_str
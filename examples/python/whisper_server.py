@@ -0,0 +1,450 @@
+import argparse
+import email.parser
+import email.policy
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from whisper_processor import WHISPER_SAMPLE_RATE, MicroBatcher, WhisperPool, get_tuned_threads, load_wav
+
+DEFAULT_PORT = 8080
+DEFAULT_QUEUE = 16
+MAX_UPLOAD_BYTES = 256 * 1024 * 1024
+LATENCY_WINDOW = 1024
+
+RESPONSE_FORMATS = ("json", "text", "srt", "verbose_json", "vtt")
+STAGES = ("decode", "queue", "inference", "total")
+
+
+def to_timestamp(t_ms, comma=False):
+    """
+    Formats milliseconds like to_timestamp() in examples/server/server.cpp.
+
+    :param t_ms: Time in milliseconds
+    :param comma: Use a comma as decimal separator, as SRT does
+    :return: "HH:MM:SS.mmm"
+    """
+    hours, rest = divmod(int(t_ms), 3600 * 1000)
+    minutes, rest = divmod(rest, 60 * 1000)
+    seconds, millis = divmod(rest, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{',' if comma else '.'}{millis:03d}"
+
+
+def format_response(segments, response_format, language, translate, duration):
+    """
+    Renders segments the way the /inference endpoint of the C++ server does.
+
+    :param segments: List of Segment(t0, t1, text) with times in milliseconds
+    :param response_format: One of RESPONSE_FORMATS
+    :param language: Language of the request
+    :param translate: Whether the request asked for a translation
+    :param duration: Audio duration in seconds
+    :return: (body bytes, content type)
+    """
+    text = "".join(f"{segment.text}\n" for segment in segments)
+
+    if response_format == "text":
+        return text.encode("utf-8"), "text/html; charset=utf-8"
+    if response_format == "srt":
+        body = "".join(
+            f"{i + 1}\n{to_timestamp(s.t0, True)} --> {to_timestamp(s.t1, True)}\n{s.text}\n\n"
+            for i, s in enumerate(segments)
+        )
+        return body.encode("utf-8"), "application/x-subrip"
+    if response_format == "vtt":
+        body = "WEBVTT\n\n" + "".join(f"{to_timestamp(s.t0)} --> {to_timestamp(s.t1)}\n{s.text}\n\n" for s in segments)
+        return body.encode("utf-8"), "text/vtt"
+    if response_format == "verbose_json":
+        result = {
+            "task": "translate" if translate else "transcribe",
+            "language": language,
+            "duration": duration,
+            "text": text,
+            "segments": [
+                {"id": i, "text": s.text, "start": s.t0 / 1000, "end": s.t1 / 1000}
+                for i, s in enumerate(segments)
+            ],
+        }
+        return json.dumps(result, ensure_ascii=False).encode("utf-8"), "application/json"
+    return json.dumps({"text": text}, ensure_ascii=False).encode("utf-8"), "application/json"
+
+
+def parse_form(content_type, body):
+    """
+    Splits a multipart/form-data body into its fields.
+
+    :param content_type: Value of the Content-Type header
+    :param body: Raw request body
+    :return: Dict of field name to (filename, bytes)
+    :raises: ValueError if the body is not multipart/form-data
+    """
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+    )
+    if not message.is_multipart():
+        raise ValueError("expected a multipart/form-data body")
+
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if name:
+            fields[name] = (part.get_filename(), part.get_payload(decode=True) or b"")
+    return fields
+
+
+def decode_audio(data, convert=False):
+    """
+    Decodes an uploaded file into 16 kHz mono float samples.
+
+    :param data: Uploaded file content
+    :param convert: Convert other formats with ffmpeg, like the --convert option of the C++ server
+    :return: array('f') with the samples
+    :raises: ValueError if the audio cannot be read
+    """
+    try:
+        return load_wav(io.BytesIO(data))
+    except (wave.Error, EOFError, ValueError):
+        if not convert:
+            raise ValueError("failed to read audio data")
+
+    with tempfile.TemporaryDirectory(prefix="whisper-server-") as tmp:
+        source = os.path.join(tmp, "upload")
+        target = os.path.join(tmp, "upload.wav")
+        with open(source, "wb") as f:
+            f.write(data)
+        result = subprocess.run(
+            ["ffmpeg", "-nostdin", "-i", source, "-y", "-ar", str(WHISPER_SAMPLE_RATE), "-ac", "1", "-c:a", "pcm_s16le", target],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        if result.returncode != 0:
+            raise ValueError("Failed to execute ffmpeg command.")
+        return load_wav(target)
+
+
+class Metrics:
+    """
+    Thread-safe request counters and latency windows, rendered in the Prometheus text format.
+
+    Latency quantiles are computed over the last LATENCY_WINDOW requests, sums and
+    counts cover the whole lifetime of the server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.responses = {}
+        self.audio_seconds = 0.0
+        self._stages = {stage: deque(maxlen=LATENCY_WINDOW) for stage in STAGES}
+        self._stage_sums = {stage: 0.0 for stage in STAGES}
+        self._stage_counts = {stage: 0 for stage in STAGES}
+        self._rtf = deque(maxlen=LATENCY_WINDOW)
+        self._batch_sizes = deque(maxlen=LATENCY_WINDOW)
+
+    def adjust(self, queued=0, running=0):
+        with self._lock:
+            self.queued += queued
+            self.running += running
+
+    def count_response(self, status):
+        with self._lock:
+            self.responses[status] = self.responses.get(status, 0) + 1
+
+    def observe(self, timings, duration, batch_size=1, batch_seconds=None):
+        """
+        :param timings: Dict of stage name to seconds
+        :param duration: Audio duration in seconds, 0 if the audio was never decoded
+        :param batch_size: Number of requests transcribed in the same inference
+        :param batch_seconds: Seconds of audio in that inference, defaults to duration
+        """
+        with self._lock:
+            for stage, seconds in timings.items():
+                self._stages[stage].append(seconds)
+                self._stage_sums[stage] += seconds
+                self._stage_counts[stage] += 1
+            if duration > 0 and "inference" in timings:
+                self.audio_seconds += duration
+                self._rtf.append(timings["inference"] / (batch_seconds or duration))
+                self._batch_sizes.append(batch_size)
+
+    @staticmethod
+    def _quantile(values, q):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+    def render(self, capacity, workers):
+        with self._lock:
+            lines = [
+                "# TYPE whisper_queue_depth gauge",
+                f"whisper_queue_depth {self.queued}",
+                "# TYPE whisper_queue_capacity gauge",
+                f"whisper_queue_capacity {capacity}",
+                "# TYPE whisper_running gauge",
+                f"whisper_running {self.running}",
+                "# TYPE whisper_workers gauge",
+                f"whisper_workers {workers}",
+                "# TYPE whisper_responses_total counter",
+            ]
+            lines += [f'whisper_responses_total{{code="{code}"}} {n}' for code, n in sorted(self.responses.items())]
+            lines += ["# TYPE whisper_audio_seconds_total counter", f"whisper_audio_seconds_total {self.audio_seconds:.3f}"]
+
+            lines.append("# TYPE whisper_stage_seconds summary")
+            for stage in STAGES:
+                for q in (0.5, 0.95, 0.99):
+                    lines.append(f'whisper_stage_seconds{{stage="{stage}",quantile="{q}"}} {self._quantile(self._stages[stage], q):.6f}')
+                lines.append(f'whisper_stage_seconds_sum{{stage="{stage}"}} {self._stage_sums[stage]:.6f}')
+                lines.append(f'whisper_stage_seconds_count{{stage="{stage}"}} {self._stage_counts[stage]}')
+
+            lines.append("# TYPE whisper_rtf summary")
+            for q in (0.5, 0.95, 0.99):
+                lines.append(f'whisper_rtf{{quantile="{q}"}} {self._quantile(self._rtf, q):.6f}')
+            lines.append(f"whisper_rtf_count {len(self._rtf)}")
+
+            lines.append("# TYPE whisper_batch_size summary")
+            for q in (0.5, 0.95, 0.99):
+                lines.append(f'whisper_batch_size{{quantile="{q}"}} {self._quantile(self._batch_sizes, q)}')
+            lines.append(f"whisper_batch_size_count {len(self._batch_sizes)}")
+        return "\n".join(lines) + "\n"
+
+
+class TranscriptionService:
+    """
+    Warm WhisperPool behind a bounded admission queue.
+
+    At most n_workers transcriptions run at once, up to queue_size more requests
+    wait for a free worker, and anything beyond that is rejected right away so
+    clients can back off instead of piling up on the server.
+
+    With batch_ms set, short clips arriving within batch_ms of each other share
+    one inference through a MicroBatcher.
+    """
+
+    def __init__(self, model_name="base.en", n_workers=None, n_threads=None, queue_size=DEFAULT_QUEUE,
+                 model_path=None, convert=False, batch_ms=0):
+        """
+        :param model_name: Name of the model to use
+        :param n_workers: Concurrent transcriptions, defaults to the cores divided by n_threads
+        :param n_threads: Threads per transcription, defaults to the tuned value for this host
+        :param queue_size: Requests allowed to wait for a worker
+        :param model_path: Optional explicit path to the model file
+        :param convert: Convert non-WAV uploads with ffmpeg
+        :param batch_ms: How long a short clip waits for others to batch with, 0 disables batching
+        :raises: FileNotFoundError if the model file does not exist
+        :raises: OSError if the library or the model cannot be loaded
+        """
+        self.n_threads = n_threads or get_tuned_threads(model_name)
+        self.n_workers = n_workers or max(1, (os.cpu_count() or 1) // self.n_threads)
+        self.capacity = self.n_workers + queue_size
+        self.convert = convert
+        self.metrics = Metrics()
+        self.pool = WhisperPool(model_name, n_workers=self.n_workers, n_threads=self.n_threads, model_path=model_path)
+        self._admitted = 0
+        self._lock = threading.Lock()
+        self._workers = threading.Semaphore(self.n_workers)
+        self.batcher = MicroBatcher(self.pool, wait_ms=batch_ms) if batch_ms > 0 else None
+
+    def close(self):
+        self.pool.close()
+
+    def admit(self):
+        """
+        Reserves a place in the queue without blocking.
+
+        :return: True if the request was admitted and release() has to be called, False if the queue is full
+        """
+        with self._lock:
+            if self._admitted >= self.capacity:
+                return False
+            self._admitted += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._admitted -= 1
+
+    def transcribe(self, data, language="en", translate=False):
+        """
+        Decodes and transcribes an admitted request.
+
+        :param data: Uploaded audio file content
+        :param language: Spoken language, "auto" for detection
+        :param translate: Translate to English
+        :return: (segments, audio duration in seconds, dict of stage name to seconds)
+        :raises: ValueError if the audio cannot be read
+        :raises: Exception if whisper fails to process the audio
+        """
+        timings = {}
+        stats = {}
+        duration = 0.0
+        start = time.perf_counter()
+        try:
+            samples = decode_audio(data, self.convert)
+            duration = len(samples) / WHISPER_SAMPLE_RATE
+            timings["decode"] = time.perf_counter() - start
+
+            queued = time.perf_counter()
+            started = []
+
+            def on_start():
+                # called by the thread running the inference, which is another one for batched requests
+                started.append(time.perf_counter())
+                timings["queue"] = started[0] - queued
+                self.metrics.adjust(queued=-1, running=1)
+
+            self.metrics.adjust(queued=1)
+            try:
+                if self.batcher is not None:
+                    segments = self.batcher.transcribe(samples, language, translate, on_start, stats)
+                else:
+                    with self._workers:
+                        on_start()
+                        segments = self.pool.transcribe(samples, language, translate)
+                timings["inference"] = time.perf_counter() - started[0]
+            finally:
+                self.metrics.adjust(queued=0 if started else -1, running=-1 if started else 0)
+            return segments, duration, timings
+        finally:
+            timings["total"] = time.perf_counter() - start
+            self.metrics.observe(timings, duration, stats.get("batch_size", 1), stats.get("batch_seconds"))
+
+
+def make_handler(service, request_path="", max_upload=MAX_UPLOAD_BYTES):
+    """
+    Builds the request handler class serving the endpoints of examples/server/server.cpp.
+
+    :param service: TranscriptionService handling the requests
+    :param request_path: Prefix of all endpoints, like --request-path of the C++ server
+    :param max_upload: Largest accepted request body in bytes
+    :return: BaseHTTPRequestHandler subclass
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            sys.stderr.write("%s - %s\n" % (self.address_string(), format % args))
+
+        def _send(self, status, body, content_type, headers=None):
+            service.metrics.count_response(status)
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_error(self, status, message, headers=None):
+            self._send(status, json.dumps({"error": message}).encode("utf-8"), "application/json", headers)
+
+        def do_GET(self):
+            if self.path == request_path + "/health":
+                self._send(200, b'{"status":"ok"}', "application/json")
+            elif self.path == "/metrics":
+                body = service.metrics.render(service.capacity, service.n_workers).encode("utf-8")
+                self._send(200, body, "text/plain; version=0.0.4")
+            else:
+                self._send_error(404, "not found")
+
+        def do_POST(self):
+            if self.path != request_path + "/inference":
+                self.close_connection = True
+                self._send_error(404, "not found")
+                return
+
+            # rejected before the upload is read, the connection is closed instead of drained
+            if not service.admit():
+                self.close_connection = True
+                self._send_error(429, "server busy, retry later", {"Retry-After": "1", "Connection": "close"})
+                return
+            try:
+                self._inference()
+            finally:
+                service.release()
+
+        def _inference(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length <= 0 or length > max_upload:
+                self.close_connection = True
+                self._send_error(413 if length > 0 else 411, "request body missing or too large")
+                return
+
+            body = self.rfile.read(length)
+            try:
+                fields = parse_form(self.headers.get("Content-Type", ""), body)
+            except ValueError:
+                fields = {}
+            if "file" not in fields:
+                self._send_error(400, "no 'file' field in the request")
+                return
+
+            def field(name, default):
+                value = fields.get(name)
+                return value[1].decode("utf-8", errors="replace").strip() if value else default
+
+            language = field("language", "en")
+            translate = field("translate", "false") in ("true", "1", "yes", "y")
+            response_format = field("response_format", "json")
+            if response_format not in RESPONSE_FORMATS:
+                response_format = "json"
+
+            filename = fields["file"][0] or ""
+            print(f"Received request: {filename}")
+
+            try:
+                segments, duration, _ = service.transcribe(fields["file"][1], language, translate)
+            except ValueError as e:
+                self._send_error(400, str(e))
+                return
+            except Exception as e:
+                self._send_error(500, f"failed to process audio: {e}")
+                return
+
+            self._send(200, *format_response(segments, response_format, language, translate, duration))
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="whisper transcription server with a warm model pool")
+    parser.add_argument("-m", "--model", default="base.en", help="Model name, or a path to a ggml model file")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Concurrent transcriptions (default: cores / threads)")
+    parser.add_argument("-t", "--threads", type=int, default=None, help="Threads per transcription (default: tuned value)")
+    parser.add_argument("-q", "--queue", type=int, default=DEFAULT_QUEUE, help="Requests allowed to wait for a worker before 429")
+    parser.add_argument("--request-path", default="", help="Prefix of the endpoints, e.g. /v1")
+    parser.add_argument("--convert", action="store_true", help="Convert non-WAV uploads with ffmpeg")
+    parser.add_argument("-b", "--batch-ms", type=float, default=0, help="Batch short clips arriving within this many ms (default: off)")
+    args = parser.parse_args()
+
+    if os.path.isfile(args.model):
+        model_name, model_path = os.path.basename(args.model).removeprefix("ggml-").removesuffix(".bin"), args.model
+    else:
+        model_name, model_path = args.model, None
+
+    service = TranscriptionService(model_name, args.workers, args.threads, args.queue, model_path, args.convert, args.batch_ms)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service, args.request_path))
+    server.daemon_threads = True
+
+    print(f"whisper server listening at http://{args.host}:{args.port}{args.request_path}/inference "
+          f"({service.n_workers} workers x {service.n_threads} threads, queue {args.queue})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,310 @@
 import http.server
-import socketserver
+import email.utils
+import gzip
+import mimetypes
 import os
+import posixpath
+import re
+import threading
+import time
+import urllib.parse
 from pathlib import Path
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 SCRIPT_DIR = Path(__file__).parent.absolute()
 DIRECTORY = os.path.join(SCRIPT_DIR, "../build-em/bin")
 DIRECTORY = os.path.abspath(DIRECTORY)
 
+# files up to this size with a compressible type get gzip/brotli variants kept in memory
+COMPRESS_MAX_BYTES = 64 * 1024 * 1024
+COMPRESS_TYPES = ("text/", "application/javascript", "application/json", "application/wasm", "image/svg+xml")
+
+# how often the index of DIRECTORY is checked for changed files
+REFRESH_SECONDS = 1.0
+
+mimetypes.add_type("application/wasm", ".wasm")
+mimetypes.add_type("text/javascript", ".mjs")
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class Asset:
+    def __init__(self, path, st):
+        self.path = path
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.etag = '"%x-%x"' % (st.st_mtime_ns, st.st_size)
+        self.last_modified = email.utils.formatdate(st.st_mtime, usegmt=True)
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.variants = {}
+
+    def compress(self):
+        if self.size > COMPRESS_MAX_BYTES or not self.content_type.startswith(COMPRESS_TYPES):
+            return
+        with open(self.path, "rb") as f:
+            data = f.read()
+        variants = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants["br"] = brotli.compress(data)
+        # a variant that does not save anything is not worth the Vary
+        self.variants = {encoding: body for encoding, body in variants.items() if len(body) < self.size}
+
+    def tag(self, encoding=None):
+        # each representation needs its own entity tag
+        return self.etag if encoding is None else self.etag[:-1] + "-" + encoding + '"'
+
+    def fresh(self, st):
+        return st.st_size == self.size and st.st_mtime == self.mtime
+
+
+class AssetIndex:
+    # every file under the directory by URL path, so requests are resolved without stat calls
+    # and only the file being served is opened; a polling thread picks up added, changed and removed files
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = {}
+        self.dirs = set()
+        self.workers = {}
+        self.lock = threading.Lock()
+
+    def scan(self, path, url, files, dirs):
+        dirs.add(url)
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    self.scan(entry.path, url + entry.name + "/", files, dirs)
+                elif entry.is_file():
+                    st = entry.stat()
+                    asset = self.files.get(url + entry.name)
+                    if asset is None or not asset.fresh(st):
+                        asset = Asset(entry.path, st)
+                        asset.compress()
+                    files[url + entry.name] = asset
+            except OSError:
+                continue
+
+    def refresh(self):
+        # the watcher and request threads that saw a stale entry may refresh at the same time
+        with self.lock:
+            files = {}
+            dirs = set()
+            self.scan(self.directory, "/", files, dirs)
+            # worker scripts are requested relative to the page, they are all served from the top level
+            workers = {posixpath.basename(url): url for url in files if url.count("/") == 1 and url.endswith(".worker.js")}
+            changed = files.keys() != self.files.keys() or any(files[url] is not self.files[url] for url in files)
+            self.files, self.dirs, self.workers = files, dirs, workers
+            return changed
+
+    def watch(self, interval=REFRESH_SECONDS):
+        def run():
+            while True:
+                time.sleep(interval)
+                if self.refresh():
+                    print(f"Reindexed '{self.directory}': {len(self.files)} files")
+
+        threading.Thread(target=run, name="asset-index", daemon=True).start()
+
+    def lookup(self, url):
+        if ".worker.js" in url:
+            url = self.workers.get(posixpath.basename(url), url)
+        if url.endswith("/") and url in self.dirs:
+            url += "index.html"
+        return self.files.get(url)
+
+    def open(self, url):
+        # the index can be up to REFRESH_SECONDS behind the disk, so the opened file is checked
+        # against it and the headers always describe the body that is actually sent
+        for _ in range(2):
+            asset = self.lookup(url)
+            if asset is None:
+                return None, None
+            try:
+                f = open(asset.path, "rb")
+            except OSError:
+                f = None
+            else:
+                if asset.fresh(os.fstat(f.fileno())):
+                    return asset, f
+                f.close()
+            self.refresh()
+        return None, None
+
+
+index = AssetIndex(DIRECTORY)
+
+
+def parse_range(header, size):
+    # only single ranges, anything else is answered with the whole file
+    match = RANGE_RE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    start, end = match.group(1), match.group(2)
+    if start == "":
+        length = int(end)
+        # an empty file has no satisfiable range at all
+        if length == 0 or size == 0:
+            return ()
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return ()
+    return start, end
+
+
 class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=DIRECTORY, **kwargs)
 
     def do_GET(self):
-        # If requesting a worker file from any subdirectory
-        if '.worker.js' in self.path:
-            worker_file = os.path.basename(self.path)
-            worker_path = os.path.join(DIRECTORY, worker_file)
+        self.serve(send_body=True)
+
+    def do_HEAD(self):
+        self.serve(send_body=False)
+
+    def serve(self, send_body):
+        url = posixpath.normpath('/' + urllib.parse.unquote(urllib.parse.urlsplit(self.path).path).lstrip('/'))
+        if self.path.split('?', 1)[0].endswith('/') and url != '/':
+            url += '/'
+
+        asset = index.lookup(url)
+        if asset is None:
+            if url.rstrip('/') + '/' not in index.dirs:
+                self.send_error(404, "File not found")
+                return
+            # directory listings and redirects keep the stock behaviour
+            return super().do_GET() if send_body else super().do_HEAD()
+
+        asset, f = index.open(url)
+        if asset is None:
+            self.send_error(404, "File not found")
+            return
+        with f:
+            self.send_asset(asset, f, send_body)
 
-            if os.path.exists(worker_path):
-                self.path = '/' + worker_file
+    def send_asset(self, asset, f, send_body):
+        encoding = self.choose_encoding(asset)
+        if self.not_modified(asset):
+            self.send_response(304)
+            self.send_validators(asset, encoding)
+            self.end_headers()
+            return
 
-        return super().do_GET()
+        byte_range = None
+        if encoding is None and "Range" in self.headers and self.if_range_matches(asset):
+            byte_range = parse_range(self.headers["Range"], asset.size)
+            if byte_range == ():
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */%d" % asset.size)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+        if encoding is not None:
+            body = asset.variants[encoding]
+            self.send_response(200)
+            self.send_header("Content-Encoding", encoding)
+            length = len(body)
+        elif byte_range is not None:
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes %d-%d/%d" % (start, end, asset.size))
+            length = end - start + 1
+        else:
+            start = 0
+            self.send_response(200)
+            length = asset.size
+
+        self.send_header("Content-Type", asset.content_type)
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_validators(asset, encoding)
+        self.end_headers()
+
+        if not send_body:
+            return
+        if encoding is not None:
+            self.wfile.write(body)
+        else:
+            self.send_file(f, start, length)
+
+    def send_validators(self, asset, encoding=None):
+        if asset.variants:
+            self.send_header("Vary", "Accept-Encoding")
+        self.send_header("ETag", asset.tag(encoding))
+        self.send_header("Last-Modified", asset.last_modified)
+        # always revalidate, the validators make that a cheap 304
+        self.send_header("Cache-Control", "no-cache")
+
+    def not_modified(self, asset):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or any(asset.tag(encoding) in tags for encoding in [None, *asset.variants])
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+            return int(asset.mtime) <= since
+        return False
+
+    def if_range_matches(self, asset):
+        if_range = self.headers.get("If-Range")
+        return if_range is None or if_range.strip() in (asset.etag, asset.last_modified)
+
+    def choose_encoding(self, asset):
+        if not asset.variants or "Range" in self.headers:
+            return None
+        accepted = {}
+        for item in self.headers.get("Accept-Encoding", "").split(","):
+            name, _, params = item.strip().partition(";")
+            q = 1.0
+            if params.strip().startswith("q="):
+                try:
+                    q = float(params.strip()[2:])
+                except ValueError:
+                    q = 0.0
+            accepted[name.strip().lower()] = q
+        for encoding in ("br", "gzip"):
+            if encoding in asset.variants and accepted.get(encoding, 0) > 0:
+                return encoding
+        return None
+
+    def send_file(self, f, offset, count):
+        try:
+            # zero-copy from the page cache to the socket
+            while count > 0:
+                sent = os.sendfile(self.connection.fileno(), f.fileno(), offset, count)
+                if sent == 0:
+                    break
+                offset += sent
+                count -= sent
+        except (AttributeError, OSError) as e:
+            if isinstance(e, (BrokenPipeError, ConnectionResetError)):
+                raise
+            f.seek(offset)
+            while count > 0:
+                chunk = f.read(min(count, 1024 * 1024))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                count -= len(chunk)
+        if count > 0:
+            # truncated while it was sent, the client can only tell from the connection closing
+            self.close_connection = True
 
     def end_headers(self):
         # Add required headers for SharedArrayBuffer
@@ -31,9 +315,16 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
 
 PORT = 8000
 
-with socketserver.TCPServer(("", PORT), CustomHTTPRequestHandler) as httpd:
-    print(f"Serving directory '{DIRECTORY}' at http://localhost:{PORT}")
-    try:
-        httpd.serve_forever()
-    except KeyboardInterrupt:
-        print("\nServer stopped.")
+if __name__ == "__main__":
+    index.refresh()
+    index.watch()
+    compressed = sum(1 for asset in index.files.values() if asset.variants)
+    print(f"Indexed {len(index.files)} files, precompressed {compressed}" + ("" if brotli else " (gzip only, pip install brotli for br)"))
+
+    with http.server.ThreadingHTTPServer(("", PORT), CustomHTTPRequestHandler) as httpd:
+        httpd.daemon_threads = True
+        print(f"Serving directory '{DIRECTORY}' at http://localhost:{PORT}")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\nServer stopped.")
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+import server
+
+
+@pytest.mark.parametrize("header, size, expected", [
+    ("bytes=0-99", 1000, (0, 99)),
+    ("bytes=500-", 1000, (500, 999)),
+    ("bytes=900-2000", 1000, (900, 999)),
+    ("bytes=-100", 1000, (900, 999)),
+    ("bytes=-5000", 1000, (0, 999)),
+    (" bytes=0-0 ", 1000, (0, 0)),
+    # unsatisfiable, answered with 416
+    ("bytes=1000-", 1000, ()),
+    ("bytes=10-5", 1000, ()),
+    ("bytes=-0", 1000, ()),
+    ("bytes=0-", 0, ()),
+    ("bytes=-5", 0, ()),
+    # not a single byte range, answered with the whole file
+    ("bytes=-", 1000, None),
+    ("bytes=0-1,5-6", 1000, None),
+    ("items=0-1", 1000, None),
+])
+def test_parse_range(header, size, expected):
+    assert server.parse_range(header, size) == expected
+
+
+def test_index_open_checks_the_file_on_disk(tmp_path):
+    (tmp_path / "app.js").write_bytes(b"x" * 1000)
+    index = server.AssetIndex(str(tmp_path))
+    index.refresh()
+
+    asset, f = index.open("/app.js")
+    with f:
+        assert asset.size == 1000
+
+    # changed after the last refresh, the opened file and the asset must still agree
+    (tmp_path / "app.js").write_bytes(b"y" * 100)
+    os.utime(tmp_path / "app.js", ns=(0, 0))
+    asset, f = index.open("/app.js")
+    with f:
+        assert asset.size == os.fstat(f.fileno()).st_size == 100
+
+    os.remove(tmp_path / "app.js")
+    assert index.open("/app.js") == (None, None)
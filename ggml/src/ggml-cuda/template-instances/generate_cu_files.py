@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 
 from glob import glob
+import hashlib
+import json
 import os
 
+MANIFEST = "generated_files.json"
+
 TYPES_KV = ["GGML_TYPE_Q4_0", "GGML_TYPE_Q4_1", "GGML_TYPE_Q5_0", "GGML_TYPE_Q5_1", "GGML_TYPE_Q8_0", "GGML_TYPE_F16"]
 
 SOURCE_FATTN_VEC = """// This file has been autogenerated by generate_cu_files.py, do not edit manually.
@@ -47,29 +51,58 @@ def get_head_sizes(type_k, type_v):
     return [128]
 
 
-for filename in glob("*.cu"):
-    os.remove(filename)
+def render_sources():
+    sources = {}
 
-for vkq_size in [16, 32]:
-    for type_k in TYPES_KV:
-        for type_v in TYPES_KV:
-            for head_size in get_head_sizes(type_k, type_v):
-                with open(f"fattn-vec-f{vkq_size}-instance-hs{head_size}-{get_short_name(type_k)}-{get_short_name(type_v)}.cu", "w") as f:
-                    f.write(SOURCE_FATTN_VEC.format(vkq_size=vkq_size, head_size=head_size, type_k=type_k, type_v=type_v))
-
-for ncols in [8, 16, 32, 64, 128]:
-    for ncols2 in [1, 2, 4, 8]:
-        ncols1 = ncols // ncols2
-        if ncols == 128:
-            continue  # Too much register pressure.
-        with open(f"fattn-mma-f16-instance-ncols1_{ncols1}-ncols2_{ncols2}.cu", "w") as f:
-            f.write(SOURCE_FATTN_MMA_START)
+    for vkq_size in [16, 32]:
+        for type_k in TYPES_KV:
+            for type_v in TYPES_KV:
+                for head_size in get_head_sizes(type_k, type_v):
+                    filename = f"fattn-vec-f{vkq_size}-instance-hs{head_size}-{get_short_name(type_k)}-{get_short_name(type_v)}.cu"
+                    sources[filename] = SOURCE_FATTN_VEC.format(vkq_size=vkq_size, head_size=head_size, type_k=type_k, type_v=type_v)
+
+    for ncols in [8, 16, 32, 64, 128]:
+        for ncols2 in [1, 2, 4, 8]:
+            ncols1 = ncols // ncols2
+            if ncols == 128:
+                continue  # Too much register pressure.
+            source = SOURCE_FATTN_MMA_START
 
             for head_size in [64, 80, 96, 112, 128, 256]:
                 if ncols == 128 and head_size == 256:
                     continue  # Needs too much shared memory.
-                f.write(SOURCE_FATTN_MMA_CASE.format(ncols1=ncols1, ncols2=ncols2, head_size=head_size))
+                source += SOURCE_FATTN_MMA_CASE.format(ncols1=ncols1, ncols2=ncols2, head_size=head_size)
+            sources[f"fattn-mma-f16-instance-ncols1_{ncols1}-ncols2_{ncols2}.cu"] = source
+
+    for type in TYPES_MMQ:
+        sources[f"mmq-instance-{get_short_name(type)}.cu"] = SOURCE_MMQ.format(type=type)
+
+    return sources
+
+
+def write_if_changed(filename, content):
+    # files with unchanged content keep their mtime so the build does not recompile them
+    data = content.encode("utf-8")
+    try:
+        with open(filename, "rb") as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(filename, "wb") as f:
+        f.write(data)
+    return True
+
+
+sources = render_sources()
+
+written = [filename for filename, content in sorted(sources.items()) if write_if_changed(filename, content)]
+
+removed = sorted(set(glob("*.cu")) - set(sources))
+for filename in removed:
+    os.remove(filename)
+
+manifest = {filename: hashlib.sha256(content.encode("utf-8")).hexdigest() for filename, content in sorted(sources.items())}
+write_if_changed(MANIFEST, json.dumps({"generator": "generate_cu_files.py", "files": manifest}, indent=2) + "\n")
 
-for type in TYPES_MMQ:
-    with open(f"mmq-instance-{get_short_name(type)}.cu", "w") as f:
-        f.write(SOURCE_MMQ.format(type=type))
+print(f"{len(sources)} files: {len(written)} written, {len(removed)} removed, {len(sources) - len(written)} unchanged")
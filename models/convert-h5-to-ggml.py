@@ -21,9 +21,11 @@ import sys
 import struct
 import json
 import code
+import argparse
 import torch
 import numpy as np
 from pathlib import Path
+from ggml_io import GGMLWriter, prepare_tensor, FTYPES, GGML_TYPE_NAMES
 
 from transformers import WhisperForConditionalGeneration
 
@@ -72,13 +74,18 @@ def bytes_to_unicode():
     cs = [chr(n) for n in cs]
     return dict(zip(bs, cs))
 
-if len(sys.argv) < 4:
-    print("Usage: convert-h5-to-ggml.py dir_model path-to-whisper-repo dir-output [use-f32]\n")
-    sys.exit(1)
+parser = argparse.ArgumentParser(description="Convert a Hugging Face Whisper model to ggml format")
+parser.add_argument("dir_model", type=Path, help="Hugging Face model directory")
+parser.add_argument("dir_whisper", type=Path, help="path to the openai/whisper repo")
+parser.add_argument("dir_out", type=Path, help="output directory")
+parser.add_argument("use_f32", nargs="?", default=None, help="any value: write f32 instead of f16")
+parser.add_argument("--type", dest="ftype", choices=list(FTYPES.keys()), default=None,
+                    help="output type, quantized types are written directly (default: f16, f32 with use-f32)")
+args = parser.parse_args()
 
-dir_model   = Path(sys.argv[1])
-dir_whisper = Path(sys.argv[2])
-dir_out     = Path(sys.argv[3])
+dir_model   = args.dir_model
+dir_whisper = args.dir_whisper
+dir_out     = args.dir_out
 
 encoder = json.load((dir_model / "vocab.json").open("r", encoding="utf8"))
 encoder_added = json.load((dir_model / "added_tokens.json").open( "r", encoding="utf8"))
@@ -108,43 +115,33 @@ fname_out = dir_out / "ggml-model.bin"
 
 tokens = json.load(open(dir_tokenizer / "vocab.json", "r", encoding="utf8"))
 
-# use 16-bit or 32-bit floats
-use_f16 = True
-if len(sys.argv) > 4:
-    use_f16 = False
-    fname_out = dir_out / "ggml-model-f32.bin"
-
-fout = open(fname_out, "wb")
-
-fout.write(struct.pack("i", 0x67676d6c)) # magic: ggml in hex
-fout.write(struct.pack("i", hparams["vocab_size"]))
-fout.write(struct.pack("i", hparams["max_source_positions"]))
-fout.write(struct.pack("i", hparams["d_model"]))
-fout.write(struct.pack("i", hparams["encoder_attention_heads"]))
-fout.write(struct.pack("i", hparams["encoder_layers"]))
-fout.write(struct.pack("i", hparams["max_length"]))
-fout.write(struct.pack("i", hparams["d_model"]))
-fout.write(struct.pack("i", hparams["decoder_attention_heads"]))
-fout.write(struct.pack("i", hparams["decoder_layers"]))
-fout.write(struct.pack("i", hparams["num_mel_bins"]))
-fout.write(struct.pack("i", use_f16))
-
-fout.write(struct.pack("i", filters.shape[0]))
-fout.write(struct.pack("i", filters.shape[1]))
-for i in range(filters.shape[0]):
-    for j in range(filters.shape[1]):
-        fout.write(struct.pack("f", filters[i][j]))
+# use 16-bit or 32-bit floats, or quantize directly
+ftype = args.ftype or ("f32" if args.use_f32 is not None else "f16")
+if ftype != "f16":
+    fname_out = dir_out / f"ggml-model-{ftype}.bin"
+
+fout = GGMLWriter(fname_out)
+
+fout.write_header([
+    hparams["vocab_size"],
+    hparams["max_source_positions"],
+    hparams["d_model"],
+    hparams["encoder_attention_heads"],
+    hparams["encoder_layers"],
+    hparams["max_length"],
+    hparams["d_model"],
+    hparams["decoder_attention_heads"],
+    hparams["decoder_layers"],
+    hparams["num_mel_bins"],
+], FTYPES[ftype][0])
+
+fout.write_filters(filters.numpy())
 
 byte_encoder = bytes_to_unicode()
 byte_decoder = {v:k for k, v in byte_encoder.items()}
 
-fout.write(struct.pack("i", len(tokens)))
-
 tokens = sorted(tokens.items(), key=lambda x: x[1])
-for key in tokens:
-    text = bytearray([byte_decoder[c] for c in key[0]])
-    fout.write(struct.pack("i", len(text)))
-    fout.write(text)
+fout.write_vocab(bytes([byte_decoder[c] for c in key[0]]) for key in tokens)
 
 list_vars = model.state_dict()
 for name in list_vars.keys():
@@ -173,44 +170,16 @@ for name in list_vars.keys():
         name = ".".join(nn)
         name = conv_map[name] if name in conv_map else name
 
-    print(src, ' -> ', name)
     data = list_vars[src].squeeze().numpy()
     data = data.astype(np.float16)
 
-    # reshape conv bias from [n] to [n, 1]
-    if name in ["encoder.conv1.bias", "encoder.conv2.bias"]:
-        data = data.reshape(data.shape[0], 1)
-        print("  Reshaped variable: " , name , " to shape: ", data.shape)
-
-    n_dims = len(data.shape)
-    print(name, n_dims, data.shape)
-
     # looks like the whisper models are in f16 by default
     # so we need to convert the small tensors to f32 until we fully support f16 in ggml
-    # ftype == 0 -> float32, ftype == 1 -> float16
-    ftype = 1
-    if use_f16:
-        if n_dims < 2 or \
-                name == "encoder.conv1.bias"   or \
-                name == "encoder.conv2.bias"   or \
-                name == "encoder.positional_embedding" or \
-                name == "decoder.positional_embedding":
-            print("  Converting to float32")
-            data = data.astype(np.float32)
-            ftype = 0
-    else:
-        data = data.astype(np.float32)
-        ftype = 0
-
-    # header
-    str_ = name.encode('utf-8')
-    fout.write(struct.pack("iii", n_dims, len(str_), ftype))
-    for i in range(n_dims):
-        fout.write(struct.pack("i", data.shape[n_dims - 1 - i]))
-    fout.write(str_)
-
-    # data
-    data.tofile(fout)
+    # the 2-d weights are block-quantized when a quantized type is requested
+    data, ttype = prepare_tensor(name, data, ftype)
+    print(src, ' -> ', name, data.shape, GGML_TYPE_NAMES[ttype])
+
+    fout.write_tensor(name, data, ttype)
 
 fout.close()
 
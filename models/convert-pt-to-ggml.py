@@ -2,6 +2,9 @@
 #
 # Usage: python convert-pt-to-ggml.py ~/.cache/whisper/medium.pt ~/path/to/repo/whisper/ ./models/whisper-medium
 #
+# Add --type q8_0 (or q5_0, q5_1, q4_0) to write a quantized model directly, without a separate whisper-quantize pass.
+# Add --variants f32,f16,q8_0,q5_0 to write several of them from a single read of the checkpoint.
+#
 # You need to clone the original repo in ~/path/to/repo/whisper/
 #
 #  git clone https://github.com/openai/whisper ~/path/to/repo/whisper/
@@ -15,9 +18,12 @@
 # See the original repo for more details.
 #
 # This script loads the specified model and whisper assets and saves them in ggml format.
-# The output is a single binary file containing the following information:
+# Each requested type (--type, or every entry of --variants) is written to its own file in
+# the output directory: ggml-model.bin for f16, ggml-model-<type>.bin for f32, q8_0, q5_0,
+# q5_1 and q4_0. Each file contains the following information:
 #
-#  - hparams
+#  - hparams, with the ftype of the file (0 = f32, 1 = f16, for the quantized types
+#    GGML_QNT_VERSION * GGML_QNT_VERSION_FACTOR + the ggml ftype, as whisper-quantize writes)
 #  - mel filters
 #  - tokenizer vocab
 #  - model variables
@@ -26,9 +32,14 @@
 #
 #  - Number of dimensions (int)
 #  - Name length (int)
+#  - Tensor type (int), the ggml type of the data
 #  - Dimensions (int[n_dims])
 #  - Name (char[name_length])
-#  - Data (float[n_dims])
+#  - Data, in the tensor type:
+#      1-d tensors, the conv biases and the positional embeddings are always f32,
+#      2-d tensors whose rows are a multiple of the block size are quantized for the
+#      quantized types (blocks of 32 values with their scales), the rest is f16
+#      (or f32 for --type f32)
 #
 
 import io
@@ -37,10 +48,23 @@ import sys
 import struct
 import json
 import code
+import argparse
 import torch
 import numpy as np
 import base64
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from ggml_io import GGMLWriter, prepare_tensor, FTYPES, GGML_TYPE_NAMES
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# tensors prepared ahead of the writer are bounded by size, not by --jobs, so the peak memory
+# stays the same on any core count; the tensor being written is always allowed through
+MAX_PENDING_BYTES = 256 * 1024 * 1024
 #from transformers import GPTJForCausalLM
 #from transformers import GPT2TokenizerFast
 
@@ -190,153 +214,202 @@ def bytes_to_unicode():
     return dict(zip(bs, cs))
 
 
-if len(sys.argv) < 4:
-    print("Usage: convert-pt-to-ggml.py model.pt path-to-whisper-repo dir-output [use-f32]\n")
-    sys.exit(1)
+def load_checkpoint(fname, mmap=True):
+    # with mmap=True the tensors stay backed by the checkpoint file and are only paged in when converted
+    # it needs torch >= 2.1 and a zipfile checkpoint, otherwise fall back to loading everything
+    if mmap:
+        try:
+            return torch.load(fname, map_location="cpu", mmap=True)
+        except (TypeError, RuntimeError) as e:
+            print("Warning: memory-mapped loading not available, loading the full checkpoint:", e)
+    return torch.load(fname, map_location="cpu")
+
+
+def peak_rss_mib():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def output_name(dir_out, ftype):
+    # f16 keeps the historical ggml-model.bin name
+    if ftype == "f16":
+        return dir_out / "ggml-model.bin"
+    return dir_out / f"ggml-model-{ftype}.bin"
+
+
+def parse_variants(value):
+    variants = [v.strip() for v in value.split(",") if v.strip()]
+    for v in variants:
+        if v not in FTYPES:
+            raise argparse.ArgumentTypeError(f"unknown type '{v}', expected one of: {', '.join(FTYPES)}")
+    if not variants or len(set(variants)) != len(variants):
+        raise argparse.ArgumentTypeError("expected a comma-separated list of distinct types")
+    return variants
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a Whisper PyTorch checkpoint to ggml format")
+    parser.add_argument("fname_inp", type=Path, help="model.pt")
+    parser.add_argument("dir_whisper", type=Path, help="path to the openai/whisper repo")
+    parser.add_argument("dir_out", type=Path, help="output directory")
+    parser.add_argument("use_f32", nargs="?", default=None, help="any value: write f32 instead of f16")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--type", dest="ftype", choices=list(FTYPES.keys()), default=None,
+                       help="output type, quantized types are written directly (default: f16, f32 with use-f32)")
+    group.add_argument("--variants", type=parse_variants, default=None,
+                       help="comma-separated output types written from a single pass over the checkpoint, e.g. f32,f16,q8_0,q5_0")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="worker processes used to quantize tensors (default: cpu count, 1 disables the pool)")
+    parser.add_argument("--no-mmap", action="store_true", help="load the whole checkpoint into memory instead of memory-mapping it")
+    args = parser.parse_args()
+
+    fname_inp   = args.fname_inp
+    dir_whisper = args.dir_whisper
+    dir_out     = args.dir_out
+
+    # try to load PyTorch binary data
+    try:
+        checkpoint = load_checkpoint(fname_inp, mmap=not args.no_mmap)
+    except Exception:
+        print("Error: failed to load PyTorch model file:" , fname_inp)
+        sys.exit(1)
 
-fname_inp   = Path(sys.argv[1])
-dir_whisper = Path(sys.argv[2])
-dir_out     = Path(sys.argv[3])
+    hparams = checkpoint["dims"]
+    print("hparams:", hparams)
 
-# try to load PyTorch binary data
-try:
-    model_bytes = open(fname_inp, "rb").read()
-    with io.BytesIO(model_bytes) as fp:
-        checkpoint = torch.load(fp, map_location="cpu")
-except Exception:
-    print("Error: failed to load PyTorch model file:" , fname_inp)
-    sys.exit(1)
-
-hparams = checkpoint["dims"]
-print("hparams:", hparams)
-
-list_vars = checkpoint["model_state_dict"]
-
-#print(list_vars['encoder.positional_embedding'])
-#print(list_vars['encoder.conv1.weight'])
-#print(list_vars['encoder.conv1.weight'].shape)
-
-# load mel filters
-n_mels = hparams["n_mels"]
-with np.load(dir_whisper / "whisper" / "assets" / "mel_filters.npz") as f:
-    filters = torch.from_numpy(f[f"mel_{n_mels}"])
-    #print (filters)
-
-#code.interact(local=locals())
-
-# load tokenizer
-# for backwards compatibility, also check for older hf_transformers format tokenizer files
-# old format: dir_whisper/whisper/assets/[multilingual/gpt2]/vocab.json
-# new format: dir_whisper/whisper/assets/[multilingual/gpt2].tiktoken
-multilingual = hparams["n_vocab"] >= 51865
-tokenizer = dir_whisper / "whisper" / "assets" / (multilingual and "multilingual.tiktoken" or "gpt2.tiktoken")
-tokenizer_type = "tiktoken"
-if not tokenizer.is_file():
-    tokenizer = dir_whisper / "whisper" / "assets" / (multilingual and "multilingual" or "gpt2") / "vocab.json"
-    tokenizer_type = "hf_transformers"
-    if not tokenizer.is_file():
-        print("Error: failed to find either tiktoken or hf_transformers tokenizer file:", tokenizer)
-        sys.exit(1)
+    list_vars = checkpoint["model_state_dict"]
+
+    #print(list_vars['encoder.positional_embedding'])
+    #print(list_vars['encoder.conv1.weight'])
+    #print(list_vars['encoder.conv1.weight'].shape)
 
-byte_encoder = bytes_to_unicode()
-byte_decoder = {v:k for k, v in byte_encoder.items()}
-
-if tokenizer_type == "tiktoken":
-    with open(tokenizer, "rb") as f:
-        contents = f.read()
-        tokens = {base64.b64decode(token): int(rank) for token, rank in (line.split() for line in contents.splitlines() if line)}
-elif tokenizer_type == "hf_transformers":
-    with open(tokenizer, "r", encoding="utf8") as f:
-        _tokens_raw = json.load(f)
-        if '<|endoftext|>' in _tokens_raw:
-            # ensures exact same model as tokenizer_type == tiktoken
-            # details: https://github.com/ggerganov/whisper.cpp/pull/725
-            del _tokens_raw['<|endoftext|>']
-        tokens = {bytes([byte_decoder[c] for c in token]): int(idx) for token, idx in _tokens_raw.items()}
-
-# output in the same directory as the model
-fname_out = dir_out / "ggml-model.bin"
-
-# use 16-bit or 32-bit floats
-use_f16 = True
-if len(sys.argv) > 4:
-    use_f16 = False
-    fname_out = dir_out / "ggml-model-f32.bin"
-
-fout = fname_out.open("wb")
-
-fout.write(struct.pack("i", 0x67676d6c)) # magic: ggml in hex
-fout.write(struct.pack("i", hparams["n_vocab"]))
-fout.write(struct.pack("i", hparams["n_audio_ctx"]))
-fout.write(struct.pack("i", hparams["n_audio_state"]))
-fout.write(struct.pack("i", hparams["n_audio_head"]))
-fout.write(struct.pack("i", hparams["n_audio_layer"]))
-fout.write(struct.pack("i", hparams["n_text_ctx"]))
-fout.write(struct.pack("i", hparams["n_text_state"]))
-fout.write(struct.pack("i", hparams["n_text_head"]))
-fout.write(struct.pack("i", hparams["n_text_layer"]))
-fout.write(struct.pack("i", hparams["n_mels"]))
-fout.write(struct.pack("i", use_f16))
-
-# write mel filters
-fout.write(struct.pack("i", filters.shape[0]))
-fout.write(struct.pack("i", filters.shape[1]))
-for i in range(filters.shape[0]):
-    for j in range(filters.shape[1]):
-        fout.write(struct.pack("f", filters[i][j]))
-
-# write tokenizer
-fout.write(struct.pack("i", len(tokens)))
-
-for key in tokens:
-    fout.write(struct.pack("i", len(key)))
-    fout.write(key)
-
-for name in list_vars.keys():
-    data = list_vars[name].squeeze().numpy()
-    print("Processing variable: " , name ,  " with shape: ", data.shape)
-
-    # reshape conv bias from [n] to [n, 1]
-    if name in ["encoder.conv1.bias", "encoder.conv2.bias"]:
-        data = data.reshape(data.shape[0], 1)
-        print(f"  Reshaped variable: {name} to shape: ", data.shape)
-
-    n_dims = len(data.shape)
-
-    # looks like the whisper models are in f16 by default
-    # so we need to convert the small tensors to f32 until we fully support f16 in ggml
-    # ftype == 0 -> float32, ftype == 1 -> float16
-    ftype = 1
-    if use_f16:
-        if n_dims < 2 or \
-                name == "encoder.conv1.bias"   or \
-                name == "encoder.conv2.bias"   or \
-                name == "encoder.positional_embedding" or \
-                name == "decoder.positional_embedding":
-            print("  Converting to float32")
-            data = data.astype(np.float32)
-            ftype = 0
-    else:
-        data = data.astype(np.float32)
-        ftype = 0
-
-    #if name.startswith("encoder"):
-    #    if name.endswith("mlp.0.weight") or \
-    #       name.endswith("mlp.2.weight"):
-    #        print("  Transposing")
-    #        data = data.transpose()
-
-    # header
-    str_ = name.encode('utf-8')
-    fout.write(struct.pack("iii", n_dims, len(str_), ftype))
-    for i in range(n_dims):
-        fout.write(struct.pack("i", data.shape[n_dims - 1 - i]))
-    fout.write(str_)
-
-    # data
-    data.tofile(fout)
-
-fout.close()
-
-print("Done. Output file: " , fname_out)
-print("")
+    # load mel filters
+    n_mels = hparams["n_mels"]
+    with np.load(dir_whisper / "whisper" / "assets" / "mel_filters.npz") as f:
+        filters = torch.from_numpy(f[f"mel_{n_mels}"])
+        #print (filters)
+
+    #code.interact(local=locals())
+
+    # load tokenizer
+    # for backwards compatibility, also check for older hf_transformers format tokenizer files
+    # old format: dir_whisper/whisper/assets/[multilingual/gpt2]/vocab.json
+    # new format: dir_whisper/whisper/assets/[multilingual/gpt2].tiktoken
+    multilingual = hparams["n_vocab"] >= 51865
+    tokenizer = dir_whisper / "whisper" / "assets" / (multilingual and "multilingual.tiktoken" or "gpt2.tiktoken")
+    tokenizer_type = "tiktoken"
+    if not tokenizer.is_file():
+        tokenizer = dir_whisper / "whisper" / "assets" / (multilingual and "multilingual" or "gpt2") / "vocab.json"
+        tokenizer_type = "hf_transformers"
+        if not tokenizer.is_file():
+            print("Error: failed to find either tiktoken or hf_transformers tokenizer file:", tokenizer)
+            sys.exit(1)
+
+    byte_encoder = bytes_to_unicode()
+    byte_decoder = {v:k for k, v in byte_encoder.items()}
+
+    if tokenizer_type == "tiktoken":
+        with open(tokenizer, "rb") as f:
+            contents = f.read()
+            tokens = {base64.b64decode(token): int(rank) for token, rank in (line.split() for line in contents.splitlines() if line)}
+    elif tokenizer_type == "hf_transformers":
+        with open(tokenizer, "r", encoding="utf8") as f:
+            _tokens_raw = json.load(f)
+            if '<|endoftext|>' in _tokens_raw:
+                # ensures exact same model as tokenizer_type == tiktoken
+                # details: https://github.com/ggerganov/whisper.cpp/pull/725
+                del _tokens_raw['<|endoftext|>']
+            tokens = {bytes([byte_decoder[c] for c in token]): int(idx) for token, idx in _tokens_raw.items()}
+
+    # use 16-bit or 32-bit floats, or quantize directly
+    # with --variants, every requested type gets its own output file written from the same pass
+    variants = args.variants or [args.ftype or ("f32" if args.use_f32 is not None else "f16")]
+
+    writers = {}
+    for ftype in variants:
+        fout = GGMLWriter(output_name(dir_out, ftype))
+        fout.write_header([
+            hparams["n_vocab"],
+            hparams["n_audio_ctx"],
+            hparams["n_audio_state"],
+            hparams["n_audio_head"],
+            hparams["n_audio_layer"],
+            hparams["n_text_ctx"],
+            hparams["n_text_state"],
+            hparams["n_text_head"],
+            hparams["n_text_layer"],
+            hparams["n_mels"],
+        ], FTYPES[ftype][0])
+
+        # write mel filters
+        fout.write_filters(filters.numpy())
+
+        # write tokenizer
+        fout.write_vocab(tokens.keys())
+
+        writers[ftype] = fout
+
+    # the quantization is the CPU-heavy part, so the quantized variants are prepared in worker
+    # processes while the next tensors are read, and written back in checkpoint order
+    quantized = [v for v in variants if v not in ("f32", "f16")]
+    executor = ProcessPoolExecutor(max_workers=args.jobs) if quantized and args.jobs > 1 else None
+    pending = deque()
+    pending_bytes = 0
+
+    def write_pending():
+        nonlocal pending_bytes
+        name, results, nbytes = pending.popleft()
+        pending_bytes -= nbytes
+        for ftype, result in results.items():
+            data, ttype = result.result() if executor is not None and ftype in quantized else result
+            print("Processing variable: " , name ,  " with shape: ", data.shape, ", type: ", GGML_TYPE_NAMES[ttype], ", output: ", ftype)
+            writers[ftype].write_tensor(name, data, ttype)
+
+    try:
+        # convert one tensor at a time and drop it right after it is written to bound the peak memory
+        for name in list(list_vars.keys()):
+            data = list_vars.pop(name).squeeze().numpy()
+
+            # looks like the whisper models are in f16 by default
+            # so we need to convert the small tensors to f32 until we fully support f16 in ggml
+            # the 2-d weights are block-quantized when a quantized type is requested
+            results = {}
+            for ftype in variants:
+                if executor is not None and ftype in quantized:
+                    results[ftype] = executor.submit(prepare_tensor, name, data, ftype)
+                else:
+                    results[ftype] = prepare_tensor(name, data, ftype)
+
+            #if name.startswith("encoder"):
+            #    if name.endswith("mlp.0.weight") or \
+            #       name.endswith("mlp.2.weight"):
+            #        print("  Transposing")
+            #        data = data.transpose()
+
+            # every variant holds at most an f32 copy of the tensor until it is written
+            nbytes = data.size * 4 * len(variants)
+            pending.append((name, results, nbytes))
+            pending_bytes += nbytes
+            del data, results
+            while len(pending) > 1 and (len(pending) > args.jobs or pending_bytes > MAX_PENDING_BYTES):
+                write_pending()
+
+        while pending:
+            write_pending()
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    for ftype, fout in writers.items():
+        fout.close()
+        print("Done. Output file: " , fout.fname_out)
+    if peak_rss_mib() is not None:
+        print(f"Peak RSS: {peak_rss_mib():.1f} MiB")
+    print("")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,525 @@
+# Helpers for reading and writing whisper models in ggml format
+#
+# The layout of a ggml model file is:
+#
+#  - magic (int, 0x67676d6c)
+#  - hparams (int[11]): n_vocab, n_audio_ctx, n_audio_state, n_audio_head, n_audio_layer,
+#                       n_text_ctx, n_text_state, n_text_head, n_text_layer, n_mels, ftype
+#  - mel filters: n_mel (int), n_fft (int), data (float[n_mel * n_fft])
+#  - tokenizer vocab: n_vocab (int), then for each token: length (int), bytes (char[length])
+#  - model variables, for each variable:
+#     - Number of dimensions (int)
+#     - Name length (int)
+#     - Type (int), ggml_type of the data
+#     - Dimensions (int[n_dims]), in reverse order
+#     - Name (char[name_length])
+#     - Data
+#
+# All values are little-endian.
+#
+# The format has no tensor directory, so a sidecar index <model>.bin.index.json is written next to
+# every converted model. It records the name, type, shape and byte offset of each tensor and is
+# only trusted while the size and mtime of the model file match. It can be (re)built for existing
+# files with:
+#
+#   python models/ggml_io.py index models/ggml-base.en.bin
+#
+
+import os
+import sys
+import json
+import struct
+import argparse
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+GGML_FILE_MAGIC = 0x67676d6c
+
+# ggml_type values used in whisper model files
+GGML_TYPE_F32  = 0
+GGML_TYPE_F16  = 1
+GGML_TYPE_Q4_0 = 2
+GGML_TYPE_Q4_1 = 3
+GGML_TYPE_Q5_0 = 6
+GGML_TYPE_Q5_1 = 7
+GGML_TYPE_Q8_0 = 8
+
+GGML_TYPE_NAMES = {
+    GGML_TYPE_F32:  "f32",
+    GGML_TYPE_F16:  "f16",
+    GGML_TYPE_Q4_0: "q4_0",
+    GGML_TYPE_Q4_1: "q4_1",
+    GGML_TYPE_Q5_0: "q5_0",
+    GGML_TYPE_Q5_1: "q5_1",
+    GGML_TYPE_Q8_0: "q8_0",
+}
+
+# (elements per block, bytes per block)
+GGML_TYPE_SIZES = {
+    GGML_TYPE_F32:  (1,  4),
+    GGML_TYPE_F16:  (1,  2),
+    GGML_TYPE_Q4_0: (32, 18),
+    GGML_TYPE_Q4_1: (32, 20),
+    GGML_TYPE_Q5_0: (32, 22),
+    GGML_TYPE_Q5_1: (32, 24),
+    GGML_TYPE_Q8_0: (32, 34),
+}
+
+# quantized models store GGML_QNT_VERSION * GGML_QNT_VERSION_FACTOR + ggml_ftype in the header
+GGML_QNT_VERSION        = 2
+GGML_QNT_VERSION_FACTOR = 1000
+
+# output types of the converters: name -> (header ftype, ggml type of the quantized tensors)
+FTYPES = {
+    "f32":  (0, GGML_TYPE_F32),
+    "f16":  (1, GGML_TYPE_F16),
+    "q4_0": (GGML_QNT_VERSION * GGML_QNT_VERSION_FACTOR + 2, GGML_TYPE_Q4_0),
+    "q8_0": (GGML_QNT_VERSION * GGML_QNT_VERSION_FACTOR + 7, GGML_TYPE_Q8_0),
+    "q5_0": (GGML_QNT_VERSION * GGML_QNT_VERSION_FACTOR + 8, GGML_TYPE_Q5_0),
+    "q5_1": (GGML_QNT_VERSION * GGML_QNT_VERSION_FACTOR + 9, GGML_TYPE_Q5_1),
+}
+
+HPARAMS = [
+    "n_vocab",
+    "n_audio_ctx",
+    "n_audio_state",
+    "n_audio_head",
+    "n_audio_layer",
+    "n_text_ctx",
+    "n_text_state",
+    "n_text_head",
+    "n_text_layer",
+    "n_mels",
+    "ftype",
+]
+
+# small tensors that are always stored as f32
+F32_TENSORS = [
+    "encoder.conv1.bias",
+    "encoder.conv2.bias",
+    "encoder.positional_embedding",
+    "decoder.positional_embedding",
+]
+
+WRITE_BUFFER_SIZE = 16 * 1024 * 1024
+
+
+def _fp16_bytes(x):
+    return x.astype(np.float16).view(np.uint8).reshape(-1, 2)
+
+
+def _round_away(x):
+    # C roundf(), np.round() would round halves to even
+    return np.trunc(x + np.copysign(np.float32(0.5), x))
+
+
+def _inverse(d):
+    return np.divide(np.float32(1.0), d, out=np.zeros_like(d), where=d != 0)
+
+
+def _pack_nibbles(xi0, xi1):
+    return (xi0 & 0x0F) | ((xi1 & 0x0F) << 4)
+
+
+def _pack_high_bits(xi0, xi1):
+    # 5th bit of each quant, bit j for the first half of the block and bit j + 16 for the second
+    shifts = np.arange(16, dtype=np.uint32)
+    qh  = (((xi0.astype(np.uint32) & 0x10) >> 4) << shifts).sum(axis=1, dtype=np.uint32)
+    qh |= (((xi1.astype(np.uint32) & 0x10) >> 4) << (shifts + 16)).sum(axis=1, dtype=np.uint32)
+    return qh.astype("<u4").view(np.uint8).reshape(-1, 4)
+
+
+def _absmax_signed(blocks):
+    # value with the largest magnitude, keeping its sign (first one on ties)
+    idx = np.abs(blocks).argmax(axis=1)
+    return blocks[np.arange(blocks.shape[0]), idx][:, None]
+
+
+def quantize_q4_0(blocks):
+    d  = _absmax_signed(blocks) / np.float32(-8)
+    id = _inverse(d)
+    xi0 = np.minimum(15, (blocks[:, :16] * id + np.float32(8.5)).astype(np.int8)).astype(np.uint8)
+    xi1 = np.minimum(15, (blocks[:, 16:] * id + np.float32(8.5)).astype(np.int8)).astype(np.uint8)
+    return np.hstack([_fp16_bytes(d), _pack_nibbles(xi0, xi1)])
+
+
+def quantize_q5_0(blocks):
+    d  = _absmax_signed(blocks) / np.float32(-16)
+    id = _inverse(d)
+    xi0 = np.minimum(31, (blocks[:, :16] * id + np.float32(16.5)).astype(np.int8)).astype(np.uint8)
+    xi1 = np.minimum(31, (blocks[:, 16:] * id + np.float32(16.5)).astype(np.int8)).astype(np.uint8)
+    return np.hstack([_fp16_bytes(d), _pack_high_bits(xi0, xi1), _pack_nibbles(xi0, xi1)])
+
+
+def quantize_q5_1(blocks):
+    vmin = blocks.min(axis=1, keepdims=True)
+    vmax = blocks.max(axis=1, keepdims=True)
+    d  = (vmax - vmin) / np.float32(31)
+    id = _inverse(d)
+    xi0 = ((blocks[:, :16] - vmin) * id + np.float32(0.5)).astype(np.uint8)
+    xi1 = ((blocks[:, 16:] - vmin) * id + np.float32(0.5)).astype(np.uint8)
+    return np.hstack([_fp16_bytes(d), _fp16_bytes(vmin), _pack_high_bits(xi0, xi1), _pack_nibbles(xi0, xi1)])
+
+
+def quantize_q8_0(blocks):
+    d  = np.abs(blocks).max(axis=1, keepdims=True) / np.float32(127)
+    id = _inverse(d)
+    qs = _round_away(blocks * id).astype(np.int8).view(np.uint8)
+    return np.hstack([_fp16_bytes(d), qs])
+
+
+QUANTIZERS = {
+    GGML_TYPE_Q4_0: quantize_q4_0,
+    GGML_TYPE_Q5_0: quantize_q5_0,
+    GGML_TYPE_Q5_1: quantize_q5_1,
+    GGML_TYPE_Q8_0: quantize_q8_0,
+}
+
+
+def quantize(data, ttype):
+    """
+    Quantizes a 2-d tensor to ggml blocks, matching the reference quantizers
+    in ggml-quants.c that whisper-quantize uses.
+
+    Returns a uint8 array with one row of blocks per tensor row.
+    """
+    block_elems, block_bytes = GGML_TYPE_SIZES[ttype]
+    blocks = np.ascontiguousarray(data, dtype=np.float32).reshape(-1, block_elems)
+    return QUANTIZERS[ttype](blocks).reshape(data.shape[0], -1)
+
+
+def prepare_tensor(name, data, ftype="f16"):
+    """
+    Applies the whisper.cpp storage conventions to a squeezed tensor.
+
+    The conv biases are reshaped from [n] to [n, 1], and 1-d tensors plus the
+    tensors in F32_TENSORS are kept in f32 because ggml expects them that way.
+    For the quantized ftypes, the remaining 2-d tensors with rows that are a
+    multiple of the block size are quantized, like whisper-quantize does, and
+    the other tensors are stored as f16.
+
+    Returns the (possibly converted) data and its ggml type.
+    """
+    # reshape conv bias from [n] to [n, 1]
+    if name in ["encoder.conv1.bias", "encoder.conv2.bias"]:
+        data = data.reshape(data.shape[0], 1)
+
+    if ftype == "f32" or data.ndim < 2 or name in F32_TENSORS:
+        return data.astype(np.float32, copy=False), GGML_TYPE_F32
+
+    data = data.astype(np.float16, copy=False)
+    ttype = FTYPES[ftype][1]
+    if ttype in QUANTIZERS and data.ndim == 2 and data.shape[1] % GGML_TYPE_SIZES[ttype][0] == 0:
+        return quantize(data.astype(np.float32), ttype), ttype
+
+    return data, GGML_TYPE_F16
+
+
+class GGMLWriter:
+    """
+    Buffered writer for ggml model files.
+
+    Everything goes through one large write buffer, array data is written
+    straight from the NumPy buffers, and the file is fsync'ed once on close().
+    """
+
+    def __init__(self, fname_out, buffer_size=WRITE_BUFFER_SIZE, index=True):
+        self.fname_out = fname_out
+        self.fout = open(fname_out, "wb", buffering=buffer_size)
+        self.index = index
+        self.tensors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write_header(self, hparams, ftype):
+        """
+        Writes the magic and the hparams.
+
+        hparams is the list of the 10 model dimensions in file order, see the
+        top of this file. ftype is written as the 11th value.
+        """
+        header = bytearray(4 * 12)
+        struct.pack_into("<12i", header, 0, GGML_FILE_MAGIC, *hparams, ftype)
+        self.fout.write(header)
+
+    def write_filters(self, filters):
+        filters = np.ascontiguousarray(filters, dtype="<f4")
+        self.fout.write(struct.pack("<ii", filters.shape[0], filters.shape[1]))
+        self.fout.write(filters.tobytes())
+
+    def write_vocab(self, tokens):
+        tokens = list(tokens)
+        parts = [struct.pack("<i", len(tokens))]
+        for token in tokens:
+            parts.append(struct.pack("<i", len(token)))
+            parts.append(bytes(token))
+        self.fout.write(b"".join(parts))
+
+    def write_tensor(self, name, data, ttype):
+        """
+        Writes one model variable, as returned by prepare_tensor().
+
+        data must already have the dtype matching ttype, quantized tensors
+        are uint8 arrays with one row of blocks per tensor row.
+        """
+        data = np.ascontiguousarray(data)
+        name_bytes = name.encode("utf-8")
+        shape = data.shape
+        if ttype not in (GGML_TYPE_F32, GGML_TYPE_F16):
+            block_elems, block_bytes = GGML_TYPE_SIZES[ttype]
+            shape = shape[:-1] + (shape[-1] // block_bytes * block_elems,)
+        n_dims = len(shape)
+        header = struct.pack(f"<iii{n_dims}i", n_dims, len(name_bytes), ttype, *reversed(shape))
+        self.fout.write(header)
+        self.fout.write(name_bytes)
+        offset = self.fout.tell()
+        self.fout.write(memoryview(data).cast("B"))
+        self.tensors.append(TensorInfo(name, ttype, shape, offset, data.nbytes))
+
+    def close(self):
+        if self.fout.closed:
+            return
+        self.fout.flush()
+        os.fsync(self.fout.fileno())
+        self.fout.close()
+        if self.index:
+            write_index(self.fname_out, self.tensors)
+
+
+# shape is in NumPy order, i.e. the reverse of the dimensions stored in the file
+TensorInfo = namedtuple("TensorInfo", ["name", "ttype", "shape", "offset", "nbytes"])
+
+
+def tensor_nbytes(ttype, shape):
+    if ttype not in GGML_TYPE_SIZES:
+        raise ValueError(f"unsupported ggml type {ttype}")
+    block_elems, block_bytes = GGML_TYPE_SIZES[ttype]
+    return int(np.prod(shape, dtype=np.int64)) // block_elems * block_bytes
+
+
+def index_path(fname):
+    return f"{fname}.index.json"
+
+
+def write_index(fname, tensors):
+    """
+    Writes the sidecar index for a model file from a list of TensorInfo.
+    """
+    st = os.stat(fname)
+    index = {
+        "version":  1,
+        "size":     st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "tensors":  [
+            {
+                "name":   t.name,
+                "type":   GGML_TYPE_NAMES.get(t.ttype, str(t.ttype)),
+                "ttype":  t.ttype,
+                "shape":  list(t.shape),
+                "offset": t.offset,
+                "nbytes": t.nbytes,
+            }
+            for t in tensors
+        ],
+    }
+    tmp = index_path(fname) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp, index_path(fname))
+
+
+def load_index(fname):
+    """
+    Returns the tensor table from the sidecar index as an OrderedDict of
+    TensorInfo, or None if there is no index or it is stale.
+    """
+    try:
+        with open(index_path(fname), "r") as f:
+            index = json.load(f)
+        st = os.stat(fname)
+    except (OSError, ValueError):
+        return None
+
+    if index.get("version") != 1 or index.get("size") != st.st_size or index.get("mtime_ns") != st.st_mtime_ns:
+        return None
+
+    return OrderedDict(
+        (t["name"], TensorInfo(t["name"], t["ttype"], tuple(t["shape"]), t["offset"], t["nbytes"]))
+        for t in index["tensors"]
+    )
+
+
+def build_index(fname):
+    """
+    Walks an existing model file and writes its sidecar index.
+    """
+    reader = GGMLModelReader(fname, use_index=False)
+    tensors = list(reader.tensors.values())
+    reader.close()
+    write_index(fname, tensors)
+    return tensors
+
+
+def read_tensor(fname, name):
+    """
+    Reads a single tensor with one seek and read, using the sidecar index.
+
+    The index is built first if it is missing or stale.
+    """
+    tensors = load_index(fname)
+    if tensors is None:
+        tensors = OrderedDict((t.name, t) for t in build_index(fname))
+    info = tensors[name]
+    with open(fname, "rb") as f:
+        f.seek(info.offset)
+        data = np.frombuffer(f.read(info.nbytes), dtype=np.uint8)
+    if info.ttype == GGML_TYPE_F32:
+        return data.view("<f4").reshape(info.shape)
+    if info.ttype == GGML_TYPE_F16:
+        return data.view("<f2").reshape(info.shape)
+    return data.reshape(info.shape[:-1] + (-1,))
+
+
+class GGMLModelReader:
+    """
+    Memory-mapped reader for ggml model files.
+
+    The header, mel filters, vocab and tensor table are parsed once when the
+    reader is created. Tensor data is not read: tensor() returns a read-only
+    view into the mapping, which the OS pages in on access, and load()
+    materializes a single tensor as a regular array.
+
+    With a fresh sidecar index the tensor table is taken from the index and
+    the vocab is only parsed when first accessed.
+    """
+
+    def __init__(self, fname, use_index=True):
+        self.fname = fname
+        self._mm = np.memmap(fname, dtype=np.uint8, mode="r")
+        self._vocab = None
+
+        magic, *values = struct.unpack_from("<12i", self._mm, 0)
+        if magic != GGML_FILE_MAGIC:
+            raise ValueError(f"{fname}: invalid ggml magic {magic:#x}")
+        self.hparams = dict(zip(HPARAMS, values))
+        offset = 48
+
+        n_mel, n_fft = struct.unpack_from("<ii", self._mm, offset)
+        offset += 8
+        self.filters = self._view(offset, n_mel * n_fft * 4, np.dtype("<f4"), (n_mel, n_fft))
+        offset += n_mel * n_fft * 4
+
+        self._vocab_offset = offset
+
+        self.tensors = load_index(fname) if use_index else None
+        if self.tensors is not None:
+            return
+
+        offset = self._parse_vocab()
+        self.tensors = OrderedDict()
+        size = len(self._mm)
+        while offset + 12 <= size:
+            n_dims, name_length, ttype = struct.unpack_from("<iii", self._mm, offset)
+            offset += 12
+            dims = struct.unpack_from(f"<{n_dims}i", self._mm, offset)
+            offset += 4 * n_dims
+            name = bytes(self._mm[offset:offset + name_length]).decode("utf-8")
+            offset += name_length
+            shape = tuple(reversed(dims))
+            nbytes = tensor_nbytes(ttype, shape)
+            self.tensors[name] = TensorInfo(name, ttype, shape, offset, nbytes)
+            offset += nbytes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _parse_vocab(self):
+        offset = self._vocab_offset
+        n_vocab, = struct.unpack_from("<i", self._mm, offset)
+        offset += 4
+        self._vocab = []
+        for _ in range(n_vocab):
+            length, = struct.unpack_from("<i", self._mm, offset)
+            offset += 4
+            self._vocab.append(bytes(self._mm[offset:offset + length]))
+            offset += length
+        return offset
+
+    @property
+    def vocab(self):
+        if self._vocab is None:
+            self._parse_vocab()
+        return self._vocab
+
+    def __contains__(self, name):
+        return name in self.tensors
+
+    def __iter__(self):
+        return iter(self.tensors)
+
+    def _view(self, offset, nbytes, dtype, shape):
+        return self._mm[offset:offset + nbytes].view(dtype).reshape(shape)
+
+    def tensor(self, name):
+        """
+        Returns a zero-copy view of a tensor.
+
+        f32 and f16 tensors have their natural dtype and shape. Quantized
+        tensors are returned as raw blocks, one uint8 row per tensor row.
+        """
+        info = self.tensors[name]
+        if info.ttype == GGML_TYPE_F32:
+            return self._view(info.offset, info.nbytes, np.dtype("<f4"), info.shape)
+        if info.ttype == GGML_TYPE_F16:
+            return self._view(info.offset, info.nbytes, np.dtype("<f2"), info.shape)
+        return self._view(info.offset, info.nbytes, np.uint8, info.shape[:-1] + (-1,))
+
+    def load(self, name):
+        """
+        Returns a writable in-memory copy of a tensor.
+        """
+        return np.array(self.tensor(name))
+
+    def items(self):
+        for name in self.tensors:
+            yield name, self.tensor(name)
+
+    def close(self):
+        # the mapping itself is released once the last view returned by tensor() is gone
+        self._mm = None
+        self.filters = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect ggml model files and manage their tensor index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser_index = subparsers.add_parser("index", help="(re)build the sidecar tensor index")
+    parser_index.add_argument("models", nargs="+", help="ggml model files")
+    parser_info = subparsers.add_parser("info", help="print the hparams and tensor table")
+    parser_info.add_argument("models", nargs="+", help="ggml model files")
+    args = parser.parse_args()
+
+    for fname in args.models:
+        if args.command == "index":
+            tensors = build_index(fname)
+            print(f"{index_path(fname)}: {len(tensors)} tensors")
+        else:
+            reader = GGMLModelReader(fname)
+            print(f"{fname}:")
+            for key, value in reader.hparams.items():
+                print(f"  {key:15s} = {value}")
+            for t in reader.tensors.values():
+                print(f"  {t.name:48s} {GGML_TYPE_NAMES.get(t.ttype, t.ttype):5s} {str(list(t.shape)):18s} @ {t.offset}")
+            reader.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+import ggml_io
+
+
+HPARAMS = [51864, 1500, 384, 6, 4, 448, 384, 6, 4, 80]
+
+
+def write_model(path, tensors, ftype=1):
+    with ggml_io.GGMLWriter(str(path)) as fout:
+        fout.write_header(HPARAMS, ftype)
+        fout.write_filters(np.arange(80 * 201, dtype=np.float32).reshape(80, 201))
+        fout.write_vocab([b"hello", b"", b"\xff\xfe"])
+        for name, (data, ttype) in tensors.items():
+            fout.write_tensor(name, data, ttype)
+
+
+@pytest.mark.parametrize("use_index", [True, False])
+def test_writer_reader_round_trip(tmp_path, use_index):
+    rng = np.random.RandomState(0)
+    tensors = {
+        "encoder.conv1.bias": (rng.standard_normal((384, 1)).astype(np.float32), ggml_io.GGML_TYPE_F32),
+        "encoder.blocks.0.attn.query.weight": (rng.standard_normal((384, 384)).astype(np.float16), ggml_io.GGML_TYPE_F16),
+        "decoder.token_embedding.weight": (rng.standard_normal((8, 64)).astype(np.float16), ggml_io.GGML_TYPE_F16),
+    }
+    q8 = rng.standard_normal((4, 64)).astype(np.float32)
+    tensors["decoder.blocks.0.mlp.0.weight"] = (ggml_io.quantize(q8, ggml_io.GGML_TYPE_Q8_0), ggml_io.GGML_TYPE_Q8_0)
+    path = tmp_path / "ggml-test.bin"
+    write_model(path, tensors)
+
+    with ggml_io.GGMLModelReader(str(path), use_index=use_index) as reader:
+        assert list(reader.hparams.values()) == HPARAMS + [1]
+        assert np.array_equal(reader.filters, np.arange(80 * 201, dtype=np.float32).reshape(80, 201))
+        assert reader.vocab == [b"hello", b"", b"\xff\xfe"]
+        assert list(reader) == list(tensors)
+        for name, (data, ttype) in tensors.items():
+            assert reader.tensors[name].ttype == ttype
+            assert np.array_equal(reader.load(name), data)
+        # quantized tensors keep their element shape in the table
+        assert reader.tensors["decoder.blocks.0.mlp.0.weight"].shape == (4, 64)
+
+    for name, (data, ttype) in tensors.items():
+        assert np.array_equal(ggml_io.read_tensor(str(path), name), data)
+
+
+def test_stale_index_is_ignored(tmp_path):
+    path = tmp_path / "ggml-test.bin"
+    write_model(path, {"a": (np.ones((2, 2), dtype=np.float32), ggml_io.GGML_TYPE_F32)})
+    assert ggml_io.load_index(str(path)) is not None
+    with open(path, "ab") as f:
+        f.write(b"\0")
+    assert ggml_io.load_index(str(path)) is None
+
+
+def quantizer_input():
+    rng = np.random.RandomState(1234)
+    x = rng.standard_normal((6, 64)).astype(np.float32)
+    x[1] = 0
+    # two values share the largest magnitude, the first one sets the sign of the scale
+    x[2, :32] = np.linspace(-1, 1, 32, dtype=np.float32)
+    x[2, 5] = -1.0
+    # scaled values that land exactly on the rounding boundaries
+    x[3] = np.arange(64, dtype=np.float32) / 8 - 4
+    x[4] *= 1e-6
+    x[5, 32:] = -3.0
+    return x
+
+
+# SHA-256 of quantize_row_<type>_ref() from ggml/src/ggml-quants.c applied to quantizer_input()
+REFERENCE_DIGESTS = {
+    ggml_io.GGML_TYPE_Q4_0: "4f0b35fe143cb2ad1fb6248c5428aba4fcfb2448080637f1bc2b7daff47c21a4",
+    ggml_io.GGML_TYPE_Q5_0: "d5e0e7e9884547b7c77c6f7ab53ce221c6219c961085b5e7e814049ce6479e46",
+    ggml_io.GGML_TYPE_Q5_1: "d50f74046d299bd1409d7904324c32d2cb9639ebaed355756117b6fc40d8f430",
+    ggml_io.GGML_TYPE_Q8_0: "5d21333df805cd65878f5c9d1adb209b8aeb9c0cdd5a82f624c559367dd1ad63",
+}
+
+
+@pytest.mark.parametrize("ttype", sorted(REFERENCE_DIGESTS), ids=lambda t: ggml_io.GGML_TYPE_NAMES[t])
+def test_quantize_matches_ggml_reference(ttype):
+    x = quantizer_input()
+    blocks = ggml_io.quantize(x, ttype)
+    block_elems, block_bytes = ggml_io.GGML_TYPE_SIZES[ttype]
+    assert blocks.dtype == np.uint8
+    assert blocks.shape == (x.shape[0], x.shape[1] // block_elems * block_bytes)
+    assert hashlib.sha256(blocks.tobytes()).hexdigest() == REFERENCE_DIGESTS[ttype]
+
+
+def test_quantize_zero_block():
+    zeros = np.zeros((1, 32), dtype=np.float32)
+    # the scale is 0 and every quant sits at the offset that dequantizes to 0, q4_0 divides
+    # the signed maximum by -8 and stores -0.0 like the C code does
+    assert ggml_io.quantize(zeros, ggml_io.GGML_TYPE_Q4_0).tobytes() == b"\0\x80" + b"\x88" * 16
+    assert ggml_io.quantize(zeros, ggml_io.GGML_TYPE_Q8_0).tobytes() == b"\0" * 34
+
+
+def test_quantize_q8_0_dequantizes_within_half_a_step():
+    # without the 1e-6 row, its scales are below the f16 range
+    x = quantizer_input()[[0, 1, 2, 3, 5]]
+    blocks = ggml_io.quantize(x, ggml_io.GGML_TYPE_Q8_0).reshape(-1, 34)
+    d = blocks[:, :2].copy().view(np.float16).astype(np.float32)
+    qs = blocks[:, 2:].copy().view(np.int8).astype(np.float32)
+    error = np.abs(qs * d - x.reshape(-1, 32))
+    # half a step, plus the rounding of the scale to f16
+    assert np.all(error <= d * 0.5 + np.abs(x.reshape(-1, 32)) * 1e-3)
@@ -0,0 +1,115 @@
+# Compute the SHA1 of all model files in a models directory in parallel
+#
+# Usage: python models/verify.py [models-dir] [-j jobs] [--block-size MiB] [-o manifest.json]
+#
+# This is a parallel version of scripts/sha-all.sh. Every ggml-*.bin file is hashed in its own
+# worker process using mmap-backed reads, and the throughput of each file is reported.
+#
+# The digests are written to a JSON manifest, by default <models-dir>/.integrity.json, with the
+# same layout as the integrity index used by autofinal.py:
+#
+#   { "ggml-base.en.bin": { "size": ..., "mtime_ns": ..., "inode": ..., "sha1": "..." }, ... }
+#
+# so running it on the models directory used by autofinal.py pre-verifies all models and the
+# model menu does not have to hash anything.
+#
+
+import os
+import sys
+import json
+import mmap
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+MIN_BLOCK_MIB = 8
+MAX_BLOCK_MIB = 64
+
+
+def hash_file(path, block_size):
+    st = os.stat(path)
+    sha1 = hashlib.sha1()
+    t_start = time.perf_counter()
+    if st.st_size > 0:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mm)
+            try:
+                for offset in range(0, st.st_size, block_size):
+                    sha1.update(view[offset:offset + block_size])
+            finally:
+                view.release()
+    elapsed = time.perf_counter() - t_start
+    entry = {
+        "size":     st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "inode":    st.st_ino,
+        "sha1":     sha1.hexdigest(),
+    }
+    return path, entry, elapsed
+
+
+def load_manifest(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path, manifest):
+    tmp = str(path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hash all ggml model files in parallel and write a JSON manifest")
+    parser.add_argument("models_dir", nargs="?", default=os.path.dirname(os.path.abspath(__file__)),
+                        help="directory containing ggml-*.bin files (default: the directory of this script)")
+    parser.add_argument("-j", "--jobs", type=int, default=min(4, os.cpu_count() or 1),
+                        help="number of files hashed concurrently (default: min(4, cpu count))")
+    parser.add_argument("--block-size", type=int, default=16,
+                        help=f"read block size in MiB, {MIN_BLOCK_MIB}-{MAX_BLOCK_MIB} (default: 16)")
+    parser.add_argument("-o", "--output", default=None,
+                        help="manifest path (default: <models-dir>/.integrity.json)")
+    args = parser.parse_args()
+
+    if not MIN_BLOCK_MIB <= args.block_size <= MAX_BLOCK_MIB:
+        parser.error(f"--block-size must be between {MIN_BLOCK_MIB} and {MAX_BLOCK_MIB} MiB")
+
+    models_dir = Path(args.models_dir)
+    files = sorted(models_dir.glob("ggml-*.bin"), key=lambda p: p.stat().st_size, reverse=True)
+    if not files:
+        print(f"No ggml-*.bin files found in {models_dir}")
+        sys.exit(1)
+
+    manifest_path = Path(args.output) if args.output else models_dir / ".integrity.json"
+    manifest = load_manifest(manifest_path)
+
+    block_size = args.block_size * 1024 * 1024
+    total_bytes = 0
+    t_start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = [executor.submit(hash_file, str(f), block_size) for f in files]
+        for future in as_completed(futures):
+            path, entry, elapsed = future.result()
+            total_bytes += entry["size"]
+            manifest[os.path.basename(path)] = entry
+            mbps = entry["size"] / (1024 * 1024) / elapsed if elapsed > 0 else float("inf")
+            print(f"{entry['sha1']}  {path}  ({entry['size'] / (1024 * 1024):.1f} MiB, {mbps:.1f} MiB/s)")
+    elapsed = time.perf_counter() - t_start
+
+    save_manifest(manifest_path, manifest)
+
+    print(f"\nHashed {len(files)} files, {total_bytes / (1024 * 1024):.1f} MiB in {elapsed:.2f} s "
+          f"({total_bytes / (1024 * 1024) / max(elapsed, 1e-9):.1f} MiB/s aggregate)")
+    print(f"Manifest: {manifest_path}")
+
+
+if __name__ == "__main__":
+    main()
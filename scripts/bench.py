@@ -1,10 +1,17 @@
 import os
+import sys
 import subprocess
 import re
 import csv
+import json
+import time
 import wave
+import statistics
 import contextlib
 import argparse
+import math
+import socket
+import datetime
 
 
 # Custom action to handle comma-separated list
@@ -13,44 +20,6 @@ class ListAction(argparse.Action):
         setattr(namespace, self.dest, [int(val) for val in values.split(",")])
 
 
-parser = argparse.ArgumentParser(description="Benchmark the speech recognition model")
-
-# Define the argument to accept a list
-parser.add_argument(
-    "-t",
-    "--threads",
-    dest="threads",
-    action=ListAction,
-    default=[4],
-    help="List of thread counts to benchmark (comma-separated, default: 4)",
-)
-
-parser.add_argument(
-    "-p",
-    "--processors",
-    dest="processors",
-    action=ListAction,
-    default=[1],
-    help="List of processor counts to benchmark (comma-separated, default: 1)",
-)
-
-
-parser.add_argument(
-    "-f",
-    "--filename",
-    type=str,
-    default="./samples/jfk.wav",
-    help="Relative path of the file to transcribe (default: ./samples/jfk.wav)",
-)
-
-# Parse the command line arguments
-args = parser.parse_args()
-
-sample_file = args.filename
-
-threads = args.threads
-processors = args.processors
-
 # Define the models, threads, and processor counts to benchmark
 models = [
     "ggml-tiny.en.bin",
@@ -67,11 +36,15 @@ models = [
     "ggml-large-v3-turbo.bin",
 ]
 
+whisper_cli = "./build/bin/whisper-cli"
 
-metal_device = ""
+# the binary autofinal.py runs, tune measures it when it is installed
+autofinal_whisper = os.path.join(os.getenv("PREFIX", "/usr"), "bin", "whisper")
 
-# Initialize a dictionary to hold the results
-results = {}
+# per-host tuning profile read by autofinal.py and examples/python/whisper_processor.py
+# layout: {"host": ..., "cpu_count": ..., "models": {"base.en": {"threads": 8, "processors": 1, "binary": {...}, ...}}}
+# "binary" identifies the measured executable, autofinal.py ignores entries measured with another one
+tune_profile_env = "WHISPER_TUNE_PROFILE"
 
 gitHashHeader = "Commit"
 modelHeader = "Model"
@@ -87,6 +60,15 @@ sampleTimePerRunHeader = "Sample Time per Run (ms)"
 encodeTimePerRunHeader = "Encode Time per Run (ms)"
 decodeTimePerRunHeader = "Decode Time per Run (ms)"
 totalTimeHeader = "Total Time (ms)"
+repetitionsHeader = "Repetitions"
+totalTimeP95Header = "Total Time p95 (ms)"
+totalTimeStddevHeader = "Total Time Stddev (ms)"
+realTimeFactorHeader = "Real-Time Factor"
+peakRssHeader = "Peak RSS (MiB)"
+
+# stages reported by whisper_print_timings, the ones with a run count also get a per-run metric
+timing_stages = ["load", "mel", "sample", "encode", "decode", "batchd", "prompt", "total"]
+per_run_stages = ["sample", "encode", "decode", "batchd", "prompt"]
 
 
 def check_file_exists(file: str) -> bool:
@@ -100,11 +82,11 @@ def get_git_short_hash() -> str:
             .decode()
             .strip()
         )
-    except subprocess.CalledProcessError as e:
+    except (subprocess.CalledProcessError, OSError) as e:
         return ""
 
 
-def wav_file_length(file: str = sample_file) -> float:
+def wav_file_length(file: str) -> float:
     with contextlib.closing(wave.open(file, "r")) as f:
         frames = f.getnframes()
         rate = f.getframerate()
@@ -125,101 +107,613 @@ def extract_device(output: str) -> str:
     return device
 
 
-# Check if the sample file exists
-if not check_file_exists(sample_file):
-    raise FileNotFoundError(f"Sample file {sample_file} not found")
-
-recording_length = wav_file_length()
-
-
-# Check that all models exist
-# Filter out models from list that are not downloaded
-filtered_models = []
-for model in models:
-    if check_file_exists(f"models/{model}"):
-        filtered_models.append(model)
+def parse_timings(output: str) -> dict[str, float]:
+    # stage times in ms, plus "<stage>_per_run" for the stages that report a run count
+    timings = {}
+    for stage in timing_stages:
+        match = re.search(rf"{stage} time\s*=\s*(\d+\.\d+)\s*ms", output)
+        if match:
+            timings[stage] = float(match.group(1))
+    for stage in per_run_stages:
+        time, runs = extract_metrics(output, f"{stage} time")
+        if time is not None and runs:
+            timings[f"{stage}_per_run"] = time / runs
+    return timings
+
+
+def run_once(cmd: list[str]) -> tuple[str, float, float]:
+    """Run one whisper-cli invocation, returns its output, wall time in ms and peak RSS in MiB"""
+    t_start = time.perf_counter()
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.stdout.read().decode(errors="replace")
+    process.stdout.close()
+
+    peak_rss = None
+    if hasattr(os, "wait4"):
+        # wait4 gives the rusage of this child alone, RUSAGE_CHILDREN would be the max over all runs
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is in bytes on macOS and in KiB elsewhere
+        peak_rss = rusage.ru_maxrss / (1024 * 1024) if sys.platform == "darwin" else rusage.ru_maxrss / 1024
     else:
-        print(f"Model {model} not found, removing from list")
-
-models = filtered_models
-
-# Loop over each combination of parameters
-for model in filtered_models:
-    for thread in threads:
-        for processor_count in processors:
-            # Construct the command to run
-            cmd = f"./build/bin/whisper-cli -m models/{model} -t {thread} -p {processor_count} -f {sample_file}"
-            # Run the command and get the output
-            process = subprocess.Popen(
-                cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        process.wait()
+    wall_ms = (time.perf_counter() - t_start) * 1000
+
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(cmd)} failed with exit code {process.returncode}:\n{output[-2000:]}")
+    return output, wall_ms, peak_rss
+
+
+def percentile(samples: list[float], q: float) -> float:
+    # linear interpolation between the closest ranks
+    ordered = sorted(samples)
+    pos = (len(ordered) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    return {
+        "median": statistics.median(samples),
+        "p95": percentile(samples, 95),
+        "stddev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "mean": statistics.fmean(samples),
+        "min": min(samples),
+        "max": max(samples),
+    }
+
+
+def benchmark(model: str, thread: int, processor_count: int, sample_file: str,
+              recording_length: float, warmup: int, repetitions: int, binary: str = whisper_cli) -> dict:
+    """Benchmark one (model, threads, processors) configuration, the warmup runs are discarded"""
+    cmd = [binary, "-m", f"models/{model}", "-t", str(thread), "-p", str(processor_count), "-f", sample_file]
+
+    for _ in range(warmup):
+        run_once(cmd)
+
+    samples = {}
+    peak_rss = []
+    device = "Not found"
+    for _ in range(repetitions):
+        output, wall_ms, rss = run_once(cmd)
+        device = extract_device(output)
+        timings = parse_timings(output)
+        timings["wall"] = wall_ms
+        for key, value in timings.items():
+            samples.setdefault(key, []).append(value)
+        if rss is not None:
+            peak_rss.append(rss)
+
+    stats = {key: summarize(values) for key, values in samples.items()}
+    total = stats.get("total", stats["wall"])["median"]
+    return {
+        "model": model.replace("ggml-", "").replace(".bin", ""),
+        "threads": thread,
+        "processors": processor_count,
+        "hardware": device,
+        "samples": samples,
+        "stats": stats,
+        "rtf": total / (recording_length * 1000),
+        "peak_rss_mib": max(peak_rss) if peak_rss else None,
+    }
+
+
+def write_csv(path: str, results: list[dict], short_hash: str, recording_length: float):
+    with open(path, "w", newline="") as csvfile:
+        fieldnames = [
+            gitHashHeader,
+            modelHeader,
+            hardwareHeader,
+            recordingLengthHeader,
+            threadHeader,
+            processorCountHeader,
+            loadTimeHeader,
+            sampleTimeHeader,
+            encodeTimeHeader,
+            decodeTimeHeader,
+            sampleTimePerRunHeader,
+            encodeTimePerRunHeader,
+            decodeTimePerRunHeader,
+            totalTimeHeader,
+            repetitionsHeader,
+            totalTimeP95Header,
+            totalTimeStddevHeader,
+            realTimeFactorHeader,
+            peakRssHeader,
+        ]
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+
+        writer.writeheader()
+
+        def median(result, key):
+            stat = result["stats"].get(key)
+            return round(stat["median"], 2) if stat else None
+
+        # the time columns hold the median over the repetitions
+        for result in results:
+            total = result["stats"].get("total", {})
+            writer.writerow({
+                gitHashHeader: short_hash,
+                modelHeader: result["model"],
+                hardwareHeader: result["hardware"],
+                recordingLengthHeader: recording_length,
+                threadHeader: result["threads"],
+                processorCountHeader: result["processors"],
+                loadTimeHeader: median(result, "load"),
+                sampleTimeHeader: median(result, "sample"),
+                encodeTimeHeader: median(result, "encode"),
+                decodeTimeHeader: median(result, "decode"),
+                sampleTimePerRunHeader: median(result, "sample_per_run"),
+                encodeTimePerRunHeader: median(result, "encode_per_run"),
+                decodeTimePerRunHeader: median(result, "decode_per_run"),
+                totalTimeHeader: median(result, "total"),
+                repetitionsHeader: len(result["samples"]["wall"]),
+                totalTimeP95Header: round(total["p95"], 2) if total else None,
+                totalTimeStddevHeader: round(total["stddev"], 2) if total else None,
+                realTimeFactorHeader: round(result["rtf"], 4),
+                peakRssHeader: round(result["peak_rss_mib"], 1) if result["peak_rss_mib"] is not None else None,
+            })
+
+
+def write_json(path: str, results: list[dict], short_hash: str, sample_file: str,
+               recording_length: float, warmup: int, repetitions: int):
+    report = {
+        "commit": short_hash,
+        "sample_file": sample_file,
+        "recording_length": recording_length,
+        "warmup": warmup,
+        "repetitions": repetitions,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=1)
+
+
+def mann_whitney_u(x: list[float], y: list[float]) -> tuple[float, float]:
+    """
+    One-sided Mann-Whitney U test of y being stochastically greater than x.
+    Returns the U statistic of y and the p-value, exact for small samples without ties,
+    normal approximation with tie correction otherwise.
+    """
+    n1, n2 = len(x), len(y)
+    combined = sorted([(v, 0) for v in x] + [(v, 1) for v in y])
+
+    # average ranks for ties
+    ranks = [0.0] * len(combined)
+    tie_term = 0.0
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        t = j - i + 1
+        tie_term += t ** 3 - t
+        i = j + 1
+
+    rank_sum_y = sum(r for r, (_, group) in zip(ranks, combined) if group == 1)
+    u = rank_sum_y - n2 * (n2 + 1) / 2
+
+    if tie_term == 0 and n1 <= 20 and n2 <= 20:
+        # exact distribution of U, counts[u] = number of orderings with that statistic
+        counts = [[[1] if a == 0 or b == 0 else None for b in range(n2 + 1)] for a in range(n1 + 1)]
+        for a in range(1, n1 + 1):
+            for b in range(1, n2 + 1):
+                # the largest value is either from x (adds nothing) or from y (adds a to U)
+                without_x = counts[a - 1][b]
+                without_y = counts[a][b - 1]
+                dist = [0] * (a * b + 1)
+                for k, c in enumerate(without_x):
+                    dist[k] += c
+                for k, c in enumerate(without_y):
+                    dist[k + a] += c
+                counts[a][b] = dist
+        dist = counts[n1][n2]
+        return u, sum(dist[math.ceil(u):]) / math.comb(n1 + n2, n1)
+
+    n = n1 + n2
+    mean = n1 * n2 / 2
+    var = n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1)))
+    if var <= 0:
+        return u, 1.0
+    # continuity correction
+    z = (u - mean - 0.5) / math.sqrt(var)
+    return u, 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def load_report(path: str) -> tuple[dict, dict]:
+    with open(path, "r") as f:
+        report = json.load(f)
+    rows = {}
+    for result in report.get("results", []):
+        rows[(result["model"], result["threads"], result["processors"], result["hardware"])] = result
+    return report, rows
+
+
+def compare(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="bench.py compare",
+        description="Compare two JSON benchmark reports and fail on statistically significant regressions",
+    )
+    parser.add_argument("baseline", type=str, help="JSON report of the baseline build")
+    parser.add_argument("current", type=str, help="JSON report of the build under test")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=5.0,
+        help="Minimum slowdown of the median, in percent, reported as a regression (default: 5)",
+    )
+    parser.add_argument(
+        "--alpha",
+        type=float,
+        default=0.05,
+        help="Significance level of the one-sided Mann-Whitney U test (default: 0.05)",
+    )
+    parser.add_argument(
+        "--min-delta",
+        type=float,
+        default=1.0,
+        help="Ignore slowdowns of the median smaller than this many ms (default: 1)",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        default="load,encode,decode",
+        help="Comma-separated stages to compare (default: load,encode,decode)",
+    )
+    args = parser.parse_args(argv)
+
+    metrics = [m.strip() for m in args.metrics.split(",") if m.strip()]
+    baseline, baseline_rows = load_report(args.baseline)
+    current, current_rows = load_report(args.current)
+
+    print(f"Baseline {baseline.get('commit') or args.baseline} vs current {current.get('commit') or args.current}")
+
+    for key in sorted(baseline_rows.keys() - current_rows.keys()):
+        print(f"Missing in current: model={key[0]} threads={key[1]} processors={key[2]} hardware={key[3]}")
+    for key in sorted(current_rows.keys() - baseline_rows.keys()):
+        print(f"New in current: model={key[0]} threads={key[1]} processors={key[2]} hardware={key[3]}")
+
+    regressions = 0
+    underpowered = set()
+    for key in sorted(baseline_rows.keys() & current_rows.keys()):
+        for metric in metrics:
+            x = baseline_rows[key]["samples"].get(metric)
+            y = current_rows[key]["samples"].get(metric)
+            if not x or not y:
+                continue
+
+            base_median = statistics.median(x)
+            cur_median = statistics.median(y)
+            delta = cur_median - base_median
+            change = delta / base_median * 100 if base_median > 0 else (math.inf if delta > 0 else 0.0)
+            _, p = mann_whitney_u(x, y)
+            if 1 / math.comb(len(x) + len(y), len(x)) >= args.alpha and (len(x), len(y)) not in underpowered:
+                underpowered.add((len(x), len(y)))
+                print(f"Warning: {len(x)} and {len(y)} repetitions cannot reach alpha={args.alpha}, use more repetitions")
+
+            regressed = change > args.threshold and delta >= args.min_delta and p < args.alpha
+            regressions += regressed
+            print(
+                f"{'REGRESSION' if regressed else 'ok':<10} model={key[0]} threads={key[1]} processors={key[2]} "
+                f"{metric:<7} {base_median:10.2f} -> {cur_median:10.2f} ms ({change:+.1f}%, p={p:.4f})"
             )
 
-            output = ""
-            while process.poll() is None:
-                output += process.stdout.read().decode()
+    if regressions:
+        print(f"\n{regressions} regression(s) above {args.threshold}% at alpha={args.alpha}")
+        return 1
 
-            # Parse the output
-            load_time_match = re.search(r"load time\s*=\s*(\d+\.\d+)\s*ms", output)
-            load_time = float(load_time_match.group(1)) if load_time_match else None
+    print("\nNo regressions")
+    return 0
 
-            metal_device = extract_device(output)
-            sample_time, sample_runs = extract_metrics(output, "sample time")
-            encode_time, encode_runs = extract_metrics(output, "encode time")
-            decode_time, decode_runs = extract_metrics(output, "decode time")
 
-            total_time_match = re.search(r"total time\s*=\s*(\d+\.\d+)\s*ms", output)
-            total_time = float(total_time_match.group(1)) if total_time_match else None
+def default_profile_path() -> str:
+    return os.getenv(tune_profile_env) or os.path.join(
+        os.path.expanduser("~/.whisper"), f"tune-{socket.gethostname()}.json"
+    )
 
-            model_name = model.replace("ggml-", "").replace(".bin", "")
 
+def load_profile(path: str) -> dict:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_profile(path: str, profile: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(profile, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def binary_identity(path: str) -> dict:
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def powers_of_two(limit: int) -> list[int]:
+    values = []
+    value = 1
+    while value <= limit:
+        values.append(value)
+        value *= 2
+    if values[-1] != limit:
+        values.append(limit)
+    return values
+
+
+def tune_model(model: str, sample_file: str, recording_length: float, cores: int,
+               warmup: int, repetitions: int, binary: str = whisper_cli) -> dict:
+    """
+    Searches the (threads, processors) space of one model, keeping threads * processors <= cores.
+    A coarse sweep over powers of two is refined by bisecting the thread count around the fastest
+    configuration until no untested neighbour is left.
+    """
+    measured = {}
+
+    def measure(thread, processor_count):
+        if (thread, processor_count) not in measured:
+            result = benchmark(model, thread, processor_count, sample_file, recording_length, warmup, repetitions, binary)
+            measured[(thread, processor_count)] = result
+            total = result["stats"].get("total", result["stats"]["wall"])
             print(
-                f"Ran model={model_name} threads={thread} processor_count={processor_count}, took {total_time}ms"
+                f"  threads={thread} processors={processor_count}: "
+                f"median={total['median']:.2f}ms stddev={total['stddev']:.2f}ms rtf={result['rtf']:.4f}"
             )
-            # Store the times in the results dictionary
-            results[(model_name, thread, processor_count)] = {
-                loadTimeHeader: load_time,
-                sampleTimeHeader: sample_time,
-                encodeTimeHeader: encode_time,
-                decodeTimeHeader: decode_time,
-                sampleTimePerRunHeader: round(sample_time / sample_runs, 2),
-                encodeTimePerRunHeader: round(encode_time / encode_runs, 2),
-                decodeTimePerRunHeader: round(decode_time / decode_runs, 2),
-                totalTimeHeader: total_time,
-            }
-
-# Write the results to a CSV file
-with open("benchmark_results.csv", "w", newline="") as csvfile:
-    fieldnames = [
-        gitHashHeader,
-        modelHeader,
-        hardwareHeader,
-        recordingLengthHeader,
-        threadHeader,
-        processorCountHeader,
-        loadTimeHeader,
-        sampleTimeHeader,
-        encodeTimeHeader,
-        decodeTimeHeader,
-        sampleTimePerRunHeader,
-        encodeTimePerRunHeader,
-        decodeTimePerRunHeader,
-        totalTimeHeader,
-    ]
-    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-    writer.writeheader()
-
-    shortHash = get_git_short_hash()
-    # Sort the results by total time in ascending order
-    sorted_results = sorted(results.items(), key=lambda x: x[1].get(totalTimeHeader, 0))
-    for params, times in sorted_results:
-        row = {
-            gitHashHeader: shortHash,
-            modelHeader: params[0],
-            hardwareHeader: metal_device,
-            recordingLengthHeader: recording_length,
-            threadHeader: params[1],
-            processorCountHeader: params[2],
-        }
-        row.update(times)
-        writer.writerow(row)
+        return measured[(thread, processor_count)]
+
+    def score(key):
+        stats = measured[key]["stats"]
+        return stats.get("total", stats["wall"])["median"]
+
+    for processor_count in powers_of_two(cores):
+        for thread in powers_of_two(cores // processor_count):
+            measure(thread, processor_count)
+
+    while True:
+        best = min(measured, key=score)
+        thread, processor_count = best
+        tested = sorted(t for t, p in measured if p == processor_count)
+        lower = [t for t in tested if t < thread]
+        upper = [t for t in tested if t > thread]
+        candidates = []
+        if lower and (lower[-1] + thread) // 2 not in tested:
+            candidates.append((lower[-1] + thread) // 2)
+        if upper and (upper[0] + thread) // 2 not in tested:
+            candidates.append((upper[0] + thread) // 2)
+        if not candidates:
+            break
+        for candidate in candidates:
+            measure(candidate, processor_count)
+
+    best = min(measured, key=score)
+    result = measured[best]
+    return {
+        "threads": best[0],
+        "processors": best[1],
+        "total_ms": round(score(best), 2),
+        "rtf": round(result["rtf"], 4),
+        "configurations": len(measured),
+        "repetitions": repetitions,
+        "sample_file": sample_file,
+        "binary": binary_identity(binary),
+        "commit": get_git_short_hash(),
+        "updated": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def tune(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="bench.py tune",
+        description="Find the fastest thread and processor counts per model and store them in the host profile",
+    )
+    parser.add_argument(
+        "-m",
+        "--models",
+        type=str,
+        default=None,
+        help="Comma-separated model names to tune, e.g. base.en,small (default: all downloaded models)",
+    )
+    parser.add_argument(
+        "-f",
+        "--filename",
+        type=str,
+        default="./samples/jfk.wav",
+        help="Relative path of the file to transcribe (default: ./samples/jfk.wav)",
+    )
+    parser.add_argument(
+        "-w",
+        "--warmup",
+        type=int,
+        default=1,
+        help="Number of discarded warmup runs per configuration (default: 1)",
+    )
+    parser.add_argument(
+        "-r",
+        "--repetitions",
+        type=int,
+        default=3,
+        help="Number of measured runs per configuration (default: 3)",
+    )
+    parser.add_argument(
+        "--max-threads",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Upper bound of threads * processors (default: cpu count)",
+    )
+    parser.add_argument(
+        "-b",
+        "--binary",
+        type=str,
+        default=autofinal_whisper if check_file_exists(autofinal_whisper) else whisper_cli,
+        help=f"whisper executable to measure (default: {autofinal_whisper} as used by autofinal.py if installed, "
+        f"otherwise {whisper_cli})",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=default_profile_path(),
+        help=f"Profile path (default: ${tune_profile_env} or ~/.whisper/tune-<hostname>.json)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.repetitions < 1 or args.warmup < 0 or args.max_threads < 1:
+        parser.error("--repetitions and --max-threads must be at least 1 and --warmup cannot be negative")
+
+    if not check_file_exists(args.filename):
+        raise FileNotFoundError(f"Sample file {args.filename} not found")
+    if not check_file_exists(args.binary):
+        raise FileNotFoundError(f"whisper executable {args.binary} not found")
+    recording_length = wav_file_length(args.filename)
+
+    if args.models:
+        candidates = [f"ggml-{name.strip()}.bin" for name in args.models.split(",") if name.strip()]
+    else:
+        candidates = models
+    selected = [model for model in candidates if check_file_exists(f"models/{model}")]
+    if not selected:
+        print("No models to tune, download one with models/download-ggml-model.sh")
+        return 1
+
+    profile = load_profile(args.profile)
+    profile["host"] = socket.gethostname()
+    profile["cpu_count"] = os.cpu_count()
+    profile.setdefault("models", {})
+
+    for model in selected:
+        name = model.replace("ggml-", "").replace(".bin", "")
+        print(f"Tuning model={name} with {args.binary} on {args.max_threads} threads")
+        entry = tune_model(model, args.filename, recording_length, args.max_threads, args.warmup, args.repetitions,
+                           args.binary)
+        profile["models"][name] = entry
+        print(f"Best for {name}: threads={entry['threads']} processors={entry['processors']} "
+              f"({entry['total_ms']}ms, rtf={entry['rtf']}, {entry['configurations']} configurations)")
+        # save after every model so an interrupted run keeps its results
+        save_profile(args.profile, profile)
+
+    print(f"Profile: {args.profile}")
+    return 0
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        sys.exit(compare(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "tune":
+        sys.exit(tune(sys.argv[2:]))
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the speech recognition model",
+        epilog="Run 'bench.py compare BASELINE.json CURRENT.json' to check a run for regressions, "
+        "'bench.py tune' to store the fastest settings of this host",
+    )
+
+    # Define the argument to accept a list
+    parser.add_argument(
+        "-t",
+        "--threads",
+        dest="threads",
+        action=ListAction,
+        default=[4],
+        help="List of thread counts to benchmark (comma-separated, default: 4)",
+    )
+
+    parser.add_argument(
+        "-p",
+        "--processors",
+        dest="processors",
+        action=ListAction,
+        default=[1],
+        help="List of processor counts to benchmark (comma-separated, default: 1)",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--filename",
+        type=str,
+        default="./samples/jfk.wav",
+        help="Relative path of the file to transcribe (default: ./samples/jfk.wav)",
+    )
+
+    parser.add_argument(
+        "-w",
+        "--warmup",
+        type=int,
+        default=1,
+        help="Number of discarded warmup runs per configuration (default: 1)",
+    )
+
+    parser.add_argument(
+        "-r",
+        "--repetitions",
+        type=int,
+        default=5,
+        help="Number of measured runs per configuration (default: 5)",
+    )
+
+    parser.add_argument(
+        "--csv",
+        type=str,
+        default="benchmark_results.csv",
+        help="Path of the CSV report (default: benchmark_results.csv)",
+    )
+
+    parser.add_argument(
+        "--json",
+        type=str,
+        default="benchmark_results.json",
+        help="Path of the JSON report with all samples (default: benchmark_results.json)",
+    )
+
+    # Parse the command line arguments
+    args = parser.parse_args()
+
+    if args.repetitions < 1 or args.warmup < 0:
+        parser.error("--repetitions must be at least 1 and --warmup cannot be negative")
+
+    sample_file = args.filename
+
+    # Check if the sample file exists
+    if not check_file_exists(sample_file):
+        raise FileNotFoundError(f"Sample file {sample_file} not found")
+
+    recording_length = wav_file_length(sample_file)
+
+    # Check that all models exist
+    # Filter out models from list that are not downloaded
+    filtered_models = []
+    for model in models:
+        if check_file_exists(f"models/{model}"):
+            filtered_models.append(model)
+        else:
+            print(f"Model {model} not found, removing from list")
+
+    # Loop over each combination of parameters
+    results = []
+    for model in filtered_models:
+        for thread in args.threads:
+            for processor_count in args.processors:
+                result = benchmark(model, thread, processor_count, sample_file,
+                                   recording_length, args.warmup, args.repetitions)
+                total = result["stats"].get("total", result["stats"]["wall"])
+                print(
+                    f"Ran model={result['model']} threads={thread} processor_count={processor_count}, "
+                    f"total median={total['median']:.2f}ms p95={total['p95']:.2f}ms stddev={total['stddev']:.2f}ms "
+                    f"rtf={result['rtf']:.4f} over {args.repetitions} runs"
+                )
+                results.append(result)
+
+    # Sort the results by median total time in ascending order
+    results.sort(key=lambda r: r["stats"].get("total", r["stats"]["wall"])["median"])
+
+    short_hash = get_git_short_hash()
+    write_csv(args.csv, results, short_hash, recording_length)
+    write_json(args.json, results, short_hash, sample_file, recording_length, args.warmup, args.repetitions)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 #!/bin/bash
 
 # Compute the SHA1 of all model files in ./models/ggml-*.bin
+# See models/verify.py for a parallel version that also writes a JSON manifest
 
 for f in ./models/ggml-*.bin; do
     shasum "$f" -a 1
@@ -0,0 +1,63 @@
+import itertools
+import math
+
+import pytest
+
+import bench
+
+
+def pair_count_u(x, y):
+    # U of y counts the pairs where the y value is larger, ties count half
+    return sum(1.0 if b > a else 0.5 if b == a else 0.0 for a in x for b in y)
+
+
+def permutation_p(x, y):
+    # share of all splits of the pooled samples whose U is at least the observed one
+    pooled = x + y
+    observed = pair_count_u(x, y)
+    splits = list(itertools.combinations(range(len(pooled)), len(y)))
+    extreme = 0
+    for chosen in splits:
+        ys = [pooled[i] for i in chosen]
+        xs = [pooled[i] for i in range(len(pooled)) if i not in chosen]
+        extreme += pair_count_u(xs, ys) >= observed
+    return extreme / len(splits)
+
+
+@pytest.mark.parametrize("x, y", [
+    ([1, 2, 3], [4, 5, 6]),
+    ([4, 5, 6], [1, 2, 3]),
+    ([1, 3, 5, 7], [2, 4, 6, 8]),
+    ([10.5, 11.2, 9.8, 10.1, 10.9], [11.0, 11.7, 12.3, 10.7, 11.9, 12.0]),
+])
+def test_mann_whitney_u_exact_without_ties(x, y):
+    u, p = bench.mann_whitney_u(x, y)
+    assert u == pair_count_u(x, y)
+    assert p == pytest.approx(permutation_p(x, y))
+
+
+def test_mann_whitney_u_fully_separated_samples():
+    u, p = bench.mann_whitney_u([1, 2, 3, 4, 5], [6, 7, 8, 9, 10])
+    assert u == 25
+    assert p == pytest.approx(1 / math.comb(10, 5))
+
+
+def test_mann_whitney_u_ties_use_the_normal_approximation():
+    x = [1, 2, 2, 3, 3, 3]
+    y = [2, 3, 3, 4, 4, 5]
+    u, p = bench.mann_whitney_u(x, y)
+    assert u == pair_count_u(x, y)
+    # close to the permutation p-value, which the approximation with tie correction tracks
+    assert p == pytest.approx(permutation_p(x, y), abs=0.02)
+
+
+def test_mann_whitney_u_large_samples():
+    x = [float(v) for v in range(25)]
+    assert bench.mann_whitney_u(x, [v + 12 for v in x])[1] < 0.001
+    assert bench.mann_whitney_u(x, [v - 12 for v in x])[1] > 0.999
+    assert bench.mann_whitney_u(x, [v + 0.5 for v in x])[1] == pytest.approx(0.5, abs=0.1)
+
+
+def test_mann_whitney_u_identical_constant_samples():
+    # no variance at all, nothing can be concluded
+    assert bench.mann_whitney_u([5.0] * 4, [5.0] * 4) == (8.0, 1.0)
@@ -0,0 +1,158 @@
+import os
+import random
+import sys
+import wave
+from array import array
+
+import autofinal
+
+
+def test_plan_batch_workers_defaults_to_four_threads_per_job():
+    assert autofinal.plan_batch_workers(16) == (4, 4)
+    assert autofinal.plan_batch_workers(6) == (4, 1)
+    assert autofinal.plan_batch_workers(2) == (2, 1)
+
+
+def test_plan_batch_workers_fills_in_the_missing_value():
+    assert autofinal.plan_batch_workers(16, threads=8) == (8, 2)
+    assert autofinal.plan_batch_workers(16, jobs=8) == (2, 8)
+    assert autofinal.plan_batch_workers(4, threads=8) == (8, 1)
+    assert autofinal.plan_batch_workers(4, jobs=8) == (1, 8)
+
+
+def test_plan_batch_workers_caps_jobs_to_the_cores():
+    assert autofinal.plan_batch_workers(8, threads=4, jobs=4) == (4, 2)
+    assert autofinal.plan_batch_workers(8, threads=16, jobs=2) == (16, 1)
+    assert autofinal.plan_batch_workers(8, threads=2, jobs=2) == (2, 2)
+
+
+def test_batch_output_bases_keeps_extensions_only_on_collisions(tmp_path):
+    paths = [str(tmp_path / name) for name in ("talk.mp4", "talk.wav", "intro.mp3")]
+    outputs = autofinal.batch_output_bases(paths)
+    assert outputs[paths[0]] == os.path.join(str(tmp_path), "talk.mp4")
+    assert outputs[paths[1]] == os.path.join(str(tmp_path), "talk.wav")
+    assert outputs[paths[2]] == os.path.join(str(tmp_path), "intro")
+
+
+# as printed by whisper_print_timings() in src/whisper.cpp
+TIMINGS_OUTPUT = """\
+whisper_print_timings:     load time =    87.60 ms
+whisper_print_timings:     fallbacks =   0 p /   0 h
+whisper_print_timings:      mel time =    10.34 ms
+whisper_print_timings:   sample time =    35.51 ms /   131 runs (    0.27 ms per run)
+whisper_print_timings:   encode time =   574.11 ms /     1 runs (  574.11 ms per run)
+whisper_print_timings:   decode time =     0.00 ms /     1 runs (    0.00 ms per run)
+whisper_print_timings:   batchd time =   141.37 ms /   129 runs (    1.10 ms per run)
+whisper_print_timings:   prompt time =     0.00 ms /     1 runs (    0.00 ms per run)
+whisper_print_timings:    total time =   862.29 ms
+"""
+
+
+def test_parse_whisper_timings():
+    stages = autofinal.parse_whisper_timings(["[00:00:00.000 --> 00:00:02.000]  load time = 5 ms"]
+                                             + TIMINGS_OUTPUT.splitlines())
+    assert stages == {
+        "load": {"ms": 87.60},
+        "mel": {"ms": 10.34},
+        "sample": {"ms": 35.51, "runs": 131},
+        "encode": {"ms": 574.11, "runs": 1},
+        "decode": {"ms": 0.0, "runs": 1},
+        "batchd": {"ms": 141.37, "runs": 129},
+        "prompt": {"ms": 0.0, "runs": 1},
+        "total": {"ms": 862.29},
+    }
+
+
+def write_noise_wav(path, seconds, silences, rate=16000):
+    samples = array("h", (random.Random(0).randint(-8000, 8000) for _ in range(int(seconds * rate))))
+    for start, end in silences:
+        for i in range(int(start * rate), int(end * rate)):
+            samples[i] = 0
+    if sys.byteorder == "big":
+        samples.byteswap()
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(samples.tobytes())
+
+
+def test_find_split_points_picks_the_quiet_frames(tmp_path):
+    path = tmp_path / "speech.wav"
+    write_noise_wav(path, 9.0, [(2.8, 2.9), (6.2, 6.3)])
+    splits, rate = autofinal.find_split_points(str(path), 3.0, search=2.0)
+    assert rate == 16000
+    assert len(splits) == 4
+    assert splits[0] == 0 and splits[-1] == 144000
+    assert 2.8 * rate <= splits[1] < 2.9 * rate
+    assert 6.2 * rate <= splits[2] < 6.3 * rate
+
+
+def test_find_split_points_short_file_is_one_chunk(tmp_path):
+    path = tmp_path / "short.wav"
+    write_noise_wav(path, 1.0, [])
+    assert autofinal.find_split_points(str(path), 3.0) == ([0, 16000], 16000)
+
+
+def write_chunk_srt(tmp_path, index, segments):
+    path = str(tmp_path / f"chunk-{index:04d}.srt")
+    autofinal.write_srt(path, segments)
+    return path
+
+
+def test_stitch_chunks_keeps_segments_by_midpoint(tmp_path):
+    rate = 1000
+    # two chunks split at 10 s with 2 s of overlap, chunk times are relative to the chunk start
+    chunks = [
+        {"start": 0, "end": 12000, "own_start": 0, "own_end": 10000, "srt": write_chunk_srt(tmp_path, 0, [
+            (0, 4000, "First sentence."),
+            (4000, 9500, "Second sentence."),
+            (9500, 11800, "Across the seam"),
+        ])},
+        {"start": 8000, "end": 20000, "own_start": 10000, "own_end": 20000, "srt": write_chunk_srt(tmp_path, 1, [
+            (0, 1000, "sentence"),
+            (1200, 3000, "across the seam!"),
+            (3000, 7000, "Third sentence."),
+        ])},
+    ]
+    assert autofinal.stitch_chunks(chunks, rate) == [
+        (0.0, 4000.0, "First sentence."),
+        (4000.0, 9500.0, "Second sentence."),
+        # the midpoint of the seam segment is past 10 s in both chunks, so the second chunk owns it,
+        # and its start is clipped to the end of the previous segment
+        (9500.0, 11000.0, "across the seam!"),
+        (11000.0, 15000.0, "Third sentence."),
+    ]
+
+
+def test_stitch_chunks_merges_text_repeated_across_the_seam(tmp_path):
+    chunks = [
+        {"start": 0, "end": 6000, "own_start": 0, "own_end": 5000, "srt": write_chunk_srt(tmp_path, 0, [
+            (3000, 4900, "Hello there."),
+        ])},
+        {"start": 4000, "end": 10000, "own_start": 5000, "own_end": 10000, "srt": write_chunk_srt(tmp_path, 1, [
+            (1200, 2000, "hello there"),
+            (2000, 4000, "General Kenobi."),
+        ])},
+    ]
+    assert autofinal.stitch_chunks(chunks, 1000) == [
+        (3000.0, 6000.0, "Hello there."),
+        (6000.0, 8000.0, "General Kenobi."),
+    ]
+
+
+def test_new_chunk_plan_removes_old_chunk_files(tmp_path):
+    source = tmp_path / "talk.wav"
+    write_noise_wav(source, 1.0, [])
+    work_dir = str(tmp_path / "talk.chunks")
+    os.makedirs(work_dir)
+    manifest = autofinal.load_chunk_manifest(work_dir, str(source), 600.0, 2.0, "base", "en")
+    (tmp_path / "talk.chunks" / "chunk-0000.srt").write_text("1\n00:00:00,000 --> 00:00:01,000\nold\n\n")
+
+    # same plan, the finished chunk is kept for the resume
+    assert autofinal.load_chunk_manifest(work_dir, str(source), 600.0, 2.0, "base", "en") == manifest
+    assert os.path.exists(os.path.join(work_dir, "chunk-0000.srt"))
+
+    # another model makes a new plan, its transcripts must not be reused
+    autofinal.load_chunk_manifest(work_dir, str(source), 600.0, 2.0, "small", "en")
+    assert sorted(os.listdir(work_dir)) == [autofinal.CHUNK_MANIFEST]